@@ -0,0 +1,142 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - chunked event stream benchmark
+
+Feeds large event batches, encoded as daemon sends them, through
+ChunkedDecoder and through copy of parser used by old EventPollLoop,
+in blocks of the size that each of them reads. Only decoding is timed;
+Parsing of JSON is same for both and takes much longer.
+
+Usage: benchmarks/chunked_events.py [recorded_events.json ...]
+
+Recorded file should contain JSON array of events, as returned by
+/rest/events. Batch of ItemStarted/ItemFinished events is generated
+if no file is given.
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, json, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from syncthing_gtk.chunkeddecoder import ChunkedDecoder
+
+# Same as READ_SIZE in daemon.py, which can't be imported without gi
+READ_SIZE = 256 * 1024
+# Daemon writes entire batch at once, so it's usually sent as one huge
+# chunk. Read from socket returns at most this much data at once.
+SOCKET_BLOCK = 64 * 1024
+ROUNDS = 3
+
+def generate_batch(count):
+	""" Generates event batch similar to one sent during initial sync """
+	events = []
+	for i in range(count):
+		event_type = "ItemStarted" if i % 2 == 0 else "ItemFinished"
+		data = {
+			"folder" : "default",
+			"item" : "some/deeply/nested/directory/file-%08d.dat" % (i // 2,),
+			"type" : "file",
+			"action" : "update",
+		}
+		if event_type == "ItemFinished":
+			data["error"] = None
+		events.append({
+			"id" : i + 1, "globalID" : i + 1, "type" : event_type,
+			"time" : "2016-02-13T21:20:56.574153711+01:00",
+			"data" : data
+		})
+	return json.dumps(events).encode("utf-8")
+
+def encode_chunked(body):
+	return b"".join([
+		("%x\r\n" % (len(body),)).encode("ascii"),
+		body, b"\r\n", b"0\r\n\r\n"
+	])
+
+class Socket(object):
+	""" Returns data in blocks, as read from real socket would """
+	def __init__(self, data):
+		self.data, self.pos, self.reads = data, 0, 0
+	
+	def read(self, count):
+		count = min(count, SOCKET_BLOCK)
+		rv = self.data[self.pos:self.pos + count]
+		self.pos += len(rv)
+		self.reads += 1
+		return rv
+
+def decode_new(data):
+	socket, decoder = Socket(data), ChunkedDecoder()
+	while not decoder.feed(socket.read(READ_SIZE)):
+		pass
+	return decoder.body(), socket.reads
+
+class OldEventPollLoop(object):
+	"""
+	Copy of chunk parsing from old EventPollLoop. Buffer is stored in
+	attribute and grows by concatenation, so every read copies everything
+	received so far. First read after request is 10 bytes long and chunk
+	header is then read by 100 bytes.
+	"""
+	def __init__(self, data):
+		self.socket = Socket(data)
+		self._buffer = b""
+		self._chunk_size = -1
+		self.response = None
+	
+	def run(self):
+		self._chunk(self.socket.read(10))
+		while self.response is None:
+			self._chunk(self.socket.read(self._next_read))
+		return self.response, self.socket.reads
+	
+	def _chunk(self, data):
+		self._buffer += data
+		self._parse_chunk()
+	
+	def _parse_chunk(self):
+		if self._chunk_size < 0:
+			try:
+				size_str, rest = self._buffer.split(b"\r\n", 1)
+				self._chunk_size = int(size_str, 16)
+				self._buffer = rest
+				self._chunk_size += 2
+			except (ValueError, IndexError):
+				self._chunk_size = -1
+				self._next_read = 100
+				return
+		retrieved = len(self._buffer)
+		if retrieved < self._chunk_size:
+			self._next_read = self._chunk_size - retrieved
+			return
+		self.response, self._buffer = self._buffer[0:retrieved], self._buffer[retrieved:]
+
+def decode_old(data):
+	return OldEventPollLoop(data).run()
+
+def measure(name, fn, data):
+	best = None
+	for x in range(ROUNDS):
+		start = time.time()
+		body, reads = fn(data)
+		t = time.time() - start
+		best = t if best is None else min(best, t)
+	print("  %-20s %8.3fs %8s reads" % (name, best, reads))
+	return best
+
+def main(args):
+	if args:
+		batches = [ (os.path.basename(f), open(f, "rb").read()) for f in args ]
+	else:
+		batches = [ ("generated %s" % (n,), generate_batch(n)) for n in (1000, 10000, 50000, 200000) ]
+	for name, body in batches:
+		data = encode_chunked(body)
+		assert decode_new(data)[0] == body
+		# Old parser leaves trailing \r\n in response, json.loads ignores it
+		assert decode_old(data)[0].rstrip() == body
+		print("%s: %s events, %.1f MB" % (name, len(json.loads(body)), len(data) / 1048576.0))
+		old = measure("concatenating", decode_old, data)
+		new = measure("ChunkedDecoder", decode_new, data)
+		print("  %-20s %8.1fx" % ("speedup", old / max(new, 0.000001)))
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
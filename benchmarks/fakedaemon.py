@@ -0,0 +1,349 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - fake daemon
+
+Local stand-in for Syncthing REST API, good enough for Daemon class to
+connect, load configuration and receive events. Generates configuration
+with requested number of folders and devices and produces stream of
+events at requested rate, so behaviour with large setups can be
+measured without real daemon and without network.
+
+Usage: benchmarks/fakedaemon.py [-p port | -u socket] [-f folders] [-d devices] [-r events/s]
+
+Port 0 (default) picks free port. With -u, server listens on unix socket
+instead. Listening address, in form used in daemon config.xml, is
+printed to stdout as soon as server is ready.
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, json, time, random, hashlib, threading, argparse
+from collections import deque
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import ThreadingMixIn, UnixStreamServer
+	from urlparse import urlparse, parse_qs
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn, UnixStreamServer
+	from urllib.parse import urlparse, parse_qs
+
+VERSION = "v0.14.48"
+API_KEY = "fakedaemon-api-key"
+CSRF_COOKIE = "CSRF-Token-FAKE=fakedaemon-csrf-token"
+# How long is /rest/events request held when there are no new events
+EVENT_TIMEOUT = 10.0
+# Number of events kept for every subscription
+EVENT_BUFFER = 1000
+# Events are generated in batches, this many times per second
+BATCHES_PER_SECOND = 10
+# Number of files transferred by folder before it goes idle again
+ITEMS_PER_SYNC = 20
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000000000Z"
+
+def device_id(seed):
+	""" Generates valid-looking device ID """
+	alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+	digest = hashlib.sha256(seed.encode("utf-8")).digest()
+	chars = "".join([ alphabet[ord(digest[i:i+1]) % 32] for i in range(len(digest)) ])
+	chars = (chars * 2)[0:56]
+	return "-".join([ chars[i:i+7] for i in range(0, 56, 7) ])
+
+def now():
+	return time.strftime(TIME_FORMAT, time.gmtime())
+
+
+class Subscription(object):
+	"""
+	Events of requested types, numbered separately, as daemon does it
+	for every distinct 'events' parameter.
+	"""
+	def __init__(self, types):
+		self.types = types
+		self.last_id = 0
+		self.events = deque(maxlen=EVENT_BUFFER)
+
+	def add(self, event):
+		if self.types and not event["type"] in self.types:
+			return
+		self.last_id += 1
+		self.events.append(dict(event, id=self.last_id))
+
+	def since(self, last_id, limit=None):
+		rv = [ e for e in self.events if e["id"] > last_id ]
+		if limit:
+			rv = rv[-limit:]
+		return rv
+
+
+class FakeDaemon(object):
+	""" Holds generated configuration, folder states and event buffers """
+	def __init__(self, folders, devices, rate):
+		self.rate = rate
+		self.my_id = device_id("me")
+		self.start_time = now()
+		self.in_total, self.out_total = 0, 0
+		self.global_id = 0
+		self.subscriptions = {}
+		self.lock = threading.Condition()
+		self.random = random.Random(0)
+		self.config = self._generate_config(folders, devices)
+		self.states = { r["id"] : "idle" for r in self.config["folders"] }
+		self.synced = { r["id"] : 0 for r in self.config["folders"] }
+
+	def _generate_config(self, folders, devices):
+		device_ids = [ device_id("device-%s" % (i,)) for i in range(devices) ]
+		config = {
+			"version" : 20,
+			"devices" : [ {
+					"deviceID" : self.my_id, "name" : "fakedaemon",
+					"addresses" : [ "dynamic" ], "compression" : "metadata",
+					"introducer" : False, "paused" : False,
+				} ] + [ {
+					"deviceID" : nid, "name" : "Device %s" % (i,),
+					"addresses" : [ "dynamic" ], "compression" : "metadata",
+					"introducer" : False, "paused" : False,
+				} for i, nid in enumerate(device_ids) ],
+			"folders" : [],
+			"gui" : { "enabled" : True, "address" : "127.0.0.1:0",
+				"apiKey" : API_KEY, "useTLS" : False },
+			"options" : {
+				"listenAddresses" : [ "default" ], "globalAnnounceEnabled" : False,
+				"localAnnounceEnabled" : False, "relaysEnabled" : False,
+				"maxRecvKbps" : 0, "maxSendKbps" : 0, "urAccepted" : -1,
+				"startBrowser" : False, "natEnabled" : False,
+			},
+			"ignoredDevices" : [],
+		}
+		for i in range(folders):
+			# Every folder is shared with up to three devices
+			shared = [ device_ids[(i + x) % devices] for x in range(min(3, devices)) ]
+			config["folders"].append({
+				"id" : "folder-%05d" % (i,), "label" : "Folder %s" % (i,),
+				"path" : "/tmp/fakedaemon/folder-%05d" % (i,), "type" : "readwrite",
+				"devices" : [ { "deviceID" : self.my_id } ] + [ { "deviceID" : nid } for nid in shared ],
+				"rescanIntervalS" : 60, "fsWatcherEnabled" : False,
+				"ignorePerms" : False, "autoNormalize" : True, "paused" : False,
+			})
+		return config
+
+	def folder_status(self, rid):
+		files = 1000 + self.synced[rid]
+		need = ITEMS_PER_SYNC - self.synced[rid] % ITEMS_PER_SYNC if self.states[rid] == "syncing" else 0
+		return {
+			"globalFiles" : files, "globalDirectories" : 10, "globalSymlinks" : 0,
+			"globalDeleted" : 0, "globalBytes" : files * 1024 * 1024,
+			"localFiles" : files - need, "localDirectories" : 10, "localSymlinks" : 0,
+			"localDeleted" : 0, "localBytes" : (files - need) * 1024 * 1024,
+			"needFiles" : need, "needDirectories" : 0, "needSymlinks" : 0,
+			"needDeletes" : 0, "needBytes" : need * 1024 * 1024,
+			"inSyncFiles" : files - need, "inSyncBytes" : (files - need) * 1024 * 1024,
+			"state" : self.states[rid], "stateChanged" : now(),
+			"invalid" : "", "error" : "", "version" : files, "sequence" : files,
+			"ignorePatterns" : False,
+		}
+
+	def connections(self):
+		rv = { "connections" : {}, "total" : {
+			"at" : now(), "inBytesTotal" : self.in_total, "outBytesTotal" : self.out_total,
+			"address" : "", "clientVersion" : "", "connected" : False,
+			"paused" : False, "type" : "",
+		} }
+		devices = self.config["devices"][1:]
+		for n in devices:
+			rv["connections"][n["deviceID"]] = {
+				"at" : now(), "address" : "127.0.0.1:22000", "clientVersion" : VERSION,
+				"connected" : True, "paused" : False, "type" : "tcp-client",
+				"inBytesTotal" : self.in_total // max(1, len(devices)),
+				"outBytesTotal" : self.out_total // max(1, len(devices)),
+			}
+		return rv
+
+	def last_seen(self):
+		return { n["deviceID"] : { "lastSeen" : now() } for n in self.config["devices"] }
+
+	def status(self):
+		return {
+			"myID" : self.my_id, "sys" : 50 * 1024 * 1024, "alloc" : 30 * 1024 * 1024,
+			"cpuPercent" : 1.5, "goroutines" : 100, "startTime" : self.start_time,
+			"uptime" : 0, "discoveryEnabled" : False,
+		}
+
+	def get_events(self, types, since, limit):
+		""" Blocks until there are events newer than 'since' or until timeout """
+		with self.lock:
+			if not types in self.subscriptions:
+				self.subscriptions[types] = Subscription(types)
+			sub = self.subscriptions[types]
+			deadline = time.time() + EVENT_TIMEOUT
+			while sub.last_id <= since and time.time() < deadline:
+				self.lock.wait(deadline - time.time())
+			return sub.since(since, limit)
+
+	def emit(self, event_type, data):
+		""" Must be called with lock held """
+		self.global_id += 1
+		event = { "globalID" : self.global_id, "type" : event_type, "time" : now(), "data" : data }
+		for sub in self.subscriptions.values():
+			sub.add(event)
+
+	def generate(self, count):
+		"""
+		Generates 'count' events. Random folder goes through
+		idle -> syncing -> idle cycle, transferring one file per event.
+		"""
+		folders = self.config["folders"]
+		with self.lock:
+			for x in range(count):
+				rid = folders[self.random.randrange(len(folders))]["id"]
+				if self.states[rid] == "idle":
+					self.states[rid] = "syncing"
+					self.emit("StateChanged", { "folder" : rid, "from" : "idle", "to" : "syncing" })
+					continue
+				item = "some/directory/file-%08d.dat" % (self.synced[rid],)
+				self.emit("ItemStarted", { "folder" : rid, "item" : item, "type" : "file", "action" : "update" })
+				self.emit("ItemFinished", { "folder" : rid, "item" : item, "type" : "file",
+					"action" : "update", "error" : None })
+				self.synced[rid] += 1
+				self.in_total += 1024 * 1024
+				if self.synced[rid] % ITEMS_PER_SYNC == 0:
+					self.states[rid] = "idle"
+					self.emit("LocalIndexUpdated", { "folder" : rid, "items" : ITEMS_PER_SYNC, "version" : self.synced[rid] })
+					self.emit("StateChanged", { "folder" : rid, "from" : "syncing", "to" : "idle" })
+					self.emit("FolderSummary", { "folder" : rid, "summary" : self.folder_status(rid) })
+			self.lock.notify_all()
+
+	def run_generator(self):
+		""" Generates events at requested rate, never returns """
+		interval = 1.0 / BATCHES_PER_SECOND
+		batch = self.rate * interval
+		pending = 0.0
+		while True:
+			time.sleep(interval)
+			pending += batch
+			if pending >= 1.0:
+				self.generate(int(pending))
+				pending -= int(pending)
+
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, format, *args):
+		pass
+
+	def send_json(self, data, code=200):
+		body = json.dumps(data).encode("utf-8")
+		self.send_response(code)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("X-Syncthing-Version", VERSION)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def send_chunked_json(self, data):
+		""" Sends response with chunked encoding, as daemon does with events """
+		body = json.dumps(data).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Transfer-Encoding", "chunked")
+		self.send_header("X-Syncthing-Version", VERSION)
+		self.end_headers()
+		self.wfile.write(("%x\r\n" % (len(body),)).encode("ascii") + body + b"\r\n0\r\n\r\n")
+
+	def authorized(self):
+		cookie_name, cookie_value = CSRF_COOKIE.split("=", 1)
+		return self.headers.get("X-API-Key") == API_KEY \
+			or self.headers.get("X-%s" % (cookie_name,)) == cookie_value
+
+	def do_GET(self):
+		daemon = self.server.daemon
+		url = urlparse(self.path)
+		args = { k : v[0] for k, v in parse_qs(url.query).items() }
+		if url.path == "/":
+			body = b"<html></html>"
+			self.send_response(200)
+			self.send_header("Set-Cookie", "%s; Path=/" % (CSRF_COOKIE,))
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+			return
+		if not self.authorized():
+			return self.send_json({ "error" : "Forbidden" }, 403)
+		if url.path == "/rest/events":
+			types = frozenset([ x for x in args.get("events", "").split(",") if x ])
+			since = int(args.get("since", 0))
+			limit = int(args["limit"]) if "limit" in args else None
+			return self.send_chunked_json(daemon.get_events(types, since, limit))
+		with daemon.lock:
+			if url.path == "/rest/system/config":
+				return self.send_json(daemon.config)
+			elif url.path == "/rest/system/config/insync":
+				return self.send_json({ "configInSync" : True })
+			elif url.path == "/rest/system/status":
+				return self.send_json(daemon.status())
+			elif url.path == "/rest/system/version":
+				return self.send_json({ "version" : VERSION, "os" : "linux", "arch" : "amd64" })
+			elif url.path == "/rest/system/connections":
+				return self.send_json(daemon.connections())
+			elif url.path == "/rest/system/error":
+				return self.send_json({ "errors" : [] })
+			elif url.path == "/rest/stats/device":
+				return self.send_json(daemon.last_seen())
+			elif url.path == "/rest/db/status":
+				if args.get("folder") in daemon.states:
+					return self.send_json(daemon.folder_status(args["folder"]))
+				return self.send_json({ "error" : "no such folder" }, 404)
+		self.send_json({ "error" : "Not found" }, 404)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def get_address(self):
+		return "%s:%s" % self.server_address
+
+
+class UnixServer(ThreadingMixIn, UnixStreamServer):
+	daemon_threads = True
+
+	def get_address(self):
+		return "unix://%s" % (self.server_address,)
+
+
+def start(port=0, folders=10, devices=5, rate=10, unix_socket=None):
+	"""
+	Starts fake daemon in background threads.
+	Returns server, listening address is returned by server.get_address().
+	"""
+	if unix_socket:
+		if os.path.exists(unix_socket):
+			os.unlink(unix_socket)
+		server = UnixServer(os.path.abspath(unix_socket), Handler)
+	else:
+		server = Server(("127.0.0.1", port), Handler)
+	server.daemon = FakeDaemon(folders, devices, rate)
+	for target in (server.serve_forever, server.daemon.run_generator):
+		t = threading.Thread(target=target)
+		t.daemon = True
+		t.start()
+	return server
+
+def main(args):
+	parser = argparse.ArgumentParser(description="Fake Syncthing daemon")
+	parser.add_argument("-p", "--port", type=int, default=0, help="port to listen on")
+	parser.add_argument("-u", "--unix", help="listen on unix socket instead")
+	parser.add_argument("-f", "--folders", type=int, default=10, help="number of folders")
+	parser.add_argument("-d", "--devices", type=int, default=5, help="number of devices")
+	parser.add_argument("-r", "--rate", type=float, default=10, help="events per second")
+	args = parser.parse_args(args)
+	server = start(args.port, max(1, args.folders), max(1, args.devices), args.rate, args.unix)
+	print(server.get_address())
+	sys.stdout.flush()
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
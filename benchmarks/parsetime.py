@@ -0,0 +1,43 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - parsetime benchmark
+
+Compares tools.parsetime with dateutil parser, which was used for
+every timestamp received from daemon before.
+
+Usage: benchmarks/parsetime.py [count]
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from syncthing_gtk.tools import parsetime
+from dateutil import parser
+
+# Timestamps as sent by daemon in events, stats/device and errors
+SAMPLES = [
+	"2016-02-13T21:20:56.574153711+01:00",
+	"2017-11-02T08:01:12.1233-07:00",
+	"2018-06-30T23:59:59Z",
+	"1970-01-01T00:00:00Z",
+	"2019-03-10T02:30:00.000000001+05:30",
+]
+
+def run(fn, count):
+	return min(timeit.repeat(
+		lambda : [ fn(x) for x in SAMPLES ],
+		number=count // len(SAMPLES), repeat=3))
+
+def main(args):
+	count = int(args[0]) if args else 100000
+	for x in SAMPLES:
+		assert parsetime(x) == parser.parse(x), x
+	old = run(parser.parse, count)
+	new = run(parsetime, count)
+	print("%s timestamps" % (count,))
+	print("  %-20s %8.3fs" % ("dateutil", old))
+	print("  %-20s %8.3fs" % ("parsetime", new))
+	print("  %-20s %8.1fx" % ("speedup", old / max(new, 0.000001)))
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - event replay
+
+Feeds events recorded with 'syncthing-gtk --record-events FILE' into
+Daemon._on_event under cProfile and prints where the time was spent.
+Batches are replayed as fast as possible by default, or with original
+timing, optionally accelerated, with --speed.
+
+Only event handling is replayed. GLib main loop is not running, so
+timers and REST requests started by handlers are never executed.
+
+Usage: benchmarks/replay.py [-s speed] [-o profile.out] [-n count] recording [scenario]
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, time, shutil, tempfile, cProfile, pstats, argparse
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+from scale import PLUGIN_SIGNALS, SCENARIOS, CONFIG_XML
+
+# Nothing listens here; Address is never used, as no request is executed
+ADDRESS = "127.0.0.1:1"
+
+def replay(daemon, filename, speed, profile):
+	"""
+	Replays recording. Returns (batches, events, seconds spent in
+	_on_event).
+	"""
+	from syncthing_gtk.eventrecorder import read_recording
+	batches, count, spent = 0, 0, 0.0
+	first, start = None, time.time()
+	for t, key, data in read_recording(filename):
+		if first is None:
+			first = t
+		if speed > 0:
+			# Wait until batch would be received, if played at given speed
+			delay = start + (t - first) / speed - time.time()
+			if delay > 0:
+				time.sleep(delay)
+		if key == "config":
+			daemon._parse_dev_n_folders(data, snapshot=True)
+			for r in data["folders"]:
+				daemon._folder_devices[r["id"]] = [ n["deviceID"] for n in r["devices"] ]
+		elif key == "events":
+			batch_start = time.time()
+			profile.enable()
+			for event in data:
+				event_start = time.time()
+				daemon._on_event(event)
+				daemon._stats.event_handled(event["type"], time.time() - event_start)
+			profile.disable()
+			spent += time.time() - batch_start
+			batches += 1
+			count += len(data)
+	return batches, count, spent
+
+def main(args):
+	parser = argparse.ArgumentParser(description="Replays recorded daemon events under profiler")
+	parser.add_argument("-s", "--speed", type=float, default=0,
+		help="replay speed; 1 is real time, 0 (default) as fast as possible")
+	parser.add_argument("-o", "--output", help="save profile data to file")
+	parser.add_argument("-n", "--count", type=int, default=30, help="number of functions to print")
+	parser.add_argument("recording", help="file created with --record-events")
+	parser.add_argument("scenario", nargs="?", default="app", help="one of: %s" % (", ".join(SCENARIOS),))
+	args = parser.parse_args(args)
+	if not args.scenario in SCENARIOS:
+		parser.error("unknown scenario: %s" % (args.scenario,))
+
+	tmpdir = tempfile.mkdtemp(prefix="stgtk-replay-")
+	try:
+		configxml = os.path.join(tmpdir, "config.xml")
+		with open(configxml, "w") as f:
+			f.write(CONFIG_XML % (ADDRESS, "replay"))
+		from syncthing_gtk.daemon import Daemon
+		daemon = Daemon(configxml)
+		signals = PLUGIN_SIGNALS if args.scenario == "plugin" else \
+			[ x.decode("ascii") for x in Daemon.__gsignals__ ]
+		for name in signals:
+			daemon.connect(name, lambda *a : None)
+
+		profile = cProfile.Profile()
+		batches, count, spent = replay(daemon, os.path.abspath(args.recording), args.speed, profile)
+		daemon.close()
+	finally:
+		shutil.rmtree(tmpdir, ignore_errors=True)
+
+	print("%s events in %s batches, %.3fs in handlers, %.0f events/s" % (
+		count, batches, spent, count / max(spent, 0.000001)))
+	print("")
+	print("\n".join(daemon.get_statistics().get_lines()))
+	print("")
+	if args.output:
+		profile.dump_stats(args.output)
+	pstats.Stats(profile).sort_stats("cumulative").print_stats(args.count)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - scale benchmark
+
+Connects Daemon class to fake daemon (see fakedaemon.py) with generated
+configuration and reports time needed to connect and to load data for
+all folders, CPU time and peak memory used while processing events.
+
+Daemon is measured without any UI, with signal handlers that do
+nothing. Two sets of handlers are measured:
+  app     - every signal has handler, so every event is requested
+  plugin  - signals used by file manager plugins
+
+Every scenario runs in separate process, so memory used by one doesn't
+affect another. Runs offline, on Linux only.
+
+Daemon connects to fake daemon over TCP, or over unix socket if -u
+option is used.
+
+Usage: benchmarks/scale.py [-u] [-f folders] [-d devices] [-r events/s] [-t seconds] [scenario ...]
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, json, time, shutil, tempfile, resource, subprocess, argparse
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+from fakedaemon import API_KEY
+
+# Signals connected by nautilus, nemo and caja plugins
+PLUGIN_SIGNALS = ("connected", "connection-error", "disconnected",
+	"device-connected", "device-disconnected", "folder-added",
+	"folder-scan-started", "folder-sync-started", "folder-sync-finished",
+	"folder-stopped", "item-started", "item-updated")
+SCENARIOS = ("app", "plugin")
+# Time limit for connecting and loading all folders
+TIMEOUT = 120.0
+
+CONFIG_XML = """<configuration version="20">
+	<gui enabled="true" tls="false">
+		<address>%s</address>
+		<apikey>%s</apikey>
+	</gui>
+</configuration>
+"""
+
+def cpu_time():
+	r = resource.getrusage(resource.RUSAGE_SELF)
+	return r.ru_utime + r.ru_stime
+
+def current_rss():
+	""" Returns current resident memory in kB """
+	with open("/proc/self/status", "r") as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1])
+	return 0
+
+def run_scenario(scenario, address, folders, duration, tmpdir):
+	"""
+	Measures Daemon in current process.
+	"""
+	configxml = os.path.join(tmpdir, "config.xml")
+	with open(configxml, "w") as f:
+		f.write(CONFIG_XML % (address, API_KEY))
+
+	from gi.repository import GLib, GObject
+	from syncthing_gtk.daemon import Daemon
+	loop = GLib.MainLoop()
+	result = { "scenario" : scenario, "import_rss" : current_rss() }
+	cpu_start, start = cpu_time(), time.time()
+	loaded = set()
+
+	def cb_connected(daemon):
+		result["connected"] = time.time() - start
+
+	def cb_folder_data_changed(daemon, rid, data):
+		loaded.add(rid)
+		if len(loaded) == folders and not "loaded" in result:
+			result["loaded"] = time.time() - start
+			result["cpu_loaded"] = cpu_time() - cpu_start
+			result["events_start"] = daemon._event_count
+			GLib.timeout_add_seconds(duration, finish)
+
+	def cb_timeout(*a):
+		if not "loaded" in result:
+			result["error"] = "timed out"
+			loop.quit()
+		return False
+
+	def cb_connection_error(daemon, reason, message, exception):
+		result["error"] = message
+		loop.quit()
+
+	def finish(*a):
+		loop.quit()
+		return False
+
+	def noop(*a):
+		pass
+
+	daemon = Daemon(configxml)
+	signals = PLUGIN_SIGNALS if scenario == "plugin" else \
+		[ x.decode("ascii") for x in Daemon.__gsignals__ ]
+	handlers = {
+		"connected" : cb_connected,
+		"connection-error" : cb_connection_error,
+		"folder-data-changed" : cb_folder_data_changed,
+	}
+	for name in signals:
+		daemon.connect(name, handlers.get(name, noop))
+	if not "folder-data-changed" in signals:
+		# Loading is detected using this signal. GObject.connect is
+		# used so it doesn't change event types requested by plugin.
+		GObject.GObject.connect(daemon, "folder-data-changed", cb_folder_data_changed)
+	GLib.timeout_add_seconds(int(TIMEOUT), cb_timeout)
+	daemon.reconnect()
+	loop.run()
+
+	result["cpu"] = cpu_time() - cpu_start
+	result["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	result["events"] = daemon._event_count - result.get("events_start", 0)
+	result["statistics"] = daemon.get_statistics().get_lines()
+	daemon.close()
+	return result
+
+def format_time(t):
+	return "-" if t is None else "%.2fs" % (t,)
+
+def main(args):
+	parser = argparse.ArgumentParser(description="Daemon class scale benchmark")
+	parser.add_argument("-f", "--folders", type=int, default=500, help="number of folders")
+	parser.add_argument("-d", "--devices", type=int, default=50, help="number of devices")
+	parser.add_argument("-r", "--rate", type=float, default=200, help="events per second")
+	parser.add_argument("-t", "--time", type=int, default=20,
+		help="how long are events processed after all folders are loaded")
+	parser.add_argument("-u", "--unix", action="store_true", help="connect using unix socket")
+	parser.add_argument("-v", "--verbose", action="store_true", help="print request statistics")
+	parser.add_argument("--run", help=argparse.SUPPRESS)
+	parser.add_argument("--address", help=argparse.SUPPRESS)
+	parser.add_argument("scenario", nargs="*", help="one of: %s" % (", ".join(SCENARIOS),))
+	args = parser.parse_args(args)
+	for scenario in args.scenario:
+		if not scenario in SCENARIOS:
+			parser.error("unknown scenario: %s" % (scenario,))
+
+	if args.run:
+		# Child process
+		tmpdir = tempfile.mkdtemp(prefix="stgtk-scale-")
+		try:
+			result = run_scenario(args.run, args.address, args.folders, args.time, tmpdir)
+		finally:
+			shutil.rmtree(tmpdir, ignore_errors=True)
+		print(json.dumps(result))
+		return
+
+	socketdir = tempfile.mkdtemp(prefix="stgtk-scale-")
+	fake_args = [ sys.executable, os.path.join(BENCHMARKS, "fakedaemon.py"),
+		"-f", str(args.folders), "-d", str(args.devices), "-r", str(args.rate) ]
+	if args.unix:
+		fake_args += [ "-u", os.path.join(socketdir, "gui.sock") ]
+	fake = subprocess.Popen(fake_args, stdout=subprocess.PIPE)
+	try:
+		address = fake.stdout.readline().decode("utf-8").strip()
+		print("%s folders, %s devices, %s events/s, %ss after load, %s" % (
+			args.folders, args.devices, args.rate, args.time,
+			"unix socket" if args.unix else "TCP"))
+		print("%-8s %10s %10s %10s %10s %12s %12s %8s" % ("", "connected",
+			"loaded", "cpu load", "cpu total", "import rss", "peak rss", "events"))
+		for scenario in (args.scenario or SCENARIOS):
+			output = subprocess.check_output([ sys.executable, os.path.abspath(__file__),
+				"--run", scenario, "--address", address,
+				"-f", str(args.folders), "-t", str(args.time) ])
+			r = json.loads(output.decode("utf-8").strip().split("\n")[-1])
+			if "error" in r:
+				print("%-8s failed: %s" % (scenario, r["error"]))
+				continue
+			print("%-8s %10s %10s %10s %10s %10skB %10skB %8s" % (scenario,
+				format_time(r.get("connected")), format_time(r.get("loaded")),
+				format_time(r.get("cpu_loaded")), format_time(r["cpu"]),
+				r["import_rss"], r["peak_rss"], r["events"]))
+			if args.verbose:
+				print("\n".join(r["statistics"]))
+				print("")
+	finally:
+		fake.terminate()
+		fake.wait()
+		shutil.rmtree(socketdir, ignore_errors=True)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - startup benchmark
+
+Measures how long it takes to import main application module (and
+headless mode module, for comparison) and how that time is split
+between imported modules. Every measurement runs in new process, so
+nothing is cached in interpreter; Disk cache is not dropped.
+
+Usage: benchmarks/startup.py [-r repeat] [-n count] [module ...]
+"""
+
+from __future__ import unicode_literals, print_function
+import os, sys, json, subprocess, argparse
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = ("syncthing_gtk.app", "syncthing_gtk.headless")
+
+# Executed in child process. Replaces __import__ with version measuring
+# inclusive time of every import that loads new module.
+CHILD = """
+import sys, time, json
+sys.path.insert(0, %(root)r)
+try:
+	import __builtin__ as builtins
+except ImportError:
+	import builtins
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('Rsvg', '2.0')
+original_import = builtins.__import__
+stack = [ [] ]
+times = {}
+
+def timed_import(name, *args, **kwargs):
+	before = len(sys.modules)
+	stack.append([])
+	start = time.time()
+	try:
+		return original_import(name, *args, **kwargs)
+	finally:
+		t = time.time() - start
+		children = sum(stack.pop())
+		stack[-1].append(t)
+		if len(sys.modules) != before and not name in times:
+			times[name] = (t, t - children)
+
+builtins.__import__ = timed_import
+start = time.time()
+import %(module)s
+total = time.time() - start
+builtins.__import__ = original_import
+own = sorted([ m for m in sys.modules if m.startswith("syncthing_gtk.") and sys.modules[m] is not None ])
+print(json.dumps({ "total" : total, "times" : times, "loaded" : own }))
+"""
+
+def measure(module):
+	output = subprocess.check_output([ sys.executable, "-c",
+		CHILD % { "root" : os.path.abspath(ROOT), "module" : module } ])
+	return json.loads(output.decode("utf-8").strip().split("\n")[-1])
+
+def main(args):
+	parser = argparse.ArgumentParser(description="Measures import time of Syncthing-GTK modules")
+	parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs, best one is reported")
+	parser.add_argument("-n", "--count", type=int, default=20, help="number of slowest imports to print")
+	parser.add_argument("module", nargs="*", help="modules to measure; default: %s" % (", ".join(MODULES),))
+	args = parser.parse_args(args)
+
+	for module in (args.module or MODULES):
+		runs = [ measure(module) for x in range(max(1, args.repeat)) ]
+		best = min(runs, key=lambda r : r["total"])
+		print("%s: %.1fms (best of %s, worst %.1fms)" % (module, best["total"] * 1000.0,
+			len(runs), max([ r["total"] for r in runs ]) * 1000.0))
+		print("  %10s %10s  %s" % ("self", "inclusive", "import"))
+		times = sorted(best["times"].items(), key=lambda x : -x[1][1])
+		for name, (inclusive, own) in times[0:args.count]:
+			print("  %8.1fms %8.1fms  %s" % (own * 1000.0, inclusive * 1000.0, name))
+		print("  Loaded: %s" % (", ".join([ x.split(".", 1)[1] for x in best["loaded"] ]),))
+		print("")
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -8,6 +8,12 @@ if __name__ == "__main__":
 	from syncthing_gtk.tools import init_logging, init_locale, IS_WINDOWS
 	init_logging()
 	
+	from syncthing_gtk.headless import is_headless
+	if is_headless(sys.argv[1:]):
+		# Status printed to console, without loading GTK
+		from syncthing_gtk.headless import main
+		sys.exit(main(sys.argv[1:]))
+	
 	if IS_WINDOWS:
 		from syncthing_gtk.windows import (
 			enable_localization,
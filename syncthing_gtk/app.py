@@ -16,29 +16,28 @@ from syncthing_gtk.tools import (
 	compare_version, can_upgrade_binary
 )
 from syncthing_gtk.daemon import Daemon, TLSErrorException, InvalidConfigurationException
-from syncthing_gtk.notifications import Notifications, HAS_DESKTOP_NOTIFY
+from syncthing_gtk.daemon import ConfigChangeException
 from syncthing_gtk.statusicon import get_status_icon, StatusIconDummy
-from syncthing_gtk.daemonoutputdialog import DaemonOutputDialog
-from syncthing_gtk.deviceeditor import DeviceEditorDialog
-from syncthing_gtk.foldereditor import FolderEditorDialog
 from syncthing_gtk.tools import parse_config_arguments
 from syncthing_gtk.configuration import Configuration
 from syncthing_gtk.daemonprocess import DaemonProcess
 from syncthing_gtk.timermanager import TimerManager
 from syncthing_gtk.uibuilder import UIBuilder
-from syncthing_gtk.identicon import IdentIcon
 from syncthing_gtk.infobox import InfoBox
 from syncthing_gtk.ribar import RIBar
-try:
-	from syncthing_gtk.stdownloader import StDownloader
-except ImportError:
-	StDownloader = None
+# Dialogs, editors, notifications and StDownloader are imported only
+# when needed, as most of them are never used in tray-only session
 
 
 from datetime import datetime
-import os, webbrowser, sys, time, logging, shutil, re
+import os, sys, time, logging, shutil, re, pkgutil
 log = logging.getLogger("App")
 
+# StDownloader module is not installed with 'setup.py --nostdownloader'.
+# Only presence of module is checked here, so it's not loaded on every
+# start; Set to False if loading it fails later.
+HAS_STDOWNLOADER = pkgutil.find_loader("syncthing_gtk.stdownloader") is not None
+
 # Internal version used by updater (if enabled)
 INTERNAL_VERSION		= "v0.9.4.4"
 # Minimal Syncthing version supported by App
@@ -84,6 +83,21 @@ UPDATE_CHECK_INTERVAL = 12 * 60 * 60
 # Speed values in outcoming/incoming speed limit menus
 SPEED_LIMIT_VALUES = [ 10, 25, 50, 75, 100, 200, 500, 750, 1000, 2000, 5000 ]
 
+# Delay between selecting speed limit in menu and sending it to daemon,
+# so clicking through multiple values causes only one config write
+SPEED_LIMIT_DELAY = 1
+
+# Failed configuration change requested with retry_on_error is repeated
+# after this many seconds, at most SETTINGS_RETRY_COUNT times
+SETTINGS_RETRY_DELAY = 2
+SETTINGS_RETRY_COUNT = 5
+
+# Configuration keys displayed in folder and device boxes. Box is not
+# touched when only other keys are changed on config reload
+FOLDER_DISPLAYED_KEYS = frozenset(("label", "path", "type", "ignorePerms",
+		"rescanIntervalS", "fsWatcherEnabled", "devices"))
+DEVICE_DISPLAYED_KEYS = frozenset(("name", "compression", "introducer", "used"))
+
 class App(Gtk.Application, TimerManager):
 	"""
 	Main application / window.
@@ -121,7 +135,14 @@ class App(Gtk.Application, TimerManager):
 		# If enabled (by -o argument), daemon output is captured and printed
 		# to stdout
 		self.dump_daemon_output = None
+		# If enabled (by --dump-stats argument), connection statistics
+		# are printed to stdout on exit
+		self.dump_stats = False
+		# If set (by --record-events argument), events received from
+		# daemon are recorded to this file
+		self.record_events = None
 		self.notifications = None
+		self.scheduler = None
 		# connect_dialog may be displayed during initial communication
 		# or if daemon shuts down.
 		self.connect_dialog = None
@@ -130,6 +151,7 @@ class App(Gtk.Application, TimerManager):
 		self.dark_color = None			# RGBA. None by default, changes with dark themes
 		self.recv_limit = -1			# Used mainly to prevent menu handlers from recursing
 		self.send_limit = -1			# -//-
+		self.confirmed_limits = (-1, -1)	# (recv, send) limits last confirmed by daemon
 		self.ur_question_shown = False	# Used to prevent showing 'Do you want usage reporting'
 										# question more than once until ST-GTK is restarted.
 		self.home_dir_override = None	# If set by '--home'
@@ -142,10 +164,16 @@ class App(Gtk.Application, TimerManager):
 		self.open_boxes = set([])		# Holds set of expanded device/folder boxes
 		self.devices_never_loaded = True
 		self.folders_never_loaded = True
+		self.snapshot_shown = False		# True while displaying data loaded from snapshot
+		self.stale_boxes = set([])		# Boxes from snapshot not yet confirmed by daemon
 		self.sync_animation = 0
 
 		self.editor_device = None
 		self.editor_folder = None
+		# Configuration changes waiting to be written to daemon and
+		# set of flags ('retry', 'restart') requested with them
+		self.pending_settings = None
+		self.pending_settings_flags = None
 	
 	
 	def do_startup(self, *a):
@@ -165,8 +193,13 @@ class App(Gtk.Application, TimerManager):
 			log.error("SIGTERM recieved, exiting...")
 			self.quit()
 		
+		def sigusr1(*a):
+			self.print_statistics()
+		
 		signal.signal(signal.SIGINT, sigint)
 		signal.signal(signal.SIGTERM, sigterm)
+		if hasattr(signal, "SIGUSR1"):
+			signal.signal(signal.SIGUSR1, sigusr1)
 	
 	def do_local_options(self, trash, lo):
 		self.parse_local_options(lo.contains)
@@ -179,6 +212,7 @@ class App(Gtk.Application, TimerManager):
 		if is_option("window"): self.hide_window = False
 		if is_option("minimized"): self.hide_window = True
 		if is_option("dump"): self.dump_daemon_output = True
+		if is_option("dump-stats"): self.dump_stats = True
 		if is_option("no-status-icon"): self.show_status_icon = False
 		if is_option("wizard"):
 			self.exit_after_wizard = True
@@ -198,7 +232,10 @@ class App(Gtk.Application, TimerManager):
 				return 0
 			if cl.get_options_dict().contains("home"):
 				self.home_dir_override = cl.get_options_dict().lookup_value("home").get_string()
-			if not StDownloader is None:
+			if cl.get_options_dict().contains("record-events"):
+				self.record_events = os.path.abspath(os.path.expanduser(
+					cl.get_options_dict().lookup_value("record-events").get_string()))
+			if HAS_STDOWNLOADER:
 				if cl.get_options_dict().contains("force-update"):
 					self.force_update_version = \
 						cl.get_options_dict().lookup_value("force-update").get_string()
@@ -240,6 +277,7 @@ class App(Gtk.Application, TimerManager):
 		if self.daemon == None:
 			if self.wizard == None:
 				if self.setup_connection():
+					self.load_snapshot()
 					self.daemon.reconnect()
 		self.activate()
 		return 0
@@ -287,6 +325,7 @@ class App(Gtk.Application, TimerManager):
 		aso("wizard",	b"1", "Run 'first start wizard' and exit")
 		aso("about",	b"a", "Display about dialog and exit")
 		aso("dump",		b"o", "Redirect captured daemon output to stdout")
+		aso("dump-stats", 0, "Print connection statistics to stdout on exit")
 		aso("home", 0, "Overrides default syncthing configuration directory",
 				GLib.OptionArg.STRING)
 		aso("add-repo", 0,    "Opens 'add repository' dialog with specified path prefilled",
@@ -294,7 +333,9 @@ class App(Gtk.Application, TimerManager):
 		aso("remove-repo", 0, "If there is repository assigned with specified path, opens 'remove repository' dialog",
 				GLib.OptionArg.STRING)
 		aso("no-status-icon", 0, "Don't show a tray status icon")
-		if not StDownloader is None:
+		aso("record-events", 0, "Record events received from daemon to specified file",
+				GLib.OptionArg.STRING)
+		if HAS_STDOWNLOADER:
 			aso("force-update", 0,
 					"Force updater to download specific daemon version",
 					GLib.OptionArg.STRING, GLib.OptionFlags.HIDDEN)
@@ -307,6 +348,7 @@ class App(Gtk.Application, TimerManager):
 			return action
 		add_simple_action('webui', self.cb_menu_webui)
 		add_simple_action('daemon_output', self.cb_menu_daemon_output).set_enabled(False)
+		add_simple_action('statistics', self.cb_menu_statistics)
 		add_simple_action('preferences', self.cb_menu_ui_settings)
 		add_simple_action('about', self.cb_about)
 		add_simple_action('quit', self.cb_exit)
@@ -380,9 +422,9 @@ class App(Gtk.Application, TimerManager):
 		# Create Daemon instance (loads and parses config)
 		try:
 			if self.home_dir_override:
-				self.daemon = Daemon(os.path.join(self.home_dir_override, "config.xml"))
+				self.daemon = Daemon(os.path.join(self.home_dir_override, "config.xml"), snapshot=True)
 			else:
-				self.daemon = Daemon()
+				self.daemon = Daemon(snapshot=True)
 		except InvalidConfigurationException as e:
 			# Syncthing is not configured, most likely never launched.
 			# Run wizard.
@@ -398,9 +440,16 @@ class App(Gtk.Application, TimerManager):
 			# This is pretty-much fatal. Display error message and bail out.
 			self.cb_syncthing_con_error(self.daemon, Daemon.UNKNOWN, str(e), e)
 			return False
-		if HAS_DESKTOP_NOTIFY:
-			if self.config["notification_for_update"] or self.config["notification_for_error"]:
+		self.daemon.set_max_requests(self.config["max_requests"])
+		if self.config["notification_for_update"] or self.config["notification_for_error"]:
+			from syncthing_gtk.notifications import Notifications, HAS_DESKTOP_NOTIFY
+			if HAS_DESKTOP_NOTIFY:
 				self.notifications = Notifications(self, self.daemon)
+		if self.config["bandwidth_schedule"].strip() not in ("", "[]"):
+			from syncthing_gtk.bandwidthscheduler import BandwidthScheduler, parse_schedule
+			rules = parse_schedule(self.config["bandwidth_schedule"])
+			self.scheduler = BandwidthScheduler(self.daemon, rules)
+			self.scheduler.connect("rule-applied", self.cb_schedule_rule_applied)
 		# Connect signals
 		self.daemon.connect("config-out-of-sync", self.cb_syncthing_config_oos)
 		self.daemon.connect("config-saved", self.cb_syncthing_config_saved)
@@ -413,6 +462,8 @@ class App(Gtk.Application, TimerManager):
 		self.daemon.connect("device-rejected", self.cb_syncthing_device_rejected)
 		self.daemon.connect("my-id-changed", self.cb_syncthing_my_id_changed)
 		self.daemon.connect("device-added", self.cb_syncthing_device_added)
+		self.daemon.connect("device-changed", self.cb_syncthing_device_changed)
+		self.daemon.connect("device-removed", self.cb_syncthing_device_removed)
 		self.daemon.connect("device-data-changed", self.cb_syncthing_device_data_changed)
 		self.daemon.connect("last-seen-changed", self.cb_syncthing_last_seen_changed)
 		self.daemon.connect("device-connected", self.cb_syncthing_device_state_changed, True)
@@ -423,6 +474,8 @@ class App(Gtk.Application, TimerManager):
 		self.daemon.connect("device-sync-progress", self.cb_syncthing_device_sync_progress)
 		self.daemon.connect("device-sync-finished", self.cb_syncthing_device_sync_progress, 1.0)
 		self.daemon.connect("folder-added", self.cb_syncthing_folder_added)
+		self.daemon.connect("folder-changed", self.cb_syncthing_folder_changed)
+		self.daemon.connect("folder-removed", self.cb_syncthing_folder_removed)
 		self.daemon.connect("folder-error", self.cb_syncthing_folder_error)
 		self.daemon.connect("folder-data-changed", self.cb_syncthing_folder_data_changed)
 		self.daemon.connect("folder-data-failed", self.cb_syncthing_folder_state_changed, 0.0, COLOR_NEW, "")
@@ -434,6 +487,11 @@ class App(Gtk.Application, TimerManager):
 		self.daemon.connect("folder-scan-finished", self.cb_syncthing_folder_up_to_date)
 		self.daemon.connect("folder-stopped", self.cb_syncthing_folder_stopped) 
 		self.daemon.connect("system-data-updated", self.cb_syncthing_system_data)
+		if self.record_events:
+			try:
+				self.daemon.record_events(self.record_events)
+			except IOError as e:
+				log.error("Failed to record events: %s", e)
 		return True
 	
 	def show_wizard(self):
@@ -511,7 +569,8 @@ class App(Gtk.Application, TimerManager):
 		# User response is handled in App.cb_infobar_response
 	
 	def check_for_upgrade(self, *a):
-		if StDownloader is None:
+		global HAS_STDOWNLOADER
+		if not HAS_STDOWNLOADER:
 			# Can't, someone stole my updater module :(
 			return
 		self.cancel_timer("updatecheck")
@@ -538,6 +597,18 @@ class App(Gtk.Application, TimerManager):
 			self.cb_syncthing_error(None, "Warning: No write access to daemon binary; Skipping update check.")
 			return
 		# Determine platform
+		try:
+			from syncthing_gtk.stdownloader import StDownloader
+		except ImportError as e:
+			# Module is there, but something it needs is not
+			log.warning("Cannot update: Failed to load updater: %s", e)
+			HAS_STDOWNLOADER = False
+			if self.restart_after_update:
+				# Daemon is too old and can't be updated
+				self.restart_after_update = False
+				self.close_connect_dialog()
+				self.cb_syncthing_con_error(self.daemon, Daemon.OLD_VERSION, "", e)
+			return
 		suffix, tag = StDownloader.determine_platform()
 		if suffix is None or tag is None:
 			# Shouldn't really happen at this point
@@ -668,8 +739,35 @@ class App(Gtk.Application, TimerManager):
 			log.warning("Failed to remove backup binary during backup")
 			log.warning(e)
 	
+	def load_snapshot(self):
+		"""
+		Displays folders and devices as they were when daemon was last
+		seen, so window is not empty while daemon starts. Those are
+		insensitive until daemon sends current data.
+		"""
+		if self.daemon.load_snapshot():
+			log.debug("Displaying data from snapshot")
+			self.snapshot_shown = True
+	
+	def remove_stale_boxes(self):
+		"""
+		Removes boxes loaded from snapshot for folders and devices that
+		daemon doesn't know anymore.
+		"""
+		for (lst, boxes) in (('folderlist', self.folders), ('devicelist', self.devices)):
+			for id in [ id for id in boxes if boxes[id] in self.stale_boxes ]:
+				box = boxes.pop(id)
+				self[lst].remove(box)
+				box.destroy()
+		self.stale_boxes = set([])
+		self.snapshot_shown = False
+	
 	def cb_syncthing_connected(self, *a):
-		self.clear()
+		if self.snapshot_shown:
+			# Boxes are kept and updated with data from daemon
+			self.stale_boxes = set(self.folders.values()) | set(self.devices.values())
+		else:
+			self.clear()
 		self.close_connect_dialog()
 		self.set_status(True)
 		self["edit-menu-button"].set_sensitive(True)
@@ -733,7 +831,7 @@ class App(Gtk.Application, TimerManager):
 					else:
 						self.display_run_daemon_dialog()
 			self.set_status(False)
-		elif reason == Daemon.OLD_VERSION and self.config["st_autoupdate"] and not self.process is None and not StDownloader is None:
+		elif reason == Daemon.OLD_VERSION and self.config["st_autoupdate"] and not self.process is None and HAS_STDOWNLOADER:
 			# Daemon is too old, but autoupdater is enabled and I have control of deamon.
 			# Try to update.
 			from .configuration import LONG_AGO
@@ -813,19 +911,12 @@ class App(Gtk.Application, TimerManager):
 	def cb_config_loaded(self, daemon, config):
 		# Called after connection to daemon is initialized;
 		# Used to change indicating UI components
+		if self.snapshot_shown:
+			self.remove_stale_boxes()
 		self.recv_limit = config["options"]["maxRecvKbps"]
 		self.send_limit = config["options"]["maxSendKbps"]
-		L_MEV = [("menu-si-sendlimit", self.send_limit),
-				 ("menu-si-recvlimit", self.recv_limit)]
-		
-		for limitmenu, value in L_MEV:
-			other = True
-			for speed in [0] + SPEED_LIMIT_VALUES:
-				menuitem = self["%s-%s" % (limitmenu, speed)]
-				menuitem.set_active(speed == value)
-				if speed == value:
-					other = False
-			self["%s-other" % (limitmenu,)].set_active(other)
+		self.confirmed_limits = (self.recv_limit, self.send_limit)
+		self.update_speed_limit_menus()
 		
 		if config["options"]["urAccepted"] == 0:
 			# User did not responded to usage reporting yet. Ask
@@ -838,6 +929,26 @@ class App(Gtk.Application, TimerManager):
 				self.config.save()
 				log.info("Filesystem watcher configuration migrated")
 	
+	def cb_schedule_rule_applied(self, scheduler, rule):
+		self.recv_limit = rule.get("maxRecvKbps", self.recv_limit)
+		self.send_limit = rule.get("maxSendKbps", self.send_limit)
+		self.confirmed_limits = (self.recv_limit, self.send_limit)
+		self.update_speed_limit_menus()
+	
+	def update_speed_limit_menus(self):
+		""" Checks status icon menu items matching current speed limits """
+		L_MEV = [("menu-si-sendlimit", self.send_limit),
+				 ("menu-si-recvlimit", self.recv_limit)]
+		
+		for limitmenu, value in L_MEV:
+			other = True
+			for speed in [0] + SPEED_LIMIT_VALUES:
+				menuitem = self["%s-%s" % (limitmenu, speed)]
+				menuitem.set_active(speed == value)
+				if speed == value:
+					other = False
+			self["%s-other" % (limitmenu,)].set_active(other)
+	
 	def cb_syncthing_error(self, daemon, message):
 		""" Handles errors reported by syncthing daemon """
 		# Daemon argument is not used
@@ -980,11 +1091,29 @@ class App(Gtk.Application, TimerManager):
 				device["announce"] = "%s/%s" % (d_total - d_failed, d_total)
 	
 	def cb_syncthing_device_added(self, daemon, nid, name, used, data):
-		self.show_device(nid, name,
+		box = self.show_device(nid, name,
 			data["compression"],
 			data["introducer"] if "introducer" in data else False,
 			used
 		)
+		# Box is insensitive if data comes from snapshot
+		box.set_sensitive(daemon.is_connected())
+		self.stale_boxes.discard(box)
+	
+	def cb_syncthing_device_changed(self, daemon, nid, name, used, data, changed):
+		if len(changed & DEVICE_DISPLAYED_KEYS) == 0:
+			# Nothing that's displayed
+			return
+		self.cb_syncthing_device_added(daemon, nid, name, used, data)
+		if "name" in changed:
+			# Device title is displayed in folders shared with it
+			for rid in self.folders:
+				if self.devices[nid] in self.folders[rid]["devices"]:
+					self.folders[rid].set_value("shared", ", ".join([
+						n.get_title() for n in self.folders[rid]["devices"] ]))
+	
+	def cb_syncthing_device_removed(self, daemon, nid):
+		self.remove_box(self.devices, nid)
 	
 	def cb_syncthing_device_data_changed(self, daemon, nid, address, client_version,
 			inbps, outbps, inbytes, outbytes):
@@ -1059,7 +1188,7 @@ class App(Gtk.Application, TimerManager):
 				device.set_status(_("Up to Date"))
 	
 	def cb_syncthing_folder_added(self, daemon, rid, r):
-		self.show_folder(
+		box = self.show_folder(
 			rid, r["label"], r["path"],
 			r["type"],
 			r["ignorePerms"], 
@@ -1070,6 +1199,18 @@ class App(Gtk.Application, TimerManager):
 				key=lambda x : x.get_title().lower()
 				)
 			)
+		# Box is insensitive if data comes from snapshot
+		box.set_sensitive(daemon.is_connected())
+		self.stale_boxes.discard(box)
+		self.daemon.set_folder_visible(rid, self.is_visible() and box.is_open())
+	
+	def cb_syncthing_folder_changed(self, daemon, rid, r, changed):
+		if len(changed & FOLDER_DISPLAYED_KEYS) > 0:
+			self.cb_syncthing_folder_added(daemon, rid, r)
+	
+	def cb_syncthing_folder_removed(self, daemon, rid):
+		self.remove_box(self.folders, rid)
+		self.daemon.set_folder_visible(rid, False)
 	
 	def cb_syncthing_folder_data_changed(self, daemon, rid, data):
 		if rid in self.folders:	# Should be always
@@ -1275,6 +1416,18 @@ class App(Gtk.Application, TimerManager):
 		""" Returns True if main window is visible """
 		return self["window"].is_visible()
 	
+	def update_visible_folders(self):
+		"""
+		Tells daemon which folders are expanded in visible window, so
+		their data can be requested first.
+		"""
+		if self.daemon is None:
+			return
+		if self.is_visible():
+			self.daemon.set_visible_folders([ rid for rid in self.folders if self.folders[rid].is_open() ])
+		else:
+			self.daemon.set_visible_folders([])
+	
 	def show(self):
 		"""
 		Shows main window or brings it to front, if is already visible.
@@ -1298,6 +1451,7 @@ class App(Gtk.Application, TimerManager):
 		else:
 			self["window"].present()
 		self["menu-si-show"].set_label(_("Hide Window"))
+		self.update_visible_folders()
 	
 	def hide(self):
 		""" Hides main windows and 'Connecting' dialog, if displayed """
@@ -1314,6 +1468,7 @@ class App(Gtk.Application, TimerManager):
 		self["menu-si-show"].set_label(_("Show Window"))
 		if not self.daemon is None:
 			self.daemon.set_refresh_interval(REFRESH_INTERVAL_TRAY)
+			self.daemon.set_visible_folders([])
 	
 	def display_connect_dialog(self, message, quit_button=True):
 		"""
@@ -1424,12 +1579,8 @@ class App(Gtk.Application, TimerManager):
 			box.add_value("rescan",			"rescan.svg",	_("Rescan Interval"))
 			box.add_value("shared",			"shared.svg",	_("Shared With"))
 			# Add hidden stuff
-			box.add_hidden_value("folder_type_s", folder_type)
 			box.add_hidden_value("override_title", "")
 			box.add_hidden_value("can_override", False)
-			box.add_hidden_value("devices", shared)
-			box.add_hidden_value("norm_path", os.path.abspath(os.path.expanduser(path)))
-			box.add_hidden_value("label", label)
 			# Setup display & signal
 			box.set_status("Unknown")
 			if not self.dark_color is None:
@@ -1446,6 +1597,10 @@ class App(Gtk.Application, TimerManager):
 			self.folders[id] = box
 			self.folders_never_loaded = False
 		# Set values
+		box.set_value("folder_type_s",	folder_type)
+		box.set_value("devices",		shared)
+		box.set_value("norm_path",		os.path.abspath(os.path.expanduser(path)))
+		box.set_value("label",			label)
 		box.set_value("id",		id)
 		box.set_value("path",	display_path)
 		if folder_type == "receiveonly":
@@ -1475,6 +1630,7 @@ class App(Gtk.Application, TimerManager):
 			box.set_title(name)
 		else:
 			# Create new box
+			from syncthing_gtk.identicon import IdentIcon
 			box = InfoBox(self, name, IdentIcon(id))
 			# Add visible lines
 			box.add_value("address",	"address.svg",	_("Address"),			None)
@@ -1509,9 +1665,17 @@ class App(Gtk.Application, TimerManager):
 		elif compression in (False, "never"): box.set_value("compress", _("Off"))
 		else: box.set_value("compress", _("Metadata Only"))
 		box.set_value("introducer",	_("Yes") if introducer else _("No"))
-		box.set_value('last-seen',	_("Never"))
 		return box
 	
+	def remove_box(self, boxes, id):
+		""" Removes folder or device box from boxes dict and from window """
+		if id in boxes:
+			box = boxes.pop(id)
+			if box.get_parent() is not None:
+				box.get_parent().remove(box)
+			self.stale_boxes.discard(box)
+			box.destroy()
+	
 	def clear(self):
 		""" Clears folder and device lists. """
 		for i in ('devicelist', 'folderlist'):
@@ -1556,15 +1720,14 @@ class App(Gtk.Application, TimerManager):
 		Asynchronously changes one value in daemon configuration and
 		optionally restarts daemon.
 		
-		This will:
-		 - call daemon.read_config() to read configuration from daemon
-		 - change value in received YAML document
-		 - call daemon.write_config() to post configuration back
-		 - call daemon.restart()
-		Everthing will be done asynchronously and will be repeated
-		until succeed, if retry_on_error is set to True.
-		Even if retry_on_error is False, error in write_config will
-		be only logged.
+		All changes requested before main loop gets to run again are
+		collected into one Daemon.transaction(), so configuration is
+		read from and posted back to daemon only once. Daemon is then
+		restarted only if restart was requested for any of them and
+		daemon reports that new configuration can't be used without it.
+		Everthing will be done asynchronously and, if retry_on_error
+		is set to True, repeated few times if communication with daemon
+		fails.
 		
 		It is possible to change nested setting using '/' as separator.
 		That may cause error if parent setting node is not present and
@@ -1574,64 +1737,55 @@ class App(Gtk.Application, TimerManager):
 		In such case, callable is called as:
 		   value(config_node_as_dict, setting_name)
 		"""
-		# ^^ Longest comment in entire project
-		
-		# Callbacks
-		def csnr_error(e, trash, setting_name, value, retry_on_error):
-			"""
-			Error handler for change_setting_async method
-			"""
-			log.error("change_setting_async: Failed to read configuration: %s", e)
-			if retry_on_error:
-				log.error("Retrying...")
-				self.change_setting_async(setting_name, value, retry_on_error, restart)
-			else:
-				log.error("Giving up.")
+		if self.pending_settings is None:
+			self.pending_settings = self.daemon.transaction()
+			self.pending_settings_flags = set()
+			GLib.idle_add(self.commit_settings)
+		self.pending_settings.set(setting_name, value)
+		if retry_on_error:
+			self.pending_settings_flags.add("retry")
+		if restart:
+			self.pending_settings_flags.add("restart")
+	
+	def commit_settings(self, *a):
+		""" Writes changes collected by change_setting_async """
+		transaction, flags = self.pending_settings, self.pending_settings_flags
+		self.pending_settings, self.pending_settings_flags = None, None
 		
-		def csnr_save_error(e, *a):
-			"""
-			Another error handler for change_setting_async method.
-			This one just reports failure.
-			"""
-			log.error("change_setting_async: Failed to store configuration: %s", e)
-			log.error("Giving up.")
+		def cs_retry(transaction, flags, attempt):
+			transaction.commit(cs_done, cs_error, transaction, flags, attempt)
+			return False
 		
-		def csnr_config_read(config, setting_name, value, retry_on_error):
-			"""
-			Handler for change_setting_async
-			Modifies received config and post it back.
-			"""
-			c, setting = config, setting_name
-			while "/" in setting:
-				key, setting = setting.split("/", 1)
-				c = c[key]
-			if hasattr(value, '__call__'):
-				value(c, setting)
+		def cs_error(e, transaction, flags, attempt):
+			log.error("change_setting_async: Failed to change configuration: %s", e)
+			if isinstance(e, ConfigChangeException):
+				# Change can't be applied, retrying would fail again
+				log.error("Giving up.")
+			elif "retry" in flags and attempt < SETTINGS_RETRY_COUNT:
+				log.error("Retrying in %ss...", SETTINGS_RETRY_DELAY)
+				self.timer(None, SETTINGS_RETRY_DELAY, cs_retry, transaction, flags, attempt + 1)
 			else:
-				c[setting] = value
-			self.daemon.write_config(config, csnr_config_saved, csnr_save_error, setting_name, value)
+				log.error("Giving up.")
 		
-		def csnr_config_saved(setting_name, value):
-			"""
-			Handler for change_setting_async
-			Reports good stuff and restarts daemon.
-			"""
-			log.verbose("Configuration value '%s' set to '%s'", setting_name, value)
-			if restart:
+		def cs_done(changed, restart_needed, transaction, flags, attempt):
+			if restart_needed and "restart" in flags:
 				message = "%s %s..." % (_("Syncthing is restarting."), _("Please wait"))
 				self.display_connect_dialog(message)
 				self.set_status(False)
 				self.restart()
 				GLib.idle_add(self.daemon.restart)
 		
-		# Call
-		self.daemon.read_config(csnr_config_read, csnr_error, setting_name, value, retry_on_error)
+		if transaction is not None:
+			transaction.commit(cs_done, cs_error, transaction, flags, 0)
+		return False
 	
 	def add_ignored(self, ignore_type, value):
 		def cb(target, trash):
 			if ignore_type not in target:
 				target[ignore_type] = []
-			target[ignore_type].append(value)
+			if value not in target[ignore_type]:
+				# May be already there if retried write went through
+				target[ignore_type].append(value)
 		self.change_setting_async(ignore_type, cb, restart=False)
 	
 	def quit(self, *a):
@@ -1660,8 +1814,19 @@ class App(Gtk.Application, TimerManager):
 			elif self.config["autokill_daemon"] == 1: # Yes
 				self.process.terminate()
 				self.process = None
+		if self.dump_stats:
+			self.print_statistics()
+		if not self.daemon is None:
+			# Saves pending snapshot
+			self.daemon.close()
 		Gtk.Application.quit(self)
 	
+	def print_statistics(self):
+		""" Prints connection statistics to stdout """
+		if not self.daemon is None:
+			print("\n".join(self.daemon.get_statistics().get_lines()))
+			sys.stdout.flush()
+	
 	def show_add_folder_dialog(self, path=None):
 		"""
 		Waits for daemon to connect and shows 'add folder' dialog,
@@ -1673,6 +1838,7 @@ class App(Gtk.Application, TimerManager):
 			if not handler_id is None:
 				self.daemon.handler_disconnect(handler_id)
 			self.show()
+			from syncthing_gtk.foldereditor import FolderEditorDialog
 			e = FolderEditorDialog(self, True, None, path)
 			e.call_after_loaded(e.fill_folder_id, generate_folder_id(), False)
 			e.load()
@@ -1798,11 +1964,33 @@ class App(Gtk.Application, TimerManager):
 	
 	def cb_menu_recvlimit(self, menuitem, speed=0):
 		if menuitem.get_active() and self.recv_limit != speed:
-			self.change_setting_async("options/maxRecvKbps", speed)
+			self.recv_limit = speed
+			self.timer("speed-limits", SPEED_LIMIT_DELAY, self.apply_speed_limits)
 	
 	def cb_menu_sendlimit(self, menuitem, speed=0):
 		if menuitem.get_active() and self.send_limit != speed:
-			self.change_setting_async("options/maxSendKbps", speed)
+			self.send_limit = speed
+			self.timer("speed-limits", SPEED_LIMIT_DELAY, self.apply_speed_limits)
+	
+	def apply_speed_limits(self):
+		"""
+		Sends speed limits selected in menu to daemon. Daemon uses new
+		limits without restart, so nothing is reloaded. If that fails,
+		menu is switched back to limits last confirmed by daemon.
+		"""
+		limits = (self.recv_limit, self.send_limit)
+		def cb_applied(changed, restart_needed):
+			self.confirmed_limits = limits
+		def cb_failed(e):
+			log.error("Failed to change speed limits: %s", e)
+			if (self.recv_limit, self.send_limit) == limits:
+				# Not changed again in meanwhile
+				self.recv_limit, self.send_limit = self.confirmed_limits
+				self.update_speed_limit_menus()
+		self.daemon.transaction() \
+			.set("options/maxRecvKbps", self.recv_limit) \
+			.set("options/maxSendKbps", self.send_limit) \
+			.commit(cb_applied, cb_failed)
 	
 	def cb_menu_recvlimit_other(self, menuitem):
 		return self.cb_menu_limit_other(menuitem, self.recv_limit)
@@ -1859,6 +2047,7 @@ class App(Gtk.Application, TimerManager):
 	def cb_menu_popup_edit_folder(self, *a):
 		""" Handler for 'edit' context menu item """
 		# Editing folder
+		from syncthing_gtk.foldereditor import FolderEditorDialog
 		self.open_editor(FolderEditorDialog, self.rightclick_box["id"])
 	
 	def cb_menu_popup_edit_ignored(self, *a):
@@ -1879,6 +2068,20 @@ class App(Gtk.Application, TimerManager):
 	def cb_menu_popup_browse_folder(self, *a):
 		""" Handler for 'browse' folder context menu item """
 		self.cb_browse_folder(self.rightclick_box)
+	
+	def cb_menu_popup_need_folder(self, *a):
+		""" Handler for 'out of sync items' folder context menu item """
+		from syncthing_gtk.needbrowser import NeedBrowser
+		b = NeedBrowser(self, self.rightclick_box["id"], self.rightclick_box.get_title())
+		b.load()
+		b.show(self["window"])
+	
+	def cb_menu_popup_index_folder(self, *a):
+		""" Handler for 'browse index' folder context menu item """
+		from syncthing_gtk.indexbrowser import IndexBrowser
+		b = IndexBrowser(self, self.rightclick_box["id"], self.rightclick_box.get_title())
+		b.load()
+		b.show(self["window"])
 		
 	def cb_browse_folder(self, box, *a):
 		""" Handler for 'browse' action """
@@ -1956,12 +2159,10 @@ class App(Gtk.Application, TimerManager):
 		"""
 		if mode == "folder":
 			config["folders"] = [ x for x in config["folders"] if x["id"] != id ]
-			if id in self.folders:
-				self.folders[id].get_parent().remove(self.folders[id])
+			self.remove_box(self.folders, id)
 		else: # device
 			config["devices"] = [ x for x in config["devices"] if x["deviceID"] != id ]
-			if id in self.devices:
-				self.devices[id].get_parent().remove(self.devices[id])
+			self.remove_box(self.devices, id)
 		self.daemon.write_config(config, lambda *a: a)
 	
 	def open_editor(self, cls, id):
@@ -1974,6 +2175,7 @@ class App(Gtk.Application, TimerManager):
 		if self.editor_device:
 			self.editor_device.close()
 
+		from syncthing_gtk.deviceeditor import DeviceEditorDialog
 		self.editor_device = DeviceEditorDialog(self, id not in self.devices, id)
 
 		if name and id not in self.devices:
@@ -1986,6 +2188,7 @@ class App(Gtk.Application, TimerManager):
 		if self.editor_folder:
 			self.editor_folder.close()
 
+		from syncthing_gtk.foldereditor import FolderEditorDialog
 		self.editor_folder = FolderEditorDialog(self, id not in self.folders, id)
 
 		# Find folder with matching ID ...
@@ -2026,14 +2229,26 @@ class App(Gtk.Application, TimerManager):
 	
 	def cb_menu_webui(self, *a):
 		""" Handler for 'Open WebUI' menu item """
+		import webbrowser
 		log.info("Opening '%s' in browser", self.daemon.get_webui_url())
 		webbrowser.open(self.daemon.get_webui_url())
 	
 	def cb_menu_daemon_output(self, *a):
 		if self.process != None:
+			from syncthing_gtk.daemonoutputdialog import DaemonOutputDialog
 			d = DaemonOutputDialog(self, self.process)
 			d.show(None)
 	
+	def cb_menu_statistics(self, *a):
+		if self.daemon != None:
+			from syncthing_gtk.daemonoutputdialog import DaemonOutputDialog
+			d = DaemonOutputDialog(self, None)
+			if hasattr(d["tvOutput"], "set_monospace"):
+				# Gtk 3.16 and newer; Statistics are formatted as table
+				d["tvOutput"].set_monospace(True)
+			d.show_with_lines(self.daemon.get_statistics().get_lines(),
+				self["window"], _("Connection Statistics"))
+	
 	def cb_statusicon_click(self, *a):
 		""" Called when user clicks on status icon """
 		# Hide / show main window
@@ -2093,6 +2308,8 @@ class App(Gtk.Application, TimerManager):
 			self.open_boxes.add(box["id"])
 		else:
 			self.open_boxes.discard(box["id"])
+		if box["id"] in self.folders:
+			self.daemon.set_folder_visible(box["id"], box.is_open())
 	
 	def cb_connect_dialog_response(self, dialog, response, checkbox):
 		# Common for 'Daemon is not running' and 'Connecting to daemon...'
@@ -2144,7 +2361,7 @@ class App(Gtk.Application, TimerManager):
 				self.cb_daemon_startup_failed(proc, "Daemon exits too fast")
 				return
 			self.last_restart_time = time.time()
-			if not StDownloader is None and self.config["st_autoupdate"] and os.path.exists(self.config["syncthing_binary"] + ".new"):
+			if HAS_STDOWNLOADER and self.config["st_autoupdate"] and os.path.exists(self.config["syncthing_binary"] + ".new"):
 				# New daemon version is downloaded and ready to use.
 				# Switch to this version before restarting
 				self.swap_updated_binary()
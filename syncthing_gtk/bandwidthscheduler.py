@@ -0,0 +1,177 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - BandwidthScheduler
+
+Changes daemon speed limits and pauses or resumes devices at configured
+times of day. Schedule is stored in 'bandwidth_schedule' configuration
+key as JSON-encoded list of rules, for example:
+
+	[
+		{ "time" : "08:00", "days" : [0, 1, 2, 3, 4],
+		  "maxRecvKbps" : 500, "maxSendKbps" : 100,
+		  "pause" : [ "DEVICE-ID" ] },
+		{ "time" : "18:00", "maxRecvKbps" : 0, "maxSendKbps" : 0 }
+	]
+
+Rule becomes active at its 'time' on listed 'days' (0 is Monday, every
+day if not specified) and stays active until next rule starts. Limit
+missing in rule is left as it is. Every device listed in 'pause' of any
+rule is paused while rule that lists it is active and resumed otherwise.
+
+Changes are written with single config transaction and daemon is not
+restarted, as it applies both limits and pausing immediately.
+"""
+
+from __future__ import unicode_literals
+from gi.repository import GObject
+from syncthing_gtk.timermanager import TimerManager
+from datetime import datetime, timedelta
+import json, logging
+log = logging.getLogger("BandwidthScheduler")
+
+LIMITS = ("maxRecvKbps", "maxSendKbps")
+WEEK = range(0, 7)
+
+class BandwidthScheduler(GObject.GObject, TimerManager):
+	"""
+	Applies active rule when daemon connects, unless it was already
+	applied, and then sleeps until next rule starts. Timer is not woken
+	in meanwhile, so if computer is suspended over rule boundary, rule
+	is applied after it wakes up and daemon reconnects.
+
+	Signals:
+		rule-applied (rule)
+			Emitted after daemon configuration is changed by rule
+				rule:	dict with applied rule
+	"""
+
+	__gsignals__ = {
+		b"rule-applied"	: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
+	}
+
+	def __init__(self, daemon, rules):
+		GObject.GObject.__init__(self)
+		TimerManager.__init__(self)
+		self.daemon = daemon
+		self.rules = []
+		for rule in rules:
+			try:
+				self.rules.append(parse_rule(rule))
+			except (KeyError, ValueError, TypeError) as e:
+				log.error("Ignoring invalid schedule rule %s: %s", rule, e)
+		# Devices listed in any rule; Only those are paused and resumed
+		self.managed_devices = set([])
+		for (days, t, rule) in self.rules:
+			self.managed_devices.update(rule.get("pause", []))
+		# Start of last successfully applied rule. Rule is not applied
+		# again when daemon reconnects, so limits changed by user in
+		# meanwhile are kept until next rule starts
+		self.applied = None
+		self.daemon.connect("connected", self.cb_connected)
+		self.daemon.connect("disconnected", self.cb_disconnected)
+
+	def cb_connected(self, *a):
+		self.apply()
+
+	def cb_disconnected(self, *a):
+		self.cancel_timer("schedule")
+
+	def get_active_rule(self, now=None):
+		""" Returns rule active at specified time or None if there are no rules """
+		return self._get_active(now)[0]
+
+	def _get_active(self, now=None):
+		""" Returns (rule, start) tuple of rule active at specified time """
+		now = now or datetime.now()
+		best, best_start = None, None
+		for (days, t, rule) in self.rules:
+			start = last_occurrence(days, t, now)
+			if best_start is None or start > best_start:
+				best, best_start = rule, start
+		return best, best_start
+
+	def get_next_change(self, now=None):
+		""" Returns datetime when next rule starts or None if there are no rules """
+		now = now or datetime.now()
+		changes = [ next_occurrence(days, t, now) for (days, t, rule) in self.rules ]
+		return min(changes) if changes else None
+
+	def apply(self):
+		""" Applies rule active right now and schedules next change """
+		rule, start = self._get_active()
+		if rule is None:
+			return
+		if start != self.applied:
+			paused = set(rule.get("pause", []))
+			def set_paused(config, key):
+				for device in config[key]:
+					if device["deviceID"] in self.managed_devices:
+						device["paused"] = device["deviceID"] in paused
+
+			transaction = self.daemon.transaction()
+			for key in LIMITS:
+				if key in rule:
+					transaction.set("options/%s" % (key,), rule[key])
+			if len(self.managed_devices):
+				transaction.set("devices", set_paused)
+			transaction.commit(self.cb_applied, self.cb_failed, rule, start)
+
+		next_change = self.get_next_change()
+		delay = (next_change - datetime.now()).total_seconds()
+		log.debug("Next schedule change at %s", next_change)
+		self.timer("schedule", max(1, int(delay) + 1), self.apply)
+
+	def cb_applied(self, changed, restart_needed, rule, start):
+		self.applied = start
+		if changed:
+			log.info("Applied schedule rule starting at %s", rule["time"])
+			self.emit("rule-applied", rule)
+
+	def cb_failed(self, exception, rule, start):
+		log.error("Failed to apply schedule rule starting at %s: %s", rule["time"], exception)
+
+def parse_schedule(text):
+	""" Returns list of rules decoded from configuration value, or empty list on error """
+	try:
+		rules = json.loads(text)
+	except ValueError as e:
+		log.error("Ignoring invalid schedule: %s", e)
+		return []
+	if type(rules) != list:
+		log.error("Ignoring invalid schedule: list of rules expected")
+		return []
+	return rules
+
+def parse_rule(rule):
+	"""
+	Returns (days, time, rule) tuple, where days is list of weekdays
+	and time is (hour, minute) tuple.
+	"""
+	hour, minute = [ int(x) for x in rule["time"].split(":") ]
+	if hour not in range(0, 24) or minute not in range(0, 60):
+		raise ValueError("time out of range")
+	days = rule.get("days", WEEK)
+	if len(days) == 0:
+		raise ValueError("no days specified")
+	for day in days:
+		if day not in WEEK:
+			raise ValueError("invalid day %s" % (day,))
+	return days, (hour, minute), rule
+
+def last_occurrence(days, t, now):
+	""" Returns last datetime not after 'now' that is on one of 'days' at 't' """
+	for i in range(0, 8):
+		d = now - timedelta(days=i)
+		d = d.replace(hour=t[0], minute=t[1], second=0, microsecond=0)
+		if d.weekday() in days and d <= now:
+			return d
+	return None
+
+def next_occurrence(days, t, now):
+	""" Returns first datetime after 'now' that is on one of 'days' at 't' """
+	for i in range(0, 8):
+		d = now + timedelta(days=i)
+		d = d.replace(hour=t[0], minute=t[1], second=0, microsecond=0)
+		if d.weekday() in days and d > now:
+			return d
+	return None
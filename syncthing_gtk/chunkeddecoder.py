@@ -0,0 +1,98 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - ChunkedDecoder
+
+Incremental decoder for HTTP response bodies sent with chunked
+transfer encoding. Data is fed in as it's read from socket, in blocks of
+any size, and every byte is parsed only once.
+"""
+
+from __future__ import unicode_literals
+
+# Longest chunk header or trailer line accepted
+MAX_LINE = 4096
+
+class ChunkedDecoder(object):
+	"""
+	Feed data with feed() until it returns True, then take decoded
+	body with body(). Raises InvalidChunkException if data is not
+	valid chunked encoding.
+	
+	Chunk data is copied from received blocks directly to body buffer,
+	so only short header lines are ever kept between feeds.
+	"""
+	def __init__(self):
+		self._body = bytearray()
+		self._line = b""		# Incomplete header line from previous feed
+		self._size = -1			# Remaining data of current chunk, -1 while reading chunk header
+		self._crlf = False		# Set while reading \r\n after chunk data
+		self._last = False		# Set after zero-sized chunk, while reading trailer
+		self._rest = []
+		self.complete = False
+
+	def feed(self, data):
+		"""
+		Decodes received data. Returns True when entire body has
+		been received.
+		"""
+		if self.complete:
+			# Data after end of response, stored for rest()
+			self._rest.append(data)
+			return True
+		view, pos = memoryview(data), 0
+		while pos < len(data):
+			if self._size > 0:
+				# Chunk data
+				count = min(self._size, len(data) - pos)
+				self._body += view[pos:pos + count]
+				pos += count
+				self._size -= count
+				if self._size == 0:
+					self._size, self._crlf = -1, True
+				continue
+			eol = data.find(b"\n", pos)
+			if eol < 0:
+				self._line += data[pos:]
+				if len(self._line) > MAX_LINE:
+					raise InvalidChunkException(self._line[0:32])
+				break
+			line, self._line = (self._line + data[pos:eol]).rstrip(b"\r"), b""
+			pos = eol + 1
+			if self._crlf:
+				# End of chunk data
+				if len(line) > 0:
+					raise InvalidChunkException(line[0:32])
+				self._crlf = False
+			elif self._last:
+				# Trailer; Skip header lines until empty one
+				if len(line) == 0:
+					self.complete = True
+					self._rest.append(data[pos:])
+					break
+			else:
+				# Chunk header
+				try:
+					self._size = int(line.split(b";", 1)[0].strip(), 16)
+				except ValueError:
+					raise InvalidChunkException(line)
+				if self._size < 0:
+					raise InvalidChunkException(line)
+				if self._size == 0:
+					self._last = True
+		return self.complete
+
+	def body(self):
+		"""
+		Returns decoded body. If called before entire body is received,
+		returns what was decoded so far.
+		"""
+		return bytes(self._body)
+
+	def rest(self):
+		""" Returns data received after end of body """
+		return b"".join(self._rest)
+
+
+class InvalidChunkException(ValueError):
+	def __init__(self, line):
+		ValueError.__init__(self, "Invalid chunk size: %r" % (line,))
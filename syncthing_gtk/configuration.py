@@ -43,6 +43,8 @@ class _Configuration(object):
 		"st_autoupdate"				: (bool, False),
 		"last_updatecheck"			: (datetime, LONG_AGO),
 		"window_position"			: (tuple, None),
+		"bandwidth_schedule"		: (str, "[]"),	# JSON, see bandwidthscheduler.py
+		"max_requests"				: (int, 4),	# REST requests sent to daemon at once
 		"infobox_style"				: (str, 'font_weight="bold" font_size="large"'),
 		"icon_theme"				: (str, 'syncthing'),
 		"force_dark_theme"			: (bool, False),	# Windows-only
@@ -140,6 +142,9 @@ class _Configuration(object):
 					elif tp == bool and type(self.values[key]) in (int, long):
 						# Convert bools
 						self.values[key] = bool(self.values[key])
+					elif key == "bandwidth_schedule" and type(self.values[key]) == list:
+						# Stored as list by older versions
+						self.values[key] = json.dumps(self.values[key])
 				except Exception as e:
 					log.warning("Failed to parse configuration value '%s'. Using default.", key)
 					log.warning(e)
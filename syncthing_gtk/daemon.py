@@ -13,9 +13,15 @@ from gi.repository import Gio, GLib, GObject
 from syncthing_gtk.timermanager import TimerManager
 from syncthing_gtk.tools import parsetime, get_header, compare_version
 from syncthing_gtk.tools import get_config_dir
+from syncthing_gtk.chunkeddecoder import ChunkedDecoder
+from syncthing_gtk.snapshot import Snapshot
+from syncthing_gtk.ratehistory import RateHistory
+from syncthing_gtk.statistics import Statistics
+from syncthing_gtk.eventrecorder import EventRecorder
 from dateutil import tz
-from xml.dom import minidom
+from xml.etree import cElementTree as ElementTree
 from datetime import datetime
+from collections import deque
 import json, os, sys, time, logging, urllib
 log = logging.getLogger("Daemon")
 
@@ -26,9 +32,82 @@ MIN_VERSION = "0.14"
 # REST requests; Anything goes, as long as it isn't string
 HTTP_HEADERS = int(65513)
 
+# Delay between change of daemon config.xml on disk and reading it
+# again; Daemon writes file in more steps
+CONFIG_FILE_DELAY = 1
+
 # Last-seen values before this date are translated to never
 NEVER = datetime(1971, 1, 1, 1, 1, 1, tzinfo=tz.tzlocal())
 
+# Maximum number of persistent connections kept open to daemon for
+# REST requests, i.e. maximum number of requests in flight. Can be changed
+# by Daemon.set_max_requests; UI sets it from 'max_requests' configuration
+# key. Event polling uses its own, additional connection.
+POOL_SIZE = 4
+
+# Size of block requested by every read from daemon connection
+READ_SIZE = 256 * 1024
+
+# GUI address starting with this is path to unix socket
+UNIX_PREFIX = "unix://"
+
+# Priority classes for REST requests. When there is more requests than
+# free connections, waiting requests are started in this order.
+PRIORITY_USER		= 0		# Actions requested by user (rescan, pause, config writes)
+PRIORITY_VISIBLE	= 1		# Data currently displayed to user
+PRIORITY_BACKGROUND	= 2		# Periodic polls and data nobody is looking at
+PRIORITIES = (PRIORITY_USER, PRIORITY_VISIBLE, PRIORITY_BACKGROUND)
+
+# Maps event types to signals that may be emitted when event is received.
+# Event type is requested from daemon only if some of its signals has
+# handler connected.
+EVENT_SIGNALS = {
+	"StartupComplete"		: ("startup-complete",),
+	"DeviceConnected"		: ("device-connected",),
+	"DeviceDisconnected"	: ("device-disconnected",),
+	"DeviceDiscovered"		: ("device-discovered",),
+	"DevicePaused"			: ("device-paused",),
+	"DeviceResumed"			: ("device-resumed", "last-seen-changed"),
+	"FolderRejected"		: ("folder-rejected",),
+	"DeviceRejected"		: ("device-rejected",),
+	"FolderScanProgress"	: ("folder-scan-progress",),
+	"ItemStarted"			: ("item-started",),
+	"ItemFinished"			: ("item-updated",),
+	"FolderCompletion"		: ("device-sync-started", "device-sync-progress", "device-sync-finished",
+								"folder-completion"),
+	"FolderErrors"			: ("folder-error",),
+	"ConfigSaved"			: ("config-saved",),
+	"LocalIndexUpdated"		: ("folder-data-changed", "folder-index-updated"),
+	"RemoteIndexUpdated"	: ("folder-data-changed", "folder-index-updated"),
+}
+# Event types that are always requested, as Daemon needs them to keep
+# track of folder states and to know when to repeat periodic requests
+INTERNAL_EVENTS = ("StateChanged", "FolderSummary",
+	"DeviceConnected", "DeviceDisconnected", "FolderErrors")
+
+# Periodic requests (system/status, system/connections, system/error)
+# are repeated after refresh interval multiplied by POLL_ACTIVE while
+# something is transferred and by POLL_NORMAL otherwise. Every poll
+# during which no event was received doubles the delay, up to
+# POLL_BACKOFF times.
+POLL_ACTIVE		= 2
+POLL_NORMAL		= 5
+POLL_BACKOFF	= 3
+
+# When folder content changes, its status (db/status) is requested again
+# after this many seconds. Changes in meanwhile are covered by same request.
+FOLDER_REFRESH_DELAY = 5
+
+# Snapshot of last known data is saved at most once per this many seconds
+SNAPSHOT_DELAY = 10
+
+# Number of items in one page of out of sync items (db/need)
+NEED_PAGE_SIZE = 100
+
+# Folder status values counting out of sync items. Cached pages of
+# db/need are thrown away when any of those changes.
+NEED_TOTALS = ("needFiles", "needDirectories", "needSymlinks", "needDeletes", "needBytes")
+
 class Daemon(GObject.GObject, TimerManager):
 	"""
 	Object for interacting with syncthing daemon.
@@ -102,6 +181,21 @@ class Daemon(GObject.GObject, TimerManager):
 				used:	true if there is any folder shared with this device
 				data:	dict with rest of device data
 		
+		device-changed (id, name, used, data, changed)
+			Emitted when configuration is reloaded and device settings
+			differ from previously loaded ones
+				id:			id of changed device
+				name:		name of device (may be None)
+				used:		true if there is any folder shared with this device
+				data:		dict with rest of device data
+				changed:	set of changed keys in data; Contains 'used'
+							if device stopped or started to be used
+		
+		device-removed (id)
+			Emitted when configuration is reloaded and device is no
+			longer in it
+				id:		id of removed device
+		
 		device-connected (id)
 			Emitted when daemon connects to remote device
 				id:			id of device
@@ -120,8 +214,8 @@ class Daemon(GObject.GObject, TimerManager):
 				id:			id of device
 				address:	address of remote device
 				version:	daemon version of remote device
-				inbps:		download rate
-				outbps:	upload rate
+				inbps:		download rate, smoothed (see get_smoothed_rate)
+				outbps:	upload rate, smoothed
 				inbytes:	total number of bytes downloaded
 				outbytes:	total number of bytes uploaded
 		
@@ -158,6 +252,31 @@ class Daemon(GObject.GObject, TimerManager):
 				id:		id of loaded folder
 				data:	dict with rest of folder data
 		
+		folder-changed (id, data, changed)
+			Emitted when configuration is reloaded and folder settings
+			differ from previously loaded ones
+				id:			id of changed folder
+				data:		dict with rest of folder data
+				changed:	set of changed keys in data
+		
+		folder-removed (id)
+			Emitted when configuration is reloaded and folder is no
+			longer in it
+				id:		id of removed folder
+		
+		folder-index-updated (id, filenames)
+			Emitted when daemon updates index of folder, after local
+			change or after receiving index from remote device
+				id:			id of folder
+				filenames:	list of changed files or None if not known
+		
+		folder-completion (id, device_id, completion)
+			Emitted when daemon reports how much of folder is
+			synchronized to remote device
+				id:			id of folder
+				device_id:	id of device
+				completion:	percentage, 0.0 to 100.0
+		
 		folder-error (id, errors)
 			Emitted when when a folder cannot be successfully synchronized
 				id:		id of loaded folder
@@ -243,6 +362,8 @@ class Daemon(GObject.GObject, TimerManager):
 		b"device-rejected"		: (GObject.SIGNAL_RUN_FIRST, None, (object,object,object)),
 		b"my-id-changed"		: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
 		b"device-added"			: (GObject.SIGNAL_RUN_FIRST, None, (object, object, bool, object)),
+		b"device-changed"		: (GObject.SIGNAL_RUN_FIRST, None, (object, object, bool, object, object)),
+		b"device-removed"		: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
 		b"device-connected"		: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
 		b"device-disconnected"	: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
 		b"device-discovered"	: (GObject.SIGNAL_RUN_FIRST, None, (object,object,)),
@@ -254,6 +375,10 @@ class Daemon(GObject.GObject, TimerManager):
 		b"device-sync-progress"	: (GObject.SIGNAL_RUN_FIRST, None, (object, float)),
 		b"device-sync-finished"	: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
 		b"folder-added"			: (GObject.SIGNAL_RUN_FIRST, None, (object, object)),
+		b"folder-changed"		: (GObject.SIGNAL_RUN_FIRST, None, (object, object, object)),
+		b"folder-removed"		: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
+		b"folder-index-updated"	: (GObject.SIGNAL_RUN_FIRST, None, (object, object)),
+		b"folder-completion"	: (GObject.SIGNAL_RUN_FIRST, None, (object, object, float)),
 		b"folder-error"			: (GObject.SIGNAL_RUN_FIRST, None, (object, object)),
 		b"folder-data-changed"	: (GObject.SIGNAL_RUN_FIRST, None, (object, object)),
 		b"folder-data-failed"	: (GObject.SIGNAL_RUN_FIRST, None, (object,)),
@@ -282,15 +407,27 @@ class Daemon(GObject.GObject, TimerManager):
 	TLS_UNSUPPORTED	= 4
 	UNKNOWN			= 255
 	
-	def __init__(self, syncthing_configxml=None):
+	def __init__(self, syncthing_configxml=None, snapshot=False):
+		"""
+		If 'snapshot' is True, last known data is periodically saved
+		and can be loaded by load_snapshot() on next start. Only one
+		process should do that.
+		"""
 		GObject.GObject.__init__(self)
 		TimerManager.__init__(self)
 		self._CSRFtoken = None
 		self._address = None
+		self._host = None			# Sent in Host header
+		self._unix_socket = None	# Path, if daemon listens on unix socket
 		self._api_key = None
 		self._connected = False
 		self._refresh_interval = 1 # seconds
 		self._configxml = syncthing_configxml
+		# config_values holds values used from config.xml, so changes
+		# can be detected when file is modified
+		self._config_values = None
+		self._config_monitor = None
+		self._config_overridden = False
 		# syncing_folders holds set of folders that are being synchronized
 		self._syncing_folders = set()
 		# stopped_folders holds set of folders in 'stopped' state
@@ -306,22 +443,79 @@ class Daemon(GObject.GObject, TimerManager):
 		self._device_data = {}
 		# folder_devices stores list of devices assigned to folder
 		self._folder_devices = {}
+		# parsed_config holds (devices, folders, device_folders) from last
+		# loaded configuration, so reload emits only what was changed
+		self._parsed_config = None
 		# last_seen holds last_seen value for each folder, preventing firing
 		# last-seen-changed event with same values twice
 		self._last_seen = {}
+		# visible_folders holds set of folders currently displayed to user.
+		# Data for those are requested with higher priority.
+		self._visible_folders = set()
+		# dirty_folders holds set of folders with changed content and
+		# not yet requested status
+		self._dirty_folders = set()
+		# rate_history holds RateHistory for every device. Totals are
+		# stored under my own ID
+		self._rate_history = {}
+		# need_pages caches pages of db/need response for each folder and
+		# need_totals holds NEED_TOTALS values they were received with
+		self._need_pages = {}
+		self._need_totals = {}
+		# Counters and latency histograms for requests and events
+		self._stats = Statistics()
+		# in_flight maps command to GET request that is waiting for
+		# response. Identical requests started in meanwhile join it
+		# instead of being sent again.
+		self._in_flight = {}
 		# last_error_time is used to discard repeating errors
 		self._last_error_time = None # Time is taken for first event
 		# last_id is id of last event received from daemon
 		self._last_id = 0
+		# polls holds periodic requests waiting for their timer and
+		# poll_state holds (event_count, idle_polls) for each of them
+		self._polls = {}
+		self._poll_state = {}
+		self._event_count = 0
+		self._transferring = False
 		# Epoch is increased when reconnect() method is called; It is
 		# used to discard responses for old REST requests
 		self._epoch = 1
 		self._instance_id = None
 		self._my_id = None
 		self._read_config()
+		self._watch_config()
+		# Pool of keep-alive connections shared by all REST requests
+		self._pool = ConnectionPool(self)
+		# event_types holds event types requested from daemon
+		self._event_types = None
+		self._update_event_types()
+		# Last known data, saved to be displayed on next start
+		self._snapshot = Snapshot()
+		self._save_snapshot = snapshot
+		# If set, received events are written to this EventRecorder
+		self._recorder = None
 	
 	### Internal stuff ###
 	
+	def _update_event_types(self):
+		"""
+		Recomputes set of event types requested from daemon, so events
+		that would be thrown away are not even sent. Change is applied
+		with next event request.
+		"""
+		types = set(INTERNAL_EVENTS)
+		for eType, signals in EVENT_SIGNALS.items():
+			for name in signals:
+				signal_id = GObject.signal_lookup(name, self)
+				if GObject.signal_has_handler_pending(self, signal_id, 0, True):
+					types.add(eType)
+					break
+		types = frozenset(types)
+		if types != self._event_types:
+			self._event_types = types
+			log.verbose("Requesting events: %s", ",".join(sorted(types)))
+	
 	def _read_config(self):
 		# Read syncthing config to get connection url
 		if not self._configxml:
@@ -329,60 +523,100 @@ class Daemon(GObject.GObject, TimerManager):
 		if not os.path.exists(self._configxml) and os.path.exists(os.path.expanduser("~/snap/syncthing/common/syncthing")):
 			# Special case for syncthing in snap package
 			self._configxml = os.path.expanduser("~/snap/syncthing/common/syncthing/config.xml")
-		try:
-			log.debug("Reading syncthing config %s", self._configxml)
-			with open(self._configxml, "r") as f:
-				config = f.read()
-		except Exception as e:
-			raise InvalidConfigurationException("Failed to read daemon configuration: %s" % e)
-		try:
-			xml = minidom.parseString(config)
-		except Exception as e:
-			raise InvalidConfigurationException("Failed to parse daemon configuration: %s" % e)
-		tls = "false"
-		try:
-			tls = xml.getElementsByTagName("configuration")[0] \
-				.getElementsByTagName("gui")[0].getAttribute("tls")
-		except Exception as e:
-			pass
+		self._apply_config(read_gui_config(self._configxml))
+	
+	def _apply_config(self, values):
+		""" Uses values returned by read_gui_config """
+		self._config_values = values
+		self._set_address(values["address"])
 		self._tls = False
 		self._cert = None
-		if tls.lower() == "true":
-			self._tls = True
-			try:
-				self._cert = Gio.TlsCertificate.new_from_file(
-					os.path.join(get_config_dir(), "syncthing", "https-cert.pem"))
-			except Exception as e:
-				log.exception(e)
-				raise TLSErrorException("Failed to load daemon certificate")
+		if values["tls"]:
+			if self._unix_socket:
+				# Unix socket is accessible only locally, daemon doesn't
+				# use TLS on it
+				log.debug("WebUI listens on unix socket, not using TLS")
+			else:
+				self._tls = True
+				try:
+					self._cert = Gio.TlsCertificate.new_from_file(
+						os.path.join(get_config_dir(), "syncthing", "https-cert.pem"))
+				except Exception as e:
+					log.exception(e)
+					raise TLSErrorException("Failed to load daemon certificate")
+		# API key can be none
+		self._api_key = values["apikey"]
+	
+	def _watch_config(self):
+		"""
+		Starts monitoring config.xml, so changes of gui address, API key
+		or TLS setting are picked up without restart.
+		"""
 		try:
-			self._address = xml.getElementsByTagName("configuration")[0] \
-							.getElementsByTagName("gui")[0] \
-							.getElementsByTagName("address")[0] \
-							.firstChild.nodeValue
-			if self._address.startswith("0.0.0.0"):
-				addr, port = self._address.split(":", 1)
-				self._address = "127.0.0.1:%s" % (port,)
-				log.debug("WebUI listens on 0.0.0.0, connecting to 127.0.0.1 instead")
+			self._config_monitor = Gio.File.new_for_path(self._configxml) \
+					.monitor_file(Gio.FileMonitorFlags.NONE, None)
+			self._config_monitor.connect("changed", self._on_config_file_changed)
 		except Exception as e:
-			log.exception(e)
-			raise InvalidConfigurationException("Required configuration node not found in daemon config file")
+			# Not fatal, only changes will not be noticed until restart
+			log.warning("Failed to monitor %s: %s", self._configxml, e)
+			self._config_monitor = None
+	
+	def _on_config_file_changed(self, monitor, f, other_file, event):
+		if event in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED):
+			self.timer("config-file", CONFIG_FILE_DELAY, self._check_config_file)
+	
+	def _check_config_file(self, *a):
+		"""
+		Reads config.xml again and, if connection parameters were changed,
+		starts using new ones. Returns True if there was any change.
+		"""
+		if self._config_overridden or self._config_monitor is None:
+			return False
 		try:
-			self._api_key = xml.getElementsByTagName("configuration")[0] \
-							.getElementsByTagName("gui")[0] \
-							.getElementsByTagName("apikey")[0] \
-							.firstChild.nodeValue
-		except Exception as e:
-			# API key can be none
-			pass
+			values = read_gui_config(self._configxml)
+		except InvalidConfigurationException as e:
+			# File may be in middle of being written
+			log.debug("Failed to re-read daemon config: %s", e)
+			return False
+		if values == self._config_values:
+			return False
+		log.info("Daemon GUI configuration changed, using %s", values["address"])
+		try:
+			self._apply_config(values)
+		except TLSErrorException as e:
+			log.error("%s", e)
+			return False
+		self._pool.clear()
+		if self._connected:
+			self.reconnect()
+		return True
+	
+	def _set_address(self, address):
+		"""
+		Sets address used to connect to daemon. Address is either
+		host:port or unix:///path/to/socket.
+		"""
+		if address.startswith("0.0.0.0"):
+			addr, port = address.split(":", 1)
+			address = "127.0.0.1:%s" % (port,)
+			log.debug("WebUI listens on 0.0.0.0, connecting to 127.0.0.1 instead")
+		self._address = address
+		if address.startswith(UNIX_PREFIX):
+			self._unix_socket = address[len(UNIX_PREFIX):]
+			self._host = "localhost"
+		else:
+			self._unix_socket = None
+			self._host = address
 	
 	def override_config(self, address, api_key):
 		"""
 		Can be used to override settings loaded from config file.
 		api_key can be None.
 		"""
-		self._address = address
-		self.api_key = api_key
+		self._set_address(address)
+		self._api_key = api_key
+		self._config_overridden = True
+		self._pool.clear()
 	
 	def _get_device_data(self, nid):
 		""" Returns dict with device data, creating it if needed """
@@ -394,23 +628,95 @@ class Daemon(GObject.GObject, TimerManager):
 				}
 		return self._device_data[nid]
 	
+	def _schedule_poll(self, name, request):
+		"""
+		Schedules periodic request to be started later, using named timer.
+		Delay depends on what is daemon doing; See POLL_* constants.
+		"""
+		self._polls[name] = request
+		self.timer(name, self._poll_interval(name), self._poll, name)
+	
+	def _poll_interval(self, name):
+		""" Returns delay before periodic request is repeated """
+		events, idle = self._poll_state.get(name, (None, 0))
+		if self._syncing_folders or self._syncing_devices or self._transferring:
+			idle, interval = 0, POLL_ACTIVE
+		else:
+			if events == self._event_count:
+				# Nothing happened since last poll
+				idle = min(idle + 1, POLL_BACKOFF)
+			else:
+				idle = 0
+			interval = POLL_NORMAL * (2 ** idle)
+		self._poll_state[name] = (self._event_count, idle)
+		return self._refresh_interval * interval
+	
+	def _poll(self, name):
+		request = self._polls.pop(name, None)
+		if request is not None:
+			request.start()
+	
+	def _poll_now(self, name):
+		"""
+		Starts scheduled periodic request right now, if there is any.
+		Called when event shows that its result has changed.
+		"""
+		if self.cancel_timer(name):
+			self._poll(name)
+	
 	def _request_config(self, *a):
 		""" Request settings from syncthing daemon """
 		RESTRequest(self, "system/config", self._syncthing_cb_config, self._syncthing_cb_config_error).start()
 	
 	def _request_folder_data(self, folder_id):
 		id_enc = urllib.quote(folder_id.encode('utf-8'))
-		RESTRequest(self, "db/status?folder=%s" % (id_enc,), self._syncthing_cb_folder_data, self._syncthing_cb_folder_data_failed, folder_id).start()
+		priority = PRIORITY_VISIBLE if folder_id in self._visible_folders else PRIORITY_BACKGROUND
+		RESTRequest(self, "db/status?folder=%s" % (id_enc,), self._syncthing_cb_folder_data,
+			self._syncthing_cb_folder_data_failed, folder_id).set_priority(priority).start()
+	
+	def _folder_changed(self, folder_id):
+		"""
+		Marks folder status as outdated. Status is requested again after
+		FOLDER_REFRESH_DELAY, so all changes in meanwhile are covered
+		by single request.
+		"""
+		if not folder_id in self._folder_devices:
+			# Unknown folder
+			return
+		self._dirty_folders.add(folder_id)
+		name = "folder-refresh-%s" % (folder_id,)
+		if not self.timer_active(name):
+			self.timer(name, FOLDER_REFRESH_DELAY, self._refresh_folder, folder_id)
+	
+	def _refresh_folder(self, folder_id):
+		"""
+		Requests status of outdated folder, unless folder is idle and
+		not displayed. Such folder stays marked until it's displayed.
+		"""
+		if not folder_id in self._dirty_folders:
+			return
+		if folder_id in self._visible_folders or folder_id in self._syncing_folders \
+				or folder_id in self._scanning_folders:
+			self._dirty_folders.discard(folder_id)
+			self._request_folder_data(folder_id)
 	
 	def _request_last_seen(self, *a):
 		""" Request 'last seen' values for all devices """
-		RESTRequest(self, "stats/device", self._syncthing_cb_last_seen).ignore_error().start()
+		RESTRequest(self, "stats/device", self._syncthing_cb_last_seen).ignore_error() \
+			.set_priority(PRIORITY_BACKGROUND).start()
 	
-	def _parse_dev_n_folders(self, config):
+	def _parse_dev_n_folders(self, config, snapshot=False):
 		"""
 		Parses devices and folders from configuration and emits
-		associated events.
+		associated events. If snapshot is True, configuration comes
+		from snapshot and only events are emitted.
+		
+		First configuration loaded after connecting is emitted as whole.
+		After that, only changes against previously loaded configuration
+		are emitted, using *-added, *-changed and *-removed signals.
 		"""
+		devices = { n["deviceID"] : n for n in config["devices"] }
+		folders = { r["id"] : r for r in config["folders"] }
 		# Pre-parse folders to detect unused devices
 		device_folders = {}
 		for r in config["folders"]:
@@ -419,21 +725,75 @@ class Daemon(GObject.GObject, TimerManager):
 				nid = n["deviceID"]
 				if not nid in device_folders : device_folders[nid] = []
 				device_folders[nid].append(rid)
-
+		
+		if snapshot:
+			old_devices, old_folders, old_device_folders = {}, {}, {}
+		else:
+			self._snapshot.set_config(self._address, config)
+			self._snapshot_changed()
+			if self._parsed_config is None:
+				old_devices, old_folders, old_device_folders = {}, {}, {}
+			else:
+				old_devices, old_folders, old_device_folders = self._parsed_config
+			self._parsed_config = (devices, folders, device_folders)
+		
 		# Parse devices
+		for nid in [ nid for nid in old_devices if not nid in devices ]:
+			for d in (self._device_data, self._last_seen, self._rate_history):
+				if nid in d:
+					del d[nid]
+			self._syncing_devices.discard(nid)
+			self.emit("device-removed", nid)
 		for n in sorted(config["devices"], key=lambda x : x["name"].lower()):
 			nid = n["deviceID"]
-			self._get_device_data(nid)	# Creates dict with device data
 			used = (nid in device_folders) and (len(device_folders[nid]) > 0)
-			self.emit("device-added", nid, n["name"], used, n)
-			
+			if not nid in old_devices:
+				if not snapshot:
+					self._get_device_data(nid)	# Creates dict with device data
+				self.emit("device-added", nid, n["name"], used, n)
+			else:
+				changed = changed_keys(old_devices[nid], n)
+				if used != (nid in old_device_folders):
+					changed.add("used")
+				if len(changed):
+					self.emit("device-changed", nid, n["name"], used, n, changed)
+		
 		# Parse folders
+		for rid in [ rid for rid in old_folders if not rid in folders ]:
+			for x in (self._syncing_folders, self._stopped_folders,
+					self._scanning_folders, self._dirty_folders):
+				x.discard(rid)
+			for d in (self._folder_devices, self._need_pages, self._need_totals):
+				if rid in d:
+					del d[rid]
+			self.cancel_timer("folder-refresh-%s" % (rid,))
+			self.emit("folder-removed", rid)
 		for r in sorted(config["folders"], key=lambda x : x["id"].lower()):
 			rid = r["id"]
-			self._syncing_folders.add(rid)
-			self._folder_devices[rid] = [ n["deviceID"] for n in r["devices"] ]
-			self.emit("folder-added", rid, r)
-			self._request_folder_data(rid)
+			if not rid in old_folders:
+				if not snapshot:
+					self._syncing_folders.add(rid)
+					self._folder_devices[rid] = [ n["deviceID"] for n in r["devices"] ]
+				self.emit("folder-added", rid, r)
+				if not snapshot:
+					self._request_folder_data(rid)
+			else:
+				changed = changed_keys(old_folders[rid], r)
+				if len(changed):
+					self._folder_devices[rid] = [ n["deviceID"] for n in r["devices"] ]
+					self.emit("folder-changed", rid, r, changed)
+					self._request_folder_data(rid)
+	
+	def _snapshot_changed(self):
+		""" Schedules saving of snapshot """
+		if self._save_snapshot and not self.timer_active("snapshot"):
+			self.timer("snapshot", SNAPSHOT_DELAY, self._snapshot.save)
+	
+	def _flush_snapshot(self):
+		""" Saves snapshot now if saving is scheduled, before timers are canceled """
+		if self.timer_active("snapshot"):
+			self.cancel_timer("snapshot")
+			self._snapshot.save()
 	
 	### Callbacks ###
 	
@@ -444,6 +804,7 @@ class Daemon(GObject.GObject, TimerManager):
 				self._connected = False
 				self._epoch += 1
 				self.emit("disconnected", reason, "")
+			self._flush_snapshot()
 			self.cancel_all()
 	
 	def _syncthing_cb_errors(self, errors):
@@ -462,8 +823,8 @@ class Daemon(GObject.GObject, TimerManager):
 				if t > self._last_error_time:
 					self.emit("error", msg)
 					self._last_error_time = t
-		r = RESTRequest(self, "system/error", self._syncthing_cb_errors)
-		self.timer("errors", self._refresh_interval * 5, r.start)
+		r = RESTRequest(self, "system/error", self._syncthing_cb_errors).set_priority(PRIORITY_BACKGROUND)
+		self._schedule_poll("errors", r)
 	
 	def _syncthing_cb_connections(self, data, prev_time):
 		now = time.time()
@@ -475,6 +836,7 @@ class Daemon(GObject.GObject, TimerManager):
 		if not self._my_id is None:
 			cons[self._my_id] = data["total"]
 		
+		self._transferring = False
 		for id in cons:
 			# Load device data
 			nid = id
@@ -487,6 +849,15 @@ class Daemon(GObject.GObject, TimerManager):
 			except Exception:
 				cons[id]["inbps"] = 0.0
 				cons[id]["outbps"] = 0.0
+			if cons[id]["inbps"] > 0 or cons[id]["outbps"] > 0:
+				self._transferring = True
+			# Store rates in history. First sample after (re)connecting
+			# is computed from zero and so it's not stored.
+			if not nid in self._rate_history:
+				self._rate_history[nid] = RateHistory()
+			if device_data["inBytesTotal"] > 0 or device_data["outBytesTotal"] > 0:
+				self._rate_history[nid].add(cons[id]["inbps"], cons[id]["outbps"], now)
+			inbps, outbps = self._rate_history[nid].get_smoothed()
 			# Store updated device_data
 			for key in cons[id]:
 				if not key in ('clientVersion', 'connected'):		# Don't want copy those
@@ -506,18 +877,18 @@ class Daemon(GObject.GObject, TimerManager):
 					if not device_data["connected"] and nid != self._my_id:
 						device_data["connected"] = True
 						self.emit("device-connected", nid)
-			# Send "device-data-changed" signal
+			# Send "device-data-changed" signal, with smoothed rates
 			self.emit("device-data-changed", nid, 
 				device_data["address"],
 				device_data["clientVersion"],
-				device_data["inbps"],
-				device_data["outbps"],
+				inbps, outbps,
 				device_data["inBytesTotal"],
 				device_data["outBytesTotal"])
 		
 		# ... repeat until pronounced dead
-		r = RESTRequest(self, "system/connections", self._syncthing_cb_connections, None, now)
-		self.timer("conns", self._refresh_interval * 5, r.start)
+		r = RESTRequest(self, "system/connections", self._syncthing_cb_connections, None, now) \
+			.set_priority(PRIORITY_BACKGROUND)
+		self._schedule_poll("conns", r)
 	
 	def _syncthing_cb_last_seen(self, data):
 		for nid in data:
@@ -526,6 +897,8 @@ class Daemon(GObject.GObject, TimerManager):
 				if t < NEVER: t = None
 				if not nid in self._last_seen or self._last_seen[nid] != t:
 					self._last_seen[nid] = t
+					self._snapshot.set_last_seen(nid, data[nid]["lastSeen"])
+					self._snapshot_changed()
 					self.emit('last-seen-changed', nid, t)
 	
 	def _syncthing_cb_completion(self, data):
@@ -534,6 +907,7 @@ class Daemon(GObject.GObject, TimerManager):
 		# Store acquired value
 		device = self._get_device_data(nid)
 		device["completion"][rid] = float(data["completion"])
+		self.emit("folder-completion", rid, nid, device["completion"][rid])
 		
 		# Recompute stuff
 		total = 100.0 * len(device["completion"])
@@ -554,12 +928,19 @@ class Daemon(GObject.GObject, TimerManager):
 				self.emit("device-sync-progress", nid, sync)
 
 	
+	def _syncthing_cb_completion_response(self, data, rid, nid):
+		""" Handles db/completion response, which doesn't include ids """
+		if "completion" in data:
+			self._syncthing_cb_completion({
+				"folder" : rid, "device" : nid, "completion" : data["completion"]
+			})
+	
 	def _syncthing_cb_system(self, data):
 		if "myID" not in data:
 			# Invalid response
-			r = RESTRequest(self, "system/status", self._syncthing_cb_system)
+			r = RESTRequest(self, "system/status", self._syncthing_cb_system).set_priority(PRIORITY_BACKGROUND)
 			log.warning("Invalid response received for rest/system/status request")
-			self.timer("system", self._refresh_interval * 5, r.start)
+			self._schedule_poll("system", r)
 			return
 		
 		if self._my_id != data["myID"]:
@@ -589,8 +970,8 @@ class Daemon(GObject.GObject, TimerManager):
 		self.emit('system-data-updated', data["sys"],
 			float(data["cpuPercent"]), d_failed, d_total)
 		
-		r = RESTRequest(self, "system/status", self._syncthing_cb_system)
-		self.timer("system", self._refresh_interval * 5, r.start)
+		r = RESTRequest(self, "system/status", self._syncthing_cb_system).set_priority(PRIORITY_BACKGROUND)
+		self._schedule_poll("system", r)
 	
 	def _instance_replaced(self):
 		"""
@@ -607,6 +988,7 @@ class Daemon(GObject.GObject, TimerManager):
 			self._connected = False
 			self._epoch += 1
 			self.emit("disconnected", reason, message)
+		self._flush_snapshot()
 		self.cancel_all()
 	
 	def _syncthing_cb_version(self, data):
@@ -641,6 +1023,14 @@ class Daemon(GObject.GObject, TimerManager):
 	
 	def _syncthing_cb_folder_data(self, data, rid):
 		state = data['state']
+		totals = tuple([ data.get(x) for x in NEED_TOTALS ])
+		if self._need_totals.get(rid) != totals:
+			# List of out of sync items is changed
+			self._need_totals[rid] = totals
+			if rid in self._need_pages:
+				del self._need_pages[rid]
+		self._snapshot.set_folder_data(rid, data)
+		self._snapshot_changed()
 		if state in ('error', 'stopped'):
 			if not rid in self._stopped_folders:
 				self._stopped_folders.add(rid)
@@ -666,6 +1056,8 @@ class Daemon(GObject.GObject, TimerManager):
 			self.emit('connected')
 			
 			self._parse_dev_n_folders(config)
+			if self._recorder is not None:
+				self._recorder.write_config(self._snapshot.config)
 			
 			EventPollLoop(self).start()
 			RESTRequest(self, "system/config/insync", self._syncthing_cb_config_in_sync).start()
@@ -748,6 +1140,7 @@ class Daemon(GObject.GObject, TimerManager):
 	
 	def _on_event(self, e):
 		eType = e["type"]
+		self._event_count += 1
 		if eType in ("Ping", "Starting"):
 			# Just ignore ignore those
 			pass
@@ -756,15 +1149,24 @@ class Daemon(GObject.GObject, TimerManager):
 		elif eType == "StateChanged":
 			state = e["data"]["to"]
 			rid = e["data"]["folder"]
+			if state == "syncing" and not rid in self._syncing_folders:
+				# Transfer is starting, get its speed ASAP
+				self._poll_now("conns")
 			self._folder_state_changed(rid, state, 0)
-		elif eType in ("RemoteIndexUpdated"):
-			pass
+			self._folder_changed(rid)
+		elif eType in ("LocalIndexUpdated", "RemoteIndexUpdated"):
+			rid = e["data"]["folder"]
+			self._folder_changed(rid)
+			# Only LocalIndexUpdated lists files, and only with newer daemon
+			self.emit("folder-index-updated", rid, e["data"].get("filenames"))
 		elif eType == "DeviceConnected":
 			nid = e["data"]["id"]
 			self.emit("device-connected", nid)
+			self._poll_now("conns")
 		elif eType == "DeviceDisconnected":
 			   nid = e["data"]["id"]
 			   self.emit("device-disconnected", nid)
+			   self._poll_now("conns")
 		elif eType == "DeviceDiscovered":
 			nid = e["data"]["device"]
 			addresses = e["data"]["addrs"]
@@ -772,10 +1174,12 @@ class Daemon(GObject.GObject, TimerManager):
 		elif eType == "DevicePaused":
 			nid = e["data"]["device"]
 			self.emit("device-paused", nid)
+			self._poll_now("conns")
 		elif eType == "DeviceResumed":
 			nid = e["data"]["device"]
 			self.emit("device-resumed", nid)
 			self._request_last_seen()
+			self._poll_now("conns")
 		elif eType == "FolderRejected":
 			nid = e["data"]["device"]
 			rid = e["data"]["folder"]
@@ -802,10 +1206,12 @@ class Daemon(GObject.GObject, TimerManager):
 			self._syncthing_cb_completion(e["data"])
 		elif eType == "FolderSummary":
 			rid = e["data"]["folder"]
+			self._dirty_folders.discard(rid)
 			self._syncthing_cb_folder_data(e["data"]["summary"], rid)
 		elif eType == "FolderErrors":
 			rid = e["data"]["folder"]
 			self.emit("folder-error", rid, e["data"]["errors"])
+			self._poll_now("errors")
 		elif eType == "ConfigSaved":
 			self.emit("config-saved")
 		elif eType == "ItemFinished":
@@ -814,7 +1220,7 @@ class Daemon(GObject.GObject, TimerManager):
 				filename = e["data"]["item"]
 				t = parsetime(e["time"])
 				self.emit("item-updated", rid, filename, t)
-		elif eType in ("ItemFinished", "DownloadProgress", "RelayStateChanged", "LocalIndexUpdated", "ListenAddressesChanged", "LoginAttempt"):
+		elif eType in ("ItemFinished", "DownloadProgress", "RelayStateChanged", "ListenAddressesChanged", "LoginAttempt"):
 			# Not handled
 			pass
 		else:
@@ -822,14 +1228,51 @@ class Daemon(GObject.GObject, TimerManager):
 	
 	### External stuff ###
 	
+	def connect(self, signal, *args):
+		""" Overrides GObject.connect to update requested event types """
+		handler_id = GObject.GObject.connect(self, signal, *args)
+		self._update_event_types()
+		return handler_id
+	
+	def handler_disconnect(self, handler_id):
+		""" Overrides GObject.handler_disconnect to update requested event types """
+		GObject.GObject.handler_disconnect(self, handler_id)
+		self._update_event_types()
+	
+	disconnect = handler_disconnect
+	
 	def reconnect(self):
 		"""
 		Cancel all pending requests, throw away all data and (re)connect.
 		Should be called from glib loop
 		"""
 		self.close()
+		# Config file may have been changed while monitor timer was
+		# waiting; This is cheap if it wasn't
+		self._check_config_file()
 		GLib.idle_add(self._request_config)
 	
+	def load_snapshot(self):
+		"""
+		Loads data saved during last connection to same daemon and emits
+		device-added, folder-added, folder-data-changed and
+		last-seen-changed signals with it, so UI can be drawn before
+		connection to daemon is made. Data may be outdated and is
+		replaced as soon as daemon responds.
+		Returns False if there is no snapshot to load or if Daemon
+		was not created with snapshot enabled.
+		"""
+		if not self._save_snapshot or not self._snapshot.load(self._address):
+			return False
+		self._parse_dev_n_folders(self._snapshot.config, snapshot=True)
+		for rid in self._snapshot.folders:
+			self.emit('folder-data-changed', rid, self._snapshot.folders[rid])
+		for nid in self._snapshot.last_seen:
+			t = parsetime(self._snapshot.last_seen[nid])
+			if t < NEVER: t = None
+			self.emit('last-seen-changed', nid, t)
+		return True
+	
 	def reload_config(self, callback=None, error_callback=None):
 		"""
 		Reloads config from syncthing daemon.
@@ -861,10 +1304,20 @@ class Daemon(GObject.GObject, TimerManager):
 		self._scanning_folders = set()
 		self._device_data = {}
 		self._folder_devices = {}
+		self._parsed_config = None
 		self._last_id = 0
 		self._last_seen = {}
+		self._in_flight = {}
+		self._dirty_folders = set()
+		self._need_pages = {}
+		self._need_totals = {}
+		self._polls = {}
+		self._poll_state = {}
+		self._transferring = False
+		self._flush_snapshot()
 		self.cancel_all()
 		self._epoch += 1
+		self._pool.clear()
 	
 	def check_config(self):
 		"""
@@ -880,7 +1333,8 @@ class Daemon(GObject.GObject, TimerManager):
 		callback(config) with data decoded from json on success,
 		error_callback(exception) on failure
 		"""
-		RESTRequest(self, "system/config", callback, error_callback, *calbackdata).start()
+		RESTRequest(self, "system/config", callback, error_callback, *calbackdata) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def write_config(self, config, callback, error_callback=None, *calbackdata):
 		"""
@@ -891,7 +1345,58 @@ class Daemon(GObject.GObject, TimerManager):
 		def run_before(data, *a):
 			self.check_config()
 			callback(*calbackdata)
-		RESTPOSTRequest(self, "system/config", config, run_before, error_callback, *calbackdata).start()
+		RESTPOSTRequest(self, "system/config", config, run_before, error_callback, *calbackdata) \
+			.set_priority(PRIORITY_USER).start()
+	
+	def read_need(self, folder_id, page, callback, error_callback=None, *calbackdata):
+		"""
+		Asynchronously reads one page of items that folder needs to
+		synchronize, NEED_PAGE_SIZE items per page, starting with 1.
+		Calls callback(data, *calbackdata) with dict containing
+		'progress', 'queued' and 'rest' lists on success,
+		error_callback(exception, command, *calbackdata) on failure.
+		
+		Received pages are cached until folder status reports different
+		number of out of sync items.
+		"""
+		pages = self._need_pages.setdefault(folder_id, {})
+		if page in pages:
+			def from_cache():
+				callback(pages[page], *calbackdata)
+				return False
+			GLib.idle_add(from_cache)
+			return
+		def r_store(data, *a):
+			# If folder has changed in meanwhile, page is stored into
+			# already discarded dict
+			pages[page] = data
+			callback(data, *a)
+		id_enc = urllib.quote(folder_id.encode('utf-8'))
+		RESTRequest(self, "db/need?folder=%s&page=%s&perpage=%s" % (id_enc, page, NEED_PAGE_SIZE),
+			r_store, error_callback, *calbackdata).set_priority(PRIORITY_USER).start()
+	
+	def read_browse(self, folder_id, prefix, callback, error_callback=None, *calbackdata):
+		"""
+		Asynchronously reads one directory level of folder, as known
+		to daemon index. Prefix is path of directory inside folder,
+		using '/' as separator, or empty string for folder root.
+		Calls callback(data, *calbackdata) on success, where data is
+		daemon response, error_callback(exception, command, *calbackdata)
+		on failure. See parse_browse_response.
+		"""
+		id_enc = urllib.quote(folder_id.encode('utf-8'))
+		command = "db/browse?folder=%s&levels=0" % (id_enc,)
+		if prefix:
+			command += "&prefix=%s" % (urllib.quote(prefix.encode('utf-8')),)
+		RESTRequest(self, command, callback, error_callback, *calbackdata) \
+			.set_priority(PRIORITY_USER).start()
+	
+	def transaction(self):
+		"""
+		Returns new ConfigTransaction, used to change multiple
+		configuration values with single write.
+		"""
+		return ConfigTransaction(self)
 	
 	def read_stignore(self, folder_id, callback, error_callback=None, *calbackdata):
 		"""
@@ -905,7 +1410,8 @@ class Daemon(GObject.GObject, TimerManager):
 			else:
 				callback("", *a)
 		id_enc = urllib.quote(folder_id.encode('utf-8'))
-		RESTRequest(self, "db/ignores?folder=%s" % (id_enc,), r_filter, error_callback, *calbackdata).start()
+		RESTRequest(self, "db/ignores?folder=%s" % (id_enc,), r_filter, error_callback, *calbackdata) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def write_stignore(self, folder_id, text, callback, error_callback=None, *calbackdata):
 		"""
@@ -914,21 +1420,24 @@ class Daemon(GObject.GObject, TimerManager):
 		"""
 		data = { 'ignore': text.split("\n") }
 		id_enc = urllib.quote(folder_id.encode('utf-8'))
-		RESTPOSTRequest(self, "db/ignores?folder=%s" % (id_enc,), data, callback, error_callback, *calbackdata).start()
+		RESTPOSTRequest(self, "db/ignores?folder=%s" % (id_enc,), data, callback, error_callback, *calbackdata) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def restart(self):
 		"""
 		Asks daemon to restart. If sucesfull, call will cause
 		'disconnected' event with Daemon.RESTART reason to be fired
 		"""
-		RESTPOSTRequest(self, "system/restart",  {}, self._syncthing_cb_shutdown, None, Daemon.RESTART).start()
+		RESTPOSTRequest(self, "system/restart",  {}, self._syncthing_cb_shutdown, None, Daemon.RESTART) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def shutdown(self):
 		"""
 		Asks daemon to shutdown. If sucesfull, call will cause
 		'disconnected' event with Daemon.SHUTDOWN reason to be fired
 		"""
-		RESTPOSTRequest(self, "system/shutdown",  {}, self._syncthing_cb_shutdown, None, Daemon.SHUTDOWN).start()
+		RESTPOSTRequest(self, "system/shutdown",  {}, self._syncthing_cb_shutdown, None, Daemon.SHUTDOWN) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def syncing(self):
 		""" Returns true if any folder is being synchronized right now  """
@@ -959,6 +1468,13 @@ class Daemon(GObject.GObject, TimerManager):
 		"""
 		return self._my_id
 	
+	def get_need_totals(self, folder_id):
+		"""
+		Returns tuple with values of NEED_TOTALS keys from last received
+		folder data, or None if folder data was not received yet.
+		"""
+		return self._need_totals.get(folder_id)
+	
 	def get_version(self):
 		"""
 		Returns daemon version or "unknown" if daemon version is not yet
@@ -971,14 +1487,22 @@ class Daemon(GObject.GObject, TimerManager):
 		return "unknown"
 	
 	def get_webui_url(self):
-		""" Returns webiu url in http(s)://127.0.0.1:8080 format """
+		"""
+		Returns webiu url in http(s)://127.0.0.1:8080 format, or
+		unix:///path/to/socket if daemon listens on unix socket.
+		"""
+		if self._unix_socket:
+			return self._address
 		return "%s://%s" % (
 			"https" if self._tls else "http",
 			self._address
 		)
 	
 	def get_address(self):
-		""" Returns tuple address on which daemon listens on. """
+		"""
+		Returns address on which daemon listens on, host:port or
+		unix:///path/to/socket
+		"""
 		return self._address
 	
 	def is_connected(self):
@@ -987,33 +1511,52 @@ class Daemon(GObject.GObject, TimerManager):
 	
 	def pause(self, device_id):
 		""" Pauses synchronization with specified device """
-		RESTPOSTRequest(self, "system/pause?device=%s" % (device_id,), {}, lambda *a: a, lambda *a: log.error(a), device_id).start()
+		RESTPOSTRequest(self, "system/pause?device=%s" % (device_id,), {}, lambda *a: a, lambda *a: log.error(a), device_id) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def resume(self, device_id):
 		""" Resumes synchronization with specified device """
-		RESTPOSTRequest(self, "system/resume?device=%s" % (device_id,), {}, lambda *a: a, lambda *a: log.error(a), device_id).start()
+		RESTPOSTRequest(self, "system/resume?device=%s" % (device_id,), {}, lambda *a: a, lambda *a: log.error(a), device_id) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def rescan(self, folder_id, path=None):
 		""" Asks daemon to rescan entire folder or specified path """
 		if path is None:
 			id_enc = urllib.quote(folder_id.encode('utf-8'))
-			RESTPOSTRequest(self, "db/scan?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id).start()
+			RESTPOSTRequest(self, "db/scan?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id) \
+				.set_priority(PRIORITY_USER).start()
 		else:
 			url = "db/scan?folder=%s&sub=%s" % (
 				urllib.quote(folder_id.encode('utf-8')),
 				urllib.quote(path.encode('utf-8'))
 			)
-			RESTPOSTRequest(self, url, {}, lambda *a: a, lambda *a: log.error(a), folder_id).start()
+			RESTPOSTRequest(self, url, {}, lambda *a: a, lambda *a: log.error(a), folder_id) \
+				.set_priority(PRIORITY_USER).start()
 	
 	def override(self, folder_id):
 		""" Asks daemon to override remote changes made in specified folder """
 		id_enc = urllib.quote(folder_id.encode('utf-8'))
-		RESTPOSTRequest(self, "db/override?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id).start()
+		RESTPOSTRequest(self, "db/override?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id) \
+			.set_priority(PRIORITY_USER).start()
 	
 	def revert(self, folder_id):
 		""" Asks daemon to revert local changes made in specified folder """
 		id_enc = urllib.quote(folder_id.encode('utf-8'))
-		RESTPOSTRequest(self, "db/revert?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id).start()
+		RESTPOSTRequest(self, "db/revert?folder=%s" % (id_enc,), {}, lambda *a: a, lambda *a: log.error(a), folder_id) \
+			.set_priority(PRIORITY_USER).start()
+	
+	def request_completion(self, folder_id, device_id):
+		"""
+		Asks daemon how much of folder is synchronized to specified
+		device. Result is emitted as 'folder-completion' signal, same
+		as when FolderCompletion event is received.
+		"""
+		url = "db/completion?folder=%s&device=%s" % (
+			urllib.quote(folder_id.encode('utf-8')),
+			urllib.quote(device_id.encode('utf-8'))
+		)
+		RESTRequest(self, url, self._syncthing_cb_completion_response, None,
+			folder_id, device_id).start()
 	
 	def request_events(self):
 		"""
@@ -1021,10 +1564,389 @@ class Daemon(GObject.GObject, TimerManager):
 		"""
 		pass
 	
+	def get_rate_history(self, device_id=None, minutes=5):
+		"""
+		Returns list of (time, inbps, outbps) tuples with transfer rates
+		measured for device during last 'minutes' minutes, oldest first.
+		If device_id is None, returns total rates.
+		With default refresh interval, at least one last hour is kept;
+		See HISTORY_SIZE in ratehistory.py.
+		"""
+		device_id = device_id or self._my_id
+		if not device_id in self._rate_history:
+			return []
+		return self._rate_history[device_id].get_last(minutes)
+	
+	def get_statistics(self):
+		"""
+		Returns Statistics object with counters and latency histograms
+		collected for REST requests and events. Values describing
+		current state, such as number of requests in flight, are
+		updated before returning.
+		"""
+		self._stats.set_gauges(**self._pool.get_state())
+		self._stats.set_gauges(**{
+			"requests joinable" : len(self._in_flight),
+			"event types requested" : len(self._event_types),
+		})
+		return self._stats
+	
+	def get_smoothed_rate(self, device_id=None):
+		"""
+		Returns (inbps, outbps) tuple with exponentially smoothed transfer
+		rates for device, or total rates if device_id is None.
+		"""
+		device_id = device_id or self._my_id
+		if not device_id in self._rate_history:
+			return 0.0, 0.0
+		return self._rate_history[device_id].get_smoothed()
+	
 	def set_refresh_interval(self, i):
-		""" Sets interval used mainly by event querying timer """
+		"""
+		Sets interval used mainly by event querying timer. Periodic
+		requests are repeated after multiple of this interval, depending
+		on what is daemon doing.
+		"""
+		faster = i < self._refresh_interval
 		self._refresh_interval = i
 		log.verbose("Set refresh interval to %s", i)
+		if faster:
+			# Don't wait for polls scheduled with old, longer interval
+			for name in list(self._polls):
+				self._poll_state.pop(name, None)
+				self._poll_now(name)
+	
+	def record_events(self, filename):
+		"""
+		Starts writing every received event batch into gzip-compressed
+		file, which can be replayed by benchmarks/replay.py. Only event
+		types requested from daemon are recorded.
+		Calling with None stops recording.
+		May raise IOError if file cannot be created.
+		"""
+		if self._recorder is not None:
+			self._recorder.close()
+			self._recorder = None
+		if filename is not None:
+			self._recorder = EventRecorder(filename)
+			if self._connected:
+				self._recorder.write_config(self._snapshot.config)
+	
+	def set_max_requests(self, count):
+		"""
+		Sets maximum number of REST requests sent to daemon at once.
+		Requests above this limit wait in queue, ordered by priority.
+		"""
+		self._pool.set_size(count)
+	
+	def set_visible_folders(self, folder_ids):
+		"""
+		Sets list of folders that are currently displayed to user.
+		Data for those folders are requested before data of other folders
+		and outdated data is requested again once folder is displayed.
+		"""
+		self._visible_folders = set(folder_ids)
+		for folder_id in self._visible_folders & self._dirty_folders:
+			if not self.timer_active("folder-refresh-%s" % (folder_id,)):
+				self._refresh_folder(folder_id)
+	
+	def set_folder_visible(self, folder_id, visible):
+		""" Marks or unmarks single folder as displayed to user """
+		if visible:
+			self.set_visible_folders(self._visible_folders | { folder_id })
+		else:
+			self._visible_folders.discard(folder_id)
+
+
+class ConfigTransaction(object):
+	"""
+	Collects changes of daemon configuration and applies all of them
+	with single read and single write of configuration.
+	
+	Usage:
+		t = daemon.transaction()
+		t.set("options/maxRecvKbps", 100)
+		t.set("options/maxSendKbps", 100)
+		t.commit(callback, error_callback)
+	
+	Configuration is not written at all if changes leave it as it was.
+	After write, daemon is asked whether running configuration is still
+	in sync with saved one, so caller can restart daemon only if
+	some of changed values actually requires it.
+	"""
+	
+	def __init__(self, parent):
+		self._parent = parent
+		self._changes = []
+	
+	def set(self, setting_name, value):
+		"""
+		Sets configuration value. Nested setting is specified using
+		'/' as separator, parent setting node has to be present.
+		
+		If value is callable, it's called instead of setting it.
+		In such case, callable is called as:
+		   value(config_node_as_dict, setting_name)
+		
+		Returns self, so calls can be chained.
+		"""
+		self._changes.append((setting_name, value))
+		return self
+	
+	def get_settings(self):
+		""" Returns list of changed setting names, in order they were set """
+		return [ setting_name for (setting_name, value) in self._changes ]
+	
+	def __len__(self):
+		return len(self._changes)
+	
+	def commit(self, callback=None, error_callback=None, *callback_data):
+		"""
+		Reads configuration from daemon, applies all changes and writes
+		it back. Transaction may be commited again, for example to
+		retry after failure.
+		
+		Calls callback(changed, restart_needed, *callback_data) on success,
+		where 'changed' is False if configuration was not written, as
+		there was nothing to change.
+		Calls error_callback(exception, *callback_data) on failure.
+		Exception is ConfigChangeException if change can't be applied
+		to received configuration, so there is no point in retrying.
+		"""
+		self._parent.read_config(self._cb_config_read, self._cb_error,
+				callback, error_callback, callback_data)
+	
+	def _cb_config_read(self, config, callback, error_callback, callback_data):
+		before = json.dumps(config, sort_keys=True)
+		try:
+			for setting_name, value in self._changes:
+				c, setting = config, setting_name
+				while "/" in setting:
+					key, setting = setting.split("/", 1)
+					c = c[key]
+				if hasattr(value, '__call__'):
+					value(c, setting)
+				else:
+					c[setting] = value
+		except (KeyError, TypeError) as e:
+			# Parent node is not present
+			self._cb_error(ConfigChangeException(setting_name, e), None,
+					callback, error_callback, callback_data)
+			return
+		if json.dumps(config, sort_keys=True) == before:
+			log.verbose("Configuration not changed, not writing it")
+			if callback is not None:
+				callback(False, False, *callback_data)
+			return
+		self._parent.write_config(config, self._cb_config_written, self._cb_error,
+				callback, error_callback, callback_data)
+	
+	def _cb_config_written(self, callback, error_callback, callback_data):
+		RESTRequest(self._parent, "system/config/insync", self._cb_in_sync, self._cb_error,
+				callback, error_callback, callback_data).set_priority(PRIORITY_USER).start()
+	
+	def _cb_in_sync(self, data, callback, error_callback, callback_data):
+		restart_needed = not data.get("configInSync", True)
+		log.verbose("Configuration changed: %s%s", ", ".join(self.get_settings()),
+				"; Restart needed" if restart_needed else "")
+		if callback is not None:
+			callback(True, restart_needed, *callback_data)
+	
+	def _cb_error(self, exception, command, callback, error_callback, callback_data):
+		if error_callback is not None:
+			error_callback(exception, *callback_data)
+
+
+class ConnectionPool(object):
+	"""
+	Keeps persistent (HTTP/1.1 keep-alive) connections to daemon, so
+	consecutive REST requests don't have to pay for new TCP connection
+	and, with HTTPS, for full TLS handshake every time.
+	
+	There is one pool per Daemon instance. Requests are started on idle
+	connections if there are any; new connection is opened only if there
+	is less than 'size' connections in use. Otherwise, request waits in
+	queue until some connection is returned to pool.
+	
+	Waiting requests are started by priority (see PRIORITY_* constants)
+	and background requests never take last free connection, so user
+	actions don't have to wait for bunch of polls. Request identical
+	to one that is already waiting is dropped.
+	
+	Pool is bound to parent's _epoch, address and certificate. If any of
+	those changes, all idle connections are closed. Waiting requests
+	from older epoch are thrown away, same way as responses for old
+	requests are; Others are queued again, so they are sent to new
+	address.
+	
+	Every place in pool is tagged with pool generation, which is increased
+	every time when pool is cleared. Places taken before that are not
+	counted as active anymore and connections returned to them are closed.
+	"""
+	def __init__(self, parent, size=POOL_SIZE):
+		self._parent = parent
+		self._size = size
+		self._idle = []
+		self._waiting = [ deque() for p in PRIORITIES ]
+		# Maps request key to list of waiting requests, used to drop duplicates
+		self._queued = {}
+		self._active = 0
+		self._generation = 0
+		self._epoch = parent._epoch
+		self._address = parent._address
+		self._cert = parent._cert
+		# Last successfully used TLS connection. Its session state is
+		# copied to new connections, so daemon can resume TLS session
+		# instead of doing full handshake.
+		self._tls_session = None
+	
+	def _check(self):
+		""" Clears pool if it is bound to something that is not valid anymore """
+		if (self._epoch != self._parent._epoch
+				or self._address != self._parent._address
+				or not same_certificate(self._cert, self._parent._cert)):
+			self.clear()
+	
+	def clear(self):
+		"""
+		Closes all idle connections and requeues or throws away waiting
+		requests.
+		Connections that are in use are closed when returned to pool.
+		"""
+		waiting = [ request for queue in self._waiting for request in queue ]
+		for connection in self._idle:
+			connection.close(None)
+		self._idle = []
+		self._waiting = [ deque() for p in PRIORITIES ]
+		self._queued = {}
+		self._active = 0
+		self._generation += 1
+		self._epoch = self._parent._epoch
+		self._address = self._parent._address
+		if not same_certificate(self._cert, self._parent._cert):
+			# TLS session is reused across reconnects, but not with
+			# different certificate
+			log.verbose("Daemon certificate changed, dropping TLS session")
+			self._tls_session = None
+		self._cert = self._parent._cert
+		for request in waiting:
+			if request._epoch == self._epoch:
+				# Still valid, other requests may have joined it
+				self.acquire(request)
+			else:
+				# Thrown away, same as response to old request would be
+				request._finish()
+	
+	def set_size(self, size):
+		""" Changes maximum number of connections """
+		self._size = max(1, size)
+		self._next()
+	
+	def acquire(self, request):
+		"""
+		Gives connection to request as soon as possible.
+		Calls either request._use_connection(connection, True) with idle
+		connection or request._open_connection() when new connection
+		should be created.
+		"""
+		self._check()
+		priority = request._priority
+		if self._can_start(priority) and not any(self._waiting[0:priority + 1]):
+			self._start(request)
+		else:
+			self._enqueue(request)
+	
+	def _can_start(self, priority):
+		""" Returns True if request with given priority can be started now """
+		limit = self._size
+		if priority >= PRIORITY_BACKGROUND and limit > 1:
+			# Last free connection is kept for something more important
+			limit -= 1
+		return self._active < limit
+	
+	def _start(self, request):
+		self._active += 1
+		request._slot = self._generation
+		if len(self._idle):
+			request._use_connection(self._idle.pop(), True)
+		else:
+			request._open_connection()
+	
+	def promote(self, request, priority):
+		""" Raises priority of request, moving it up if it's waiting """
+		if priority >= request._priority:
+			return
+		if request in self._waiting[request._priority]:
+			self._waiting[request._priority].remove(request)
+			self._waiting[priority].append(request)
+		request._priority = priority
+		self._next()
+	
+	def _enqueue(self, request):
+		key = request._key()
+		for other in self._queued.get(key, ()):
+			if other._is_duplicate(request):
+				# Move already waiting request up, if needed
+				self.promote(other, request._priority)
+				log.verbose("Dropped duplicate request for %s", request._command)
+				return
+		self._queued.setdefault(key, []).append(request)
+		self._waiting[request._priority].append(request)
+	
+	def _next(self):
+		""" Starts waiting requests, most important first, while there is place for them """
+		for queue in self._waiting:
+			while len(queue) and self._can_start(queue[0]._priority):
+				request = queue.popleft()
+				waiting = self._queued[request._key()]
+				waiting.remove(request)
+				if len(waiting) == 0:
+					del self._queued[request._key()]
+				self._start(request)
+	
+	def release(self, connection, generation):
+		"""
+		Returns connection to pool. If connection is None, only place
+		in pool is freed. 'generation' is value that was set to
+		request._slot when place was taken.
+		"""
+		self._check()
+		if generation != self._generation:
+			# Pool was cleared while connection was in use
+			if connection is not None:
+				connection.close(None)
+			return
+		self._active -= 1
+		if connection is not None:
+			self._idle.append(connection)
+		self._next()
+	
+	def get_state(self):
+		""" Returns dict with numbers of active and waiting requests """
+		return {
+			"requests active" : self._active,
+			"requests waiting" : sum([ len(x) for x in self._waiting ]),
+			"connections idle" : len(self._idle),
+			"connections max" : self._size,
+		}
+	
+	def set_tls_session(self, connection):
+		""" Stores TLS connection to use as source of session state """
+		self._tls_session = connection
+	
+	def resume_tls_session(self, connection):
+		"""
+		Copies stored TLS session state to newly created connection.
+		Does nothing with older GLib or if there is no stored session.
+		"""
+		if self._tls_session is None or self._tls_session == connection:
+			return
+		if not hasattr(connection, "copy_session_state"):
+			return
+		try:
+			connection.copy_session_state(self._tls_session)
+		except Exception as e:
+			log.verbose("Failed to resume TLS session: %s", e)
 
 
 class RESTRequest(Gio.SocketClient):
@@ -1033,6 +1955,13 @@ class RESTRequest(Gio.SocketClient):
 	received. It is assumed that response will always be JSON-encoded and
 	it is automatically decoded.
 	
+	Connection is taken from parent's ConnectionPool and returned there
+	once response is read, unless daemon asks to close it.
+	
+	GET request started while identical one is still waiting for response
+	is not sent at all; It joins the pending request and its callbacks are
+	called with the same response.
+	
 	If request fails and error_callback is not set, it is automatically repeated.
 	
 	Callback signatures:
@@ -1047,14 +1976,35 @@ class RESTRequest(Gio.SocketClient):
 		self._command = command
 		self._parent = parent
 		self._connection = None
+		self._tls_connection = None
+		self._reused = False
+		self._slot = None			# Pool generation, if request owns place in pool
+		self._priority = PRIORITY_VISIBLE
+		self._followers = []
 		self._callback_data = callback_data or ()
+		# Used to collect statistics
+		self._start_time = None
+		self._send_time = None
+		self._bytes_sent = 0
+		self._bytes_received = 0
 		if parent._tls:
 			GObject.Object.connect(self, "event", self._socket_event)
 	
+	def _open_connection(self):
+		""" Opens new connection to daemon """
+		if self._parent._unix_socket:
+			self.set_enable_proxy(False)
+			address = Gio.UnixSocketAddress.new(self._parent._unix_socket)
+			self.connect_async(address, None, self._connected)
+			return
+		if self._parent._address.startswith("127.0.0.1"):
+			self.set_enable_proxy(False)
+		self.connect_to_host_async(self._parent._address, 0, None, self._connected)
+	
 	def _connected(self, _self, results):
-		""" Called after TCP connection is initiated """
+		""" Called after TCP or unix socket connection is initiated """
 		try:
-			self._connection = self.connect_to_service_finish(results)
+			self._connection = self.connect_finish(results)
 			if self._connection == None:
 				raise Exception("Unknown error")
 		except Exception as e:
@@ -1065,78 +2015,197 @@ class RESTRequest(Gio.SocketClient):
 			return
 		if self._epoch != self._parent._epoch:
 			# Too late, throw it away
-			self._connection.close(None)
+			self._release_connection(False)
 			log.verbose("Discarded old connection for %s", self._command)
 			return
+		self._use_connection(self._connection, False)
+	
+	def _use_connection(self, connection, reused):
+		"""
+		Called with connection that is ready to use, either newly created
+		or reused from pool.
+		"""
+		self._connection = connection
+		self._reused = reused
+		self._head = None
+		self._buffer = []
+		self._decoder = None
 		if self._parent._CSRFtoken is None and self._parent._api_key is None:
 			# Request CSRF token first
 			log.verbose("Requesting cookie")
 			get_str = "\r\n".join([
-				"GET / HTTP/1.0",
-				"Host: %s" % self._parent._address,
-				(("X-API-Key: %s" % self._parent._api_key) if not self._parent._api_key is None else "X-nothing: x"),
-				"Connection: close",
+				"GET / HTTP/1.1",
+				"Host: %s" % self._parent._host,
+				"Connection: keep-alive",
 				"",
 				"",
 				]).encode("utf-8")
+			self._send_request(get_str)
 		else:
 			self._send_request()
 	
-	def _send_request(self):
-		get_str = self._format_request()
+	def _send_request(self, get_str=None):
+		if get_str is None:
+			get_str = self._format_request()
 		try:
 			self._connection.get_output_stream().write_all(get_str, None)
 		except Exception as e:
+			if self._reused:
+				# Pooled connection was closed by daemon in meanwhile
+				return self._retry()
 			self._error(e)
 			return
-		self._connection.get_input_stream().read_bytes_async(102400, 1, None, self._response)
+		self._send_time = time.time()
+		self._bytes_sent += len(get_str)
+		self._connection.get_input_stream().read_bytes_async(READ_SIZE, 1, None, self._response)
+	
+	def _retry(self):
+		""" Throws away stale pooled connection and starts request again """
+		log.verbose("Pooled connection closed by daemon, repeating %s", self._command)
+		self._release_connection(False)
+		self.start()
+	
+	def _release_connection(self, reusable):
+		"""
+		Returns used connection to pool, or closes it if reusable
+		is False or request doesn't own place in pool.
+		"""
+		connection, self._connection = self._connection, None
+		if connection is not None and not reusable:
+			connection.close(None)
+			connection = None
+		if self._slot is not None:
+			generation, self._slot = self._slot, None
+			self._parent._pool.release(connection, generation)
+		elif connection is not None:
+			connection.close(None)
 	
 	def _parse_csrf(self, response):
 		for d in response:
 			if d.startswith("Set-Cookie:"):
 				for c in d.split(":", 1)[1].split(";"):
 					if c.strip().startswith("CSRF-Token-"):
-						self._CSRFtoken = c.strip(" \r\n")
-						log.verbose("Got new cookie: %s", self._CSRFtoken)
+						self._parent._CSRFtoken = c.strip(" \r\n")
+						log.verbose("Got new cookie: %s", self._parent._CSRFtoken)
 						break
-				if self._CSRFtoken != None:
+				if self._parent._CSRFtoken != None:
 					break
 	
 	def _format_request(self):
 		"""
-		Formats HTTP request (GET /xyz HTTP/1.0... ) before sending it to daemon
+		Formats HTTP request (GET /xyz HTTP/1.1... ) before sending it to daemon
 		"""
 		return "\r\n".join([
-			"GET /rest/%s HTTP/1.0" % self._command,
-			"Host: %s" % self._parent._address,
+			"GET /rest/%s HTTP/1.1" % self._command,
+			"Host: %s" % self._parent._host,
 			"Cookie: %s" % self._parent._CSRFtoken,
 			(("X-%s" % self._parent._CSRFtoken.replace("=", ": ")) if self._parent._CSRFtoken else "X-nothing: x"),
 			(("X-API-Key: %s" % self._parent._api_key) if not self._parent._api_key is None else "X-nothing2: x"),
-			"Connection: close",
+			"Connection: keep-alive",
 			"", ""
 			]).encode("utf-8")
 	
+	def _parse_head(self, buffer):
+		"""
+		Parses status line and headers once they are completly received
+		and determines how will be end of response recognized.
+		Returns data received after headers or None if there is not
+		enough data yet.
+		"""
+		if not b"\r\n\r\n" in buffer:
+			return None
+		self._head, body = buffer.split(b"\r\n\r\n", 1)
+		self._buffer = []
+		self._received = 0
+		lines = self._head.split(b"\r\n")
+		headers = { }
+		for h in lines[1:]:
+			if b":" in h:
+				key, value = h.split(b":", 1)
+				headers[key.strip().lower()] = value.strip().lower()
+		self._length = None
+		self._chunked = headers.get(b"transfer-encoding") == b"chunked"
+		if not self._chunked and b"content-length" in headers:
+			try:
+				self._length = int(headers[b"content-length"])
+			except ValueError:
+				pass
+		# Connection can be reused only if end of response can be
+		# recognized without daemon closing it
+		self._keep_alive = (
+			lines[0].startswith(b"HTTP/1.1")
+			and headers.get(b"connection") != b"close"
+			and (self._chunked or self._length is not None)
+		)
+		self._decoder = ChunkedDecoder() if self._chunked else None
+		return body
+	
+	def _feed(self, data):
+		"""
+		Adds data received after headers to response body.
+		Returns complete body, decoded from chunked encoding if needed,
+		or None if more data has to be read.
+		"""
+		if self._decoder is not None:
+			if self._decoder.feed(data):
+				return self._decoder.body()
+			return None
+		self._buffer.append(data)
+		self._received += len(data)
+		if self._length is not None and self._received >= self._length:
+			return b"".join(self._buffer)[0:self._length]
+		return None
+	
+	def _received_body(self):
+		""" Returns whatever was received as body so far """
+		if self._decoder is not None:
+			return self._decoder.body()
+		return b"".join(self._buffer)
+	
 	def _response(self, stream, results):
 		try:
 			response = stream.read_bytes_finish(results)
 			if response == None:
 				raise Exception("No data received")
 		except Exception as e:
-			self._connection.close(None)
+			if self._reused and self._head is None and len(self._buffer) == 0:
+				return self._retry()
 			self._error(e)
 			return
 		if self._epoch != self._parent._epoch:
 			# Too late, throw it away
-			self._connection.close(None)
+			self._release_connection(False)
 			log.verbose("Discarded old response for %s", self._command)
 			return
-		# Repeat read_bytes_async until entire response is read into buffer
-		self._buffer.append(response.get_data())
-		if response.get_size() > 0:
-			self._connection.get_input_stream().read_bytes_async(102400, 1, None, self._response)
-			return
-		self._connection.close(None)
-		response, self._buffer = (b"".join(self._buffer)).decode("utf-8"), []
+		data = response.get_data()
+		self._bytes_received += len(data)
+		if len(data) == 0 and self._reused and self._head is None and len(self._buffer) == 0:
+			# Pooled connection was closed by daemon before request was
+			# received. Try again with fresh one.
+			return self._retry()
+		# Repeat read_bytes_async until entire response is read
+		body, received = None, data
+		if self._head is None:
+			self._buffer.append(data)
+			data = self._parse_head(b"".join(self._buffer))
+		if self._head is not None:
+			try:
+				body = self._feed(data)
+			except ValueError:
+				self._error(InvalidHTTPResponse(self._head))
+				return
+		if body is None:
+			if len(received) > 0:
+				self._connection.get_input_stream().read_bytes_async(READ_SIZE, 1, None, self._response)
+				return
+			# Connection closed by daemon; Whatever was received is response
+			if self._head is None:
+				body, self._head = b"", b"".join(self._buffer)
+			else:
+				body = self._received_body()
+			self._keep_alive = False
+		self._release_connection(self._keep_alive)
+		response, self._buffer = (self._head + b"\r\n\r\n" + body).decode("utf-8"), []
 		if self._parent._CSRFtoken is None and self._parent._api_key is None:
 			# I wanna cookie!
 			self._parse_csrf(response.split("\n"))
@@ -1145,6 +2214,7 @@ class RESTRequest(Gio.SocketClient):
 				# so request is not repeated automatically
 				if self._error_callback == None:
 					log.error("Request '%s' failed: Error: failed to get CSRF cookie from daemon", self._command)
+					self._finish()
 				else:
 					self._error(Exception("Failed to get CSRF cookie"))
 				return
@@ -1154,16 +2224,18 @@ class RESTRequest(Gio.SocketClient):
 		# Split headers from response
 		headers, response = self._split_headers(response)
 		if headers is None: return
-		# Parse response and call callback
-		try:
-			rdata = json.loads(response)
-		except IndexError: # No data
-			rdata = { }
-		except ValueError: # Not a JSON
-			rdata = {'data' : response }
-		if type(rdata) == dict:
-			rdata[HTTP_HEADERS] = headers
-		self._callback(rdata, *self._callback_data)
+		# Parse response and call callbacks. Every joined request gets
+		# its own copy of data, as callbacks are free to modify it.
+		followers = self._finish()
+		t = time.time()
+		self._callback(decode_response(response, headers), *self._callback_data)
+		for f in followers:
+			f._callback(decode_response(response, headers), *f._callback_data)
+		self._parent._stats.request_finished(self._command,
+			self._send_time - self._start_time, t - self._send_time,
+			time.time() - t, self._bytes_received, self._bytes_sent,
+			len(followers))
+		self._start_time = None
 	
 	def _split_headers(self, buffer):
 		try:
@@ -1189,9 +2261,15 @@ class RESTRequest(Gio.SocketClient):
 	
 	def _error(self, exception):
 		""" Error handler for _response method """
-		if self._connection:
-			self._connection.close(None)
-			self._connection = None
+		self._release_connection(False)
+		self._parent._stats.request_failed(self._command)
+		# Requests that joined this one are handled as if they failed
+		# on their own. This one is repeated alone, if it's repeated.
+		followers, self._followers = self._followers, []
+		if self._error_callback or self._epoch != self._parent._epoch:
+			self._finish()
+		for f in followers:
+			f._error(exception)
 		if self._error_callback:
 			if self._epoch != self._parent._epoch:
 				exception = ConnectionRestarted()
@@ -1208,6 +2286,10 @@ class RESTRequest(Gio.SocketClient):
 		""" Setups TSL certificate if HTTPS is used """
 		if event == Gio.SocketClientEvent.TLS_HANDSHAKING:
 			con.connect("accept-certificate", self._accept_certificate)
+			self._parent._pool.resume_tls_session(con)
+			self._tls_connection = con
+		elif event == Gio.SocketClientEvent.TLS_HANDSHAKED:
+			self._parent._pool.set_tls_session(self._tls_connection)
 	
 	def _accept_certificate(self, con, peer_cert, errors):
 		""" Check if server presents expected certificate and accept connection """
@@ -1223,12 +2305,70 @@ class RESTRequest(Gio.SocketClient):
 		self._error_callback = lambda *a: True
 		return self
 	
+	def set_priority(self, priority):
+		"""
+		Sets one of PRIORITY_* constants, used to decide which waiting
+		request will be sent to daemon first. Default is PRIORITY_VISIBLE.
+		
+		Returns self.
+		"""
+		self._priority = priority
+		return self
+	
+	def _key(self):
+		""" Returns hashable value identifying what is requested """
+		return ("GET", self._command)
+	
+	def _join(self):
+		"""
+		Joins identical request that is already in flight, if there is
+		any, or registers this request as one that others can join.
+		Returns True if request was joined and should not be sent.
+		"""
+		key = self._key()
+		leader = self._parent._in_flight.get(key)
+		if leader is self:
+			# Request is being repeated
+			return False
+		if leader is not None and leader._epoch == self._epoch:
+			if not any(( r._is_duplicate(self) for r in [ leader ] + leader._followers )):
+				leader._followers.append(self)
+			self._parent._pool.promote(leader, self._priority)
+			log.verbose("Joined pending request for %s", self._command)
+			return True
+		self._parent._in_flight[key] = self
+		self._followers = []
+		return False
+	
+	def _finish(self):
+		"""
+		Unregisters request from list of requests in flight.
+		Returns list of requests that joined this one.
+		"""
+		key = self._key()
+		if self._parent._in_flight.get(key) is self:
+			del self._parent._in_flight[key]
+		followers, self._followers = self._followers, []
+		return followers
+	
+	def _is_duplicate(self, other):
+		""" Returns True if other request is identical to this one """
+		return (self._key() == other._key()
+			and self._callback == other._callback
+			and self._error_callback == other._error_callback
+			and self._callback_data == other._callback_data)
+	
 	def start(self):
-		if self._parent._address.startswith("127.0.0.1"):
-			self.set_enable_proxy(False)
 		self._epoch = self._parent._epoch
+		self._head = None
 		self._buffer = []
-		self.connect_to_host_async(self._parent._address, 0, None, self._connected)
+		self._decoder = None
+		if self._start_time is None:
+			self._start_time = time.time()
+			self._bytes_sent, self._bytes_received = 0, 0
+		if self._join():
+			return self
+		self._parent._pool.acquire(self)
 		return self
 
 
@@ -1238,20 +2378,27 @@ class RESTPOSTRequest(RESTRequest):
 		RESTRequest.__init__(self, parent, command, callback, error_callback, *callback_data)
 		self._data = data
 	
+	def _key(self):
+		return ("POST", self._command, json.dumps(self._data, sort_keys=True))
+	
+	def _join(self):
+		# POST requests are never joined, every one has to be sent
+		return False
+	
 	def _format_request(self):
 		"""
 		Formats POST request before sending it to daemon
 		"""
 		json_str = json.dumps(self._data)
 		return "\r\n".join([
-			"POST /rest/%s HTTP/1.0" % self._command,
-			"Host: %s" % self._parent._address,
+			"POST /rest/%s HTTP/1.1" % self._command,
+			"Host: %s" % self._parent._host,
 			"Cookie: %s" % self._parent._CSRFtoken,
 			(("X-%s" % self._parent._CSRFtoken.replace("=", ": ")) if self._parent._CSRFtoken else "X-nothing: x"),
 			(("X-API-Key: %s" % self._parent._api_key) if not self._parent._api_key is None else "X-nothing2: x"),
 			"Content-Length: %s" % len(json_str),
 			"Content-Type: application/json",
-			"Connection: close",
+			"Connection: keep-alive",
 			"",
 			json_str
 			]).encode("utf-8")
@@ -1266,20 +2413,27 @@ class EventPollLoop(RESTRequest):
 	def __init__(self, parent):
 		RESTRequest.__init__(self, parent, "events", None, None)
 		self._last_event_id = -1
+		self._event_types = None
 	
 	def _format_request(self):
 		"""
 		Event request is as special as it gets, with HTTP/1.1, connection held
 		and continuously requesting more and more data.
 		"""
+		if self._event_types != self._parent._event_types:
+			# Daemon numbers events separately for every set of
+			# requested event types, so counting has to start again
+			self._event_types = self._parent._event_types
+			self._last_event_id = -1
+		events = ",".join(sorted(self._event_types))
 		if self._last_event_id < 0:
-			url = "/rest/events?limit=1"
+			url = "/rest/events?limit=1&events=%s" % (events,)
 		else:
-			url = "/rest/events?since=%s" % (self._last_event_id,)
+			url = "/rest/events?since=%s&events=%s" % (self._last_event_id, events)
 		
 		return "\r\n".join([
 			"GET %s HTTP/1.1" % url,
-			"Host: %s" % self._parent._address,
+			"Host: %s" % self._parent._host,
 			"Cookie: %s" % self._parent._CSRFtoken,
 			(("X-%s" % self._parent._CSRFtoken.replace("=", ": ")) if self._parent._CSRFtoken else "X-nothing: x"),
 			(("X-API-Key: %s" % self._parent._api_key) if not self._parent._api_key is None else "X-nothing2: x"),
@@ -1292,6 +2446,7 @@ class EventPollLoop(RESTRequest):
 	def _error(self, exception):
 		if self._connection:
 			self._connection.close(None)
+		self._parent._stats.request_failed(self._command)
 		if self._epoch == self._parent._epoch:
 			if isinstance(exception, GLib.GError):
 				if exception.code in (0, 39, 34):	# Connection terminated unexpectedly, Connection Refused
@@ -1300,10 +2455,24 @@ class EventPollLoop(RESTRequest):
 			self._parent.timer(None, 1, self.start)
 	
 	def start(self):
-		RESTRequest.start(self)
-		self._buffer = b""
-		
+		# Event polling holds its connection for long time, so it
+		# doesn't take one from pool
+		self._epoch = self._parent._epoch
+		self._head = None
+		self._buffer = []
+		self._decoder = None
+		self._bytes_sent, self._bytes_received = 0, 0
+		self._open_connection()
+	
+	def _read(self):
+		self._connection.get_input_stream().read_bytes_async(READ_SIZE, 1, None, self._response)
+	
 	def _response(self, stream, results):
+		"""
+		Called every time when block of data is read. Response is
+		decoded incrementally, as it arrives, and processed once entire
+		JSON array of events is received.
+		"""
 		if self._parent._CSRFtoken is None and self._parent._api_key is None:
 			return RESTRequest._response(self, stream, results)
 		try:
@@ -1315,85 +2484,43 @@ class EventPollLoop(RESTRequest):
 		if self._epoch != self._parent._epoch:
 			self._connection.close(None)
 			return
-		
-		buffer = response.get_data()
-		assert type(buffer) == str
-		headers, response = self._split_headers(buffer)
-		if headers is None: return
-		headers = { x : y.strip() for (x,y) in [ h.split(":", 1) for h in headers if ":" in h ] }
-		if "Transfer-Encoding" not in headers or headers["Transfer-Encoding"] != "chunked":
-			# Something just went horribly wrong
-			self._error(InvalidHTTPResponse(buffer))
-			return
-		self._buffer = response
-		self._chunk_size = -1
-		self._parse_chunk()
-	
-	def _chunk(self, stream, results):
-		try:
-			response = stream.read_bytes_finish(results)
-			if response == None:
-				raise Exception("nothing")
-		except Exception as e:
-			return self._error(e)
-		if self._epoch != self._parent._epoch:
-			self._connection.close(None)
-			return
 		data = response.get_data()
+		self._bytes_received += len(data)
 		if len(data) == 0:
 			# Connection broken
 			self._connection.close(None)
 			return self.start()
-		self._buffer += data
-		self._parse_chunk()
-	
-	def _resend_request(self):
-		""" Sends another request using same connection """
-		self._chunk_size = -1
-		get_str = "\r\n".join([
-			"GET /rest/events?since=%s HTTP/1.1" % (self._last_event_id,),
-			"Host: %s" % self._parent._address,
-			(("X-API-Key: %s" % self._parent._api_key) if not self._parent._api_key is None else "X-nothing: x"),
-			"",
-			"",
-			]).encode("utf-8")
+		
+		if self._head is None:
+			self._buffer.append(data)
+			data = self._parse_head(b"".join(self._buffer))
+			if self._head is None:
+				return self._read()
+			headers, response = self._split_headers(self._head + b"\r\n\r\n")
+			if headers is None: return
+			if not self._chunked:
+				# Something just went horribly wrong
+				return self._error(InvalidHTTPResponse(self._head))
+		
 		try:
-			self._connection.get_output_stream().write_all(get_str, None)
-		except Exception as e:
+			if not self._decoder.feed(data):
+				return self._read()
+		except ValueError:
+			# Invalid response
 			self._connection.close(None)
 			return self.start()
-		self._connection.get_input_stream().read_bytes_async(10, 1, None, self._chunk)
-	
-	
-	def _parse_chunk(self):
-		if self._chunk_size < 0:
-			try:
-				# Try to decode chunk. May raise exception if only very few bytes
-				# have been read so far
-				size_str, rest = self._buffer.split(b"\r\n", 1)
-				self._chunk_size = int(size_str, 16)
-				self._buffer = rest
-				if self._chunk_size < 1:
-					# Zero-sized chunk means end of transfer
-					return self._resend_request()
-				self._chunk_size += 2	# 2b for following \r\n
-			except (ValueError, IndexError):
-				self._chunk_size = -1
-				self._connection.get_input_stream().read_bytes_async(100, 1, None, self._chunk)
-				return
-		retrieved = len(self._buffer)
-		if retrieved < self._chunk_size:
-			self._connection.get_input_stream().read_bytes_async(self._chunk_size - retrieved, 1, None, self._chunk)
-			return
 		
-		response, self._buffer = self._buffer[0:retrieved], self._buffer[retrieved:]
 		try:
-			events = json.loads(response)
+			events = json.loads(self._decoder.body())
 		except Exception:
 			# Invalid response
 			self._connection.close(None)
 			return self.start()
 		
+		stats = self._parent._stats
+		t = time.time()
+		if self._parent._recorder is not None and len(events) > 0:
+			self._parent._recorder.write_events(events, t)
 		for event in events:
 			if self._last_event_id >= 0 and event["id"] != self._last_event_id + 1:
 				# Event IDs are not continuous, something just went horribly wrong
@@ -1402,17 +2529,142 @@ class EventPollLoop(RESTRequest):
 				# different instance.
 				return self._parent._instance_replaced()
 			self._last_event_id = event["id"]
+			event_start = time.time()
 			self._parent._on_event(event)
-			sys.stdout.flush()
+			stats.event_handled(event["type"], time.time() - event_start)
+		sys.stdout.flush()
+		stats.request_finished(self._command, 0.0, t - self._send_time,
+			time.time() - t, self._bytes_received, self._bytes_sent)
 		
 		self._resend_request()
+	
+	def _resend_request(self):
+		""" Sends another request using same connection """
+		self._head = None
+		self._buffer = []
+		self._decoder = None
+		self._bytes_received, self._bytes_sent = 0, 0
+		get_str = self._format_request()
+		try:
+			self._connection.get_output_stream().write_all(get_str, None)
+		except Exception as e:
+			self._connection.close(None)
+			return self.start()
+		self._send_time = time.time()
+		self._bytes_sent += len(get_str)
+		self._read()
 
 
+def parse_browse_response(data):
+	"""
+	Converts db/browse response to list of (name, is_directory, size,
+	modified) tuples. Size and modified time are None for directories.
+	Older daemons send dict with list of [modified, size] for file and
+	dict for directory, newer one list of dicts.
+	"""
+	rv = []
+	if isinstance(data, dict):
+		for name in data:
+			if isinstance(data[name], dict):
+				rv.append((name, True, None, None))
+			else:
+				rv.append((name, False, data[name][1], data[name][0]))
+	elif data is not None:
+		for item in data:
+			if "DIRECTORY" in "%s" % (item.get("type"),):
+				rv.append((item["name"], True, None, None))
+			else:
+				rv.append((item["name"], False, item.get("size"), item.get("modTime")))
+	return rv
+
+def changed_keys(a, b):
+	""" Returns set of keys with different values in dicts a and b """
+	return set([ k for k in set(a.keys()) | set(b.keys()) if a.get(k) != b.get(k) ])
+
+def same_certificate(a, b):
+	""" Returns True if both Gio.TlsCertificate objects are same or both are None """
+	if a is None or b is None:
+		return a is b
+	return a.is_same(b)
+
+def decode_response(response, headers):
+	"""
+	Decodes JSON response body. Non-JSON response is returned as
+	{ 'data' : response }. Headers are added to returned dict under
+	HTTP_HEADERS key.
+	"""
+	try:
+		rdata = json.loads(response)
+	except IndexError: # No data
+		rdata = { }
+	except ValueError: # Not a JSON
+		rdata = {'data' : response }
+	if type(rdata) == dict:
+		rdata[HTTP_HEADERS] = headers
+	return rdata
+
+
+# Maps config.xml path to ((mtime, size), values) returned by read_gui_config
+_gui_config_cache = {}
+
+def read_gui_config(filename):
+	"""
+	Reads daemon configuration file and returns dict with 'address',
+	'apikey' and 'tls' keys taken from its <gui> element. Values not
+	present in file are None (False for 'tls').
+	
+	File is parsed incrementally and elements are discarded as soon as
+	they are parsed, so no DOM for possibly thousands of devices and
+	folders is built. Result is cached until file is modified.
+	
+	Raises InvalidConfigurationException if file cannot be read or
+	parsed, or if it doesn't specify gui address.
+	"""
+	try:
+		st = os.stat(filename)
+	except Exception as e:
+		raise InvalidConfigurationException("Failed to read daemon configuration: %s" % e)
+	stamp = (st.st_mtime, st.st_size)
+	if filename in _gui_config_cache and _gui_config_cache[filename][0] == stamp:
+		return dict(_gui_config_cache[filename][1])
+	values = { "address" : None, "apikey" : None, "tls" : False }
+	found, depth = False, 0
+	try:
+		log.debug("Reading syncthing config %s", filename)
+		with open(filename, "rb") as f:
+			for event, element in ElementTree.iterparse(f, ("start", "end")):
+				if event == "start":
+					depth += 1
+					continue
+				depth -= 1
+				if depth == 1 and element.tag == "gui":
+					# <gui> is direct child of <configuration>
+					found = True
+					values["tls"] = (element.get("tls") or "").lower() == "true"
+					for key in ("address", "apikey"):
+						child = element.find(key)
+						if child is not None and child.text:
+							values[key] = child.text.strip()
+					break
+				if depth <= 1:
+					# Whole <folder>, <device> or whatever else was parsed
+					element.clear()
+	except Exception as e:
+		raise InvalidConfigurationException("Failed to parse daemon configuration: %s" % e)
+	if not found or not values["address"]:
+		raise InvalidConfigurationException("Required configuration node not found in daemon config file")
+	_gui_config_cache[filename] = (stamp, values)
+	return dict(values)
 
 class InvalidConfigurationException(RuntimeError): pass
 class TLSUnsupportedException(RuntimeError): pass
 class TLSErrorException(RuntimeError): pass
 
+class ConfigChangeException(RuntimeError):
+	def __init__(self, setting_name, exception):
+		RuntimeError.__init__(self, "Failed to change '%s': %s" % (setting_name, exception))
+		self.setting_name = setting_name
+
 class HTTPError(RuntimeError):
 	def __init__(self, message, full_response):
 		RuntimeError.__init__(self, message)
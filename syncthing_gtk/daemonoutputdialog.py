@@ -21,9 +21,11 @@ class DaemonOutputDialog(object):
 		""" Convince method that allows widgets to be accessed via self["widget"] """
 		return self.builder.get_object(name)
 	
-	def show_with_lines(self, lines, parent=None):
+	def show_with_lines(self, lines, parent=None, title=None):
 		if not parent is None:
 			self["dialog"].set_transient_for(parent)
+		if not title is None:
+			self["dialog"].set_title(title)
 		self["dialog"].show_all()
 		self["tvOutput"].get_buffer().set_text("\n".join(lines))
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - EventRecorder
+
+Writes event batches received from daemon into gzip-compressed file,
+one JSON object per line, so exact event sequence can be replayed
+later (see benchmarks/replay.py).
+
+Every line contains time when it was written under 't' key and either
+'events' with list of events or 'config' with devices and folders,
+stored in same form as in snapshot.
+"""
+
+from __future__ import unicode_literals
+import json, gzip, time, logging
+log = logging.getLogger("EventRecorder")
+
+class EventRecorder(object):
+	def __init__(self, filename):
+		self.filename = filename
+		self._file = gzip.open(filename, "wb")
+		log.info("Recording events to %s", filename)
+
+	def _write(self, t, key, data):
+		line = json.dumps({ "t" : t, key : data }) + "\n"
+		self._file.write(line.encode("utf-8"))
+		# Flushed after every line, so recording is usable even
+		# if program crashes
+		self._file.flush()
+
+	def write_config(self, config, t=None):
+		self._write(time.time() if t is None else t, "config", config)
+
+	def write_events(self, events, t=None):
+		self._write(time.time() if t is None else t, "events", events)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+
+def read_recording(filename):
+	"""
+	Generates (time, key, data) tuples from recorded file. Reading stops
+	silently at truncated end of file.
+	"""
+	with gzip.open(filename, "rb") as f:
+		try:
+			for line in f:
+				record = json.loads(line.decode("utf-8"))
+				t = record.pop("t")
+				for key in record:
+					yield t, key, record[key]
+		except (IOError, EOFError, ValueError) as e:
+			log.warning("Recording %s is truncated: %s", filename, e)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - Headless
+
+Command line interface printing state of folders and devices, or
+waiting until folders are synchronized, using Daemon class without
+loading anything from GTK. Started by 'syncthing-gtk --status',
+'syncthing-gtk --watch' or 'syncthing-gtk --wait-synced FOLDER'.
+"""
+
+from __future__ import unicode_literals, print_function
+from gi.repository import GLib
+from syncthing_gtk.daemon import Daemon, InvalidConfigurationException, TLSErrorException
+from syncthing_gtk.tools import set_logging_level, sizeof_fmt
+import os, sys, json, time, logging, argparse
+log = logging.getLogger("Headless")
+
+# Options that cause headless mode to be used instead of GUI
+HEADLESS_OPTIONS = ("--status", "--watch", "--wait-synced")
+
+# Exit codes
+EXIT_OK				= 0
+EXIT_FAILED			= 1		# Failed to read configuration or to connect
+EXIT_TIMEOUT		= 2		# Daemon didn't respond or folders didn't sync in time
+EXIT_NO_FOLDER		= 3		# Folder to wait for doesn't exist
+
+# Default time limit for collecting status, in seconds
+STATUS_TIMEOUT = 30
+
+
+class Headless(object):
+	"""
+	Keeps last known state of folders and devices, updated from Daemon
+	signals, and prints it.
+	"""
+	def __init__(self, daemon, args):
+		self.daemon = daemon
+		self.args = args
+		self.loop = GLib.MainLoop()
+		self.exit_code = EXIT_OK
+		# If set, connection is retried when lost or refused
+		self.persistent = args.watch
+		self.timeout = STATUS_TIMEOUT if args.timeout is None else args.timeout
+		self.reset()
+
+		daemon.connect("connection-error", self.cb_connection_error)
+		daemon.connect("disconnected", self.cb_disconnected)
+		daemon.connect("my-id-changed", self.cb_my_id_changed)
+		daemon.connect("device-added", self.cb_device_added)
+		daemon.connect("device-data-changed", self.cb_device_data_changed)
+		daemon.connect("device-connected", self.cb_device_state, "connected")
+		daemon.connect("device-disconnected", self.cb_device_state, "disconnected")
+		daemon.connect("device-paused", self.cb_device_state, "paused")
+		daemon.connect("device-resumed", self.cb_device_state, "disconnected")
+		daemon.connect("device-sync-started", self.cb_device_sync)
+		daemon.connect("device-sync-progress", self.cb_device_sync)
+		daemon.connect("device-sync-finished", self.cb_device_sync, 1.0)
+		daemon.connect("folder-added", self.cb_folder_added)
+		daemon.connect("folder-data-changed", self.cb_folder_data_changed)
+		daemon.connect("folder-data-failed", self.cb_folder_state, "unknown", 0.0)
+		daemon.connect("folder-sync-started", self.cb_folder_state, "syncing", 0.0)
+		daemon.connect("folder-sync-progress", self.cb_folder_progress, "syncing")
+		daemon.connect("folder-sync-finished", self.cb_folder_state, "idle", 1.0)
+		daemon.connect("folder-scan-started", self.cb_folder_state, "scanning", 0.0)
+		daemon.connect("folder-scan-progress", self.cb_folder_progress, "scanning")
+		daemon.connect("folder-scan-finished", self.cb_folder_state, "idle", 1.0)
+		daemon.connect("folder-stopped", self.cb_folder_stopped)
+
+	def reset(self):
+		""" Throws away everything known about daemon """
+		self.my_id = None
+		self.complete = False	# Set when state of everything is known
+		self.folders = {}		# id -> dict
+		self.devices = {}		# id -> dict
+		self.folder_order = []
+		self.device_order = []
+		self.known_devices = set()	# Devices with data from system/connections
+
+	def run(self):
+		""" Connects to daemon and runs until done. Returns exit code """
+		if self.timeout and not self.args.watch:
+			GLib.timeout_add_seconds(self.timeout, self.cb_timeout)
+		self.daemon.reconnect()
+		self.loop.run()
+		return self.exit_code
+
+	def quit(self, exit_code):
+		self.exit_code = exit_code
+		self.loop.quit()
+
+	def check_complete(self):
+		"""
+		Called after every change. Once state of all folders and devices
+		is known, prints it and either exits or continues watching.
+		"""
+		if self.complete:
+			return
+		if self.my_id is None or None in [ f["state"] for f in self.folders.values() ]:
+			return
+		if not self.known_devices.issuperset(set(self.devices) - set([ self.my_id ])):
+			return
+		self.complete = True
+		self.print_status()
+		if self.args.watch:
+			# Status of all folders should be refreshed when changed
+			self.daemon.set_visible_folders(self.folders)
+		else:
+			self.quit(EXIT_OK)
+
+	### Output ###
+
+	def output(self, text, data):
+		if self.args.json:
+			print(json.dumps(data))
+		else:
+			print(text)
+		sys.stdout.flush()
+
+	def print_status(self):
+		if self.args.json:
+			self.output(None, {
+				"folders" : [ self.folders[x] for x in self.folder_order ],
+				"devices" : [ self.devices[x] for x in self.device_order if x != self.my_id ],
+			})
+			return
+		lines = [ "Folders:" ]
+		for rid in self.folder_order:
+			lines.append("  %s" % (self.format_folder(self.folders[rid]),))
+		lines.append("Devices:")
+		for nid in self.device_order:
+			if nid != self.my_id:
+				lines.append("  %s" % (self.format_device(self.devices[nid]),))
+		self.output("\n".join(lines), None)
+
+	def format_folder(self, f):
+		text = "%-30s %s" % (f["label"] or f["id"], f["state"] or "unknown")
+		if f["state"] in ("syncing", "scanning") and f["progress"] > 0.0:
+			text += " %.0f%%" % (100.0 * f["progress"],)
+		if f["state"] == "stopped" and f["reason"]:
+			text += " (%s)" % (f["reason"],)
+		elif f["need_files"] > 0:
+			text += ", need %s files, %s" % (f["need_files"], sizeof_fmt(f["need_bytes"]).strip())
+		return text
+
+	def format_device(self, d):
+		text = "%-30s %s" % (d["name"] or d["id"], d["state"])
+		if d["state"] == "connected" and d["progress"] < 1.0:
+			text += ", syncing %.0f%%" % (100.0 * d["progress"],)
+		return text
+
+	def folder_changed(self, rid):
+		if self.complete and self.args.watch:
+			self.output("%s folder %s" % (time.strftime("%H:%M:%S"), self.format_folder(self.folders[rid])),
+				dict(self.folders[rid], time=time.time(), kind="folder"))
+		self.check_complete()
+
+	def device_changed(self, nid):
+		if self.complete and self.args.watch and nid != self.my_id:
+			self.output("%s device %s" % (time.strftime("%H:%M:%S"), self.format_device(self.devices[nid])),
+				dict(self.devices[nid], time=time.time(), kind="device"))
+		self.check_complete()
+
+	### Callbacks ###
+
+	def cb_timeout(self, *a):
+		if not self.complete:
+			# Print at least what is known
+			print("Timed out while waiting for daemon", file=sys.stderr)
+			if self.folders or self.devices:
+				self.print_status()
+			self.quit(EXIT_TIMEOUT)
+		return False
+
+	def cb_connection_error(self, daemon, reason, message, exception):
+		if reason == Daemon.REFUSED and self.persistent:
+			# Daemon is not running yet, Daemon class will try again
+			return
+		print("Failed to connect to daemon: %s" % (message,), file=sys.stderr)
+		self.quit(EXIT_FAILED)
+
+	def cb_disconnected(self, daemon, reason, message):
+		if not self.persistent:
+			print("Daemon disconnected: %s" % (message,), file=sys.stderr)
+			self.quit(EXIT_FAILED)
+			return
+		if self.args.watch:
+			self.output("%s disconnected %s" % (time.strftime("%H:%M:%S"), message),
+				{ "kind" : "disconnected", "time" : time.time(), "message" : message })
+		self.reset()
+		GLib.timeout_add_seconds(1, self.cb_reconnect)
+
+	def cb_reconnect(self, *a):
+		self.daemon.reconnect()
+		return False
+
+	def cb_my_id_changed(self, daemon, device_id):
+		self.my_id = device_id
+		self.check_complete()
+
+	def cb_device_added(self, daemon, nid, name, used, data):
+		self.devices[nid] = { "id" : nid, "name" : name, "state" : "disconnected", "progress" : 1.0 }
+		self.device_order.append(nid)
+
+	def cb_device_data_changed(self, daemon, nid, *a):
+		self.known_devices.add(nid)
+		self.check_complete()
+
+	def cb_device_state(self, daemon, nid, state):
+		if nid in self.devices and self.devices[nid]["state"] != state:
+			self.devices[nid]["state"] = state
+			self.device_changed(nid)
+
+	def cb_device_sync(self, daemon, nid, progress):
+		if nid in self.devices:
+			self.devices[nid]["progress"] = progress
+			self.device_changed(nid)
+
+	def cb_folder_added(self, daemon, rid, r):
+		self.folders[rid] = {
+			"id" : rid, "label" : r.get("label") or "", "path" : r["path"],
+			"state" : None, "progress" : 0.0, "reason" : None,
+			"need_files" : 0, "need_bytes" : 0,
+		}
+		self.folder_order.append(rid)
+
+	def cb_folder_data_changed(self, daemon, rid, data):
+		if rid in self.folders:
+			f = self.folders[rid]
+			f["need_files"] = data["needFiles"] + data["needSymlinks"] + data.get("receiveOnlyTotalItems", 0)
+			f["need_bytes"] = data["needBytes"] + data.get("receiveOnlyChangedBytes", 0)
+			if f["state"] is None:
+				f["state"] = data["state"]
+			self.folder_changed(rid)
+
+	def cb_folder_state(self, daemon, rid, state, progress):
+		if rid in self.folders:
+			self.folders[rid]["state"] = state
+			self.folders[rid]["progress"] = progress
+			self.folders[rid]["reason"] = None
+			self.folder_changed(rid)
+
+	def cb_folder_progress(self, daemon, rid, progress, state):
+		self.cb_folder_state(daemon, rid, state, progress)
+
+	def cb_folder_stopped(self, daemon, rid, reason):
+		if rid in self.folders:
+			self.folders[rid]["state"] = "stopped"
+			self.folders[rid]["reason"] = reason
+			self.folder_changed(rid)
+
+
+class Waiter(Headless):
+	"""
+	Waits until specified folders are idle, have nothing to download and
+	are completely synchronized to all devices they are shared with.
+	Everything is driven by Daemon signals; Folder status is requested
+	again only when daemon reports change.
+	"""
+	def __init__(self, daemon, args):
+		Headless.__init__(self, daemon, args)
+		self.persistent = True
+		self.timeout = args.timeout
+		daemon.connect("config-loaded", self.cb_config_loaded)
+		daemon.connect("folder-completion", self.cb_folder_completion)
+
+	def reset(self):
+		Headless.reset(self)
+		self.folder_devices = {}	# folder id -> list of device ids
+		self.completion = {}		# (folder id, device id) -> percentage
+		self.waiting_for = None		# Folder ids, known after config is loaded
+		self.completion_requested = False
+
+	def find_folder(self, name):
+		""" Returns id of folder with given id, label or path """
+		if name in self.folders:
+			return name
+		for rid in self.folder_order:
+			if self.folders[rid]["label"] == name:
+				return rid
+		path = os.path.normpath(os.path.abspath(os.path.expanduser(name)))
+		for rid in self.folder_order:
+			if os.path.normpath(os.path.expanduser(self.folders[rid]["path"])) == path:
+				return rid
+		return None
+
+	def request_completion(self):
+		""" Asks for initial completion, once own device ID is known """
+		if self.completion_requested or self.waiting_for is None or self.my_id is None:
+			return
+		self.completion_requested = True
+		for rid in self.waiting_for:
+			for nid in self.folder_devices[rid]:
+				if nid != self.my_id:
+					self.daemon.request_completion(rid, nid)
+
+	def get_pending(self):
+		""" Returns list of (folder id, reason) for folders not yet synced """
+		pending = []
+		for rid in self.waiting_for:
+			f = self.folders[rid]
+			if f["state"] != "idle":
+				pending.append((rid, f["state"] or "unknown"))
+			elif f["need_files"] > 0 or f["need_bytes"] > 0:
+				pending.append((rid, "needs %s files" % (f["need_files"],)))
+			else:
+				for nid in self.folder_devices[rid]:
+					if nid != self.my_id:
+						completion = self.completion.get((rid, nid))
+						if completion is None or completion < 100.0:
+							name = self.devices[nid]["name"] if nid in self.devices else nid
+							pending.append((rid, "%s is %.0f%% complete" % (name, completion or 0.0)))
+							break
+		return pending
+
+	def check_complete(self):
+		if self.waiting_for is None or self.my_id is None:
+			return
+		self.request_completion()
+		if not self.completion_requested or self.get_pending():
+			return
+		self.quit(EXIT_OK)
+
+	def cb_timeout(self, *a):
+		print("Timed out while waiting for folders to synchronize", file=sys.stderr)
+		if self.waiting_for is not None:
+			for rid, reason in self.get_pending():
+				print("  %s: %s" % (self.folders[rid]["label"] or rid, reason), file=sys.stderr)
+		self.quit(EXIT_TIMEOUT)
+		return False
+
+	def cb_folder_added(self, daemon, rid, r):
+		Headless.cb_folder_added(self, daemon, rid, r)
+		self.folder_devices[rid] = [ n["deviceID"] for n in r["devices"] ]
+
+	def cb_config_loaded(self, daemon, config):
+		waiting_for = set()
+		for name in self.args.wait_synced:
+			rid = self.find_folder(name)
+			if rid is None:
+				print("Unknown folder: %s" % (name,), file=sys.stderr)
+				self.quit(EXIT_NO_FOLDER)
+				return
+			waiting_for.add(rid)
+		self.waiting_for = waiting_for
+		# Status of those folders should be requested again when changed
+		self.daemon.set_visible_folders(waiting_for)
+		self.check_complete()
+
+	def cb_folder_completion(self, daemon, rid, nid, completion):
+		self.completion[(rid, nid)] = completion
+		self.check_complete()
+
+
+def is_headless(argv):
+	""" Returns True if command line arguments ask for headless mode """
+	return any([ x.split("=", 1)[0] in HEADLESS_OPTIONS for x in argv ])
+
+def main(argv):
+	"""
+	Entry point for headless mode. argv shouldn't include program name.
+	Returns exit code.
+	"""
+	parser = argparse.ArgumentParser(prog="syncthing-gtk",
+		description="Prints state of Syncthing folders and devices")
+	mode = parser.add_mutually_exclusive_group(required=True)
+	mode.add_argument("--status", action="store_true",
+		help="print state of all folders and devices and exit")
+	mode.add_argument("--watch", action="store_true",
+		help="print state and then every change, until interrupted")
+	mode.add_argument("--wait-synced", action="append", metavar="FOLDER",
+		help="wait until folder (id, label or path) is synchronized with all devices; "
+			"may be used more than once")
+	parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+	parser.add_argument("--timeout", type=int, default=None,
+		help="time limit for --status (default %s) and --wait-synced (default none), "
+			"in seconds" % (STATUS_TIMEOUT,))
+	parser.add_argument("--home", help="overrides default syncthing configuration directory")
+	parser.add_argument("-v", "--verbose", action="store_true", help="be verbose")
+	parser.add_argument("-d", "--debug", action="store_true", help="be more verbose (debug mode)")
+	args = parser.parse_args(argv)
+
+	set_logging_level(args.verbose, args.debug)
+	if not args.verbose and not args.debug:
+		# Only problems are logged, output is for the user
+		logging.getLogger().setLevel(logging.WARNING)
+	try:
+		if args.home:
+			daemon = Daemon(os.path.join(args.home, "config.xml"))
+		else:
+			daemon = Daemon()
+	except (InvalidConfigurationException, TLSErrorException) as e:
+		print(e, file=sys.stderr)
+		return EXIT_FAILED
+	try:
+		if args.wait_synced:
+			return Waiter(daemon, args).run()
+		return Headless(daemon, args).run()
+	except KeyboardInterrupt:
+		return EXIT_OK
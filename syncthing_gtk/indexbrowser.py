@@ -0,0 +1,223 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - IndexBrowser
+
+Displays folder content as known to daemon index, without accessing
+local disk. Directories are loaded one level at time, when expanded.
+"""
+
+from __future__ import unicode_literals
+from gi.repository import Gtk
+from syncthing_gtk.tools import _ # gettext function
+from syncthing_gtk.tools import sizeof_fmt, parsetime
+from syncthing_gtk.timermanager import TimerManager
+from syncthing_gtk.uibuilder import UIBuilder
+from syncthing_gtk.daemon import parse_browse_response
+import os, logging
+log = logging.getLogger("IndexBrowser")
+
+# Directories changed by index updates are reloaded after this many
+# seconds and at most once in this time, so burst of updates causes
+# only one request per directory
+REFRESH_DELAY = 2
+
+# Tree store columns
+COL_NAME, COL_SIZE, COL_MODIFIED, COL_ICON, COL_PATH = range(0, 5)
+
+class IndexBrowser(TimerManager):
+	""" Dialog with lazily loaded tree of folder content """
+	def __init__(self, app, rid, title):
+		TimerManager.__init__(self)
+		self.app = app
+		self.rid = rid
+		self.title = title
+		# cache holds parsed content of loaded directories, by path
+		self.cache = {}
+		# rows holds Gtk.TreeRowReference for every directory row, by path
+		self.rows = {}
+		# stale holds paths of directories changed since they were loaded
+		self.stale = set([])
+		# Increased with every change; Responses requested before
+		# change are displayed, but not cached
+		self.generation = 0
+		self.handler = 0
+		self.setup_widgets()
+	
+	def __getitem__(self, name):
+		""" Convince method that allows widgets to be accessed via self["widget"] """
+		return self.builder.get_object(name)
+	
+	def show(self, parent=None):
+		if not parent is None:
+			self["dialog"].set_transient_for(parent)
+		self["dialog"].show_all()
+	
+	def close(self, *a):
+		self.cancel_all()
+		if self.handler > 0:
+			self.app.daemon.disconnect(self.handler)
+			self.handler = 0
+		self["dialog"].set_visible(False)
+		self["dialog"].destroy()
+	
+	def setup_widgets(self):
+		# Load glade file
+		self.builder = UIBuilder()
+		self.builder.add_from_file(os.path.join(self.app.gladepath, "index-browser.glade"))
+		self.builder.connect_signals(self)
+		self["dialog"].set_title("%s - %s" % (_("Folder Index"), self.title))
+		self.handler = self.app.daemon.connect("folder-index-updated", self.cb_index_updated)
+	
+	def on_dialog_response(self, *a):
+		self.close()
+	
+	def cb_btClose_clicked(self, *a):
+		self.close()
+	
+	def cb_btRefresh_clicked(self, *a):
+		self.load()
+	
+	def load(self):
+		""" (Re)loads everything, starting with folder root """
+		self["tsItems"].clear()
+		self["btRefresh"].set_sensitive(False)
+		self.cache, self.rows, self.stale = {}, {}, set([])
+		self.generation += 1
+		self.request("")
+	
+	def request(self, path):
+		""" Displays content of directory, loading it if needed """
+		if path in self.cache:
+			self.fill(path, self.cache[path])
+			return
+		if path == "":
+			self["lblStatus"].set_text(_("Loading..."))
+		self.app.daemon.read_browse(self.rid, path, self.cb_loaded, self.cb_failed,
+			path, self.generation)
+	
+	def get_iter(self, path):
+		"""
+		Returns iter of directory row, None for folder root and False
+		if there is no such row anymore.
+		"""
+		if path == "":
+			return None
+		if path in self.rows and self.rows[path].valid():
+			return self["tsItems"].get_iter(self.rows[path].get_path())
+		return False
+	
+	def cb_loaded(self, data, path, generation):
+		items = sorted(parse_browse_response(data), key=lambda x : (not x[1], x[0].lower()))
+		if generation == self.generation:
+			self.cache[path] = items
+		self.fill(path, items)
+		if path == "":
+			self["btRefresh"].set_sensitive(True)
+			dirs = len([ x for x in items if x[1] ])
+			self["lblStatus"].set_text(_("%s directories, %s files, as known to Syncthing") % (
+				dirs, len(items) - dirs))
+	
+	def cb_failed(self, exception, command, path, generation):
+		log.error("Failed to browse '%s': %s", path, exception)
+		self["btRefresh"].set_sensitive(True)
+		self["lblStatus"].set_text(_("Failed to load folder content: %s") % (exception,))
+	
+	def fill(self, path, items):
+		"""
+		Updates children of directory row to match items. Rows of
+		directories that still exist are kept, so their expanded
+		subdirectories stay as they are.
+		"""
+		parent = self.get_iter(path)
+		if parent is False:
+			# Row was removed in meanwhile
+			return
+		store = self["tsItems"]
+		names = { name : is_dir for (name, is_dir, size, modified) in items }
+		existing = {}
+		it = store.iter_children(parent)
+		while it is not None:
+			next_it = store.iter_next(it)
+			name, child_path = store.get_value(it, COL_NAME), store.get_value(it, COL_PATH)
+			if child_path is None or names.get(name) != (child_path != ""):
+				# Placeholder, removed item or item that changed type
+				store.remove(it)
+			else:
+				existing[name] = it
+			it = next_it
+		# Every item is placed right after previous one, so rows end up
+		# in same order as items, no matter where kept rows were
+		previous = None
+		for (name, is_dir, size, modified) in items:
+			child_path = "/".join([ path, name ]) if path else name
+			size = "" if size is None else sizeof_fmt(size)
+			modified = format_time(modified)
+			if name in existing:
+				it = existing[name]
+				store.set(it, [ COL_SIZE, COL_MODIFIED ], [ size, modified ])
+				expected = store.iter_children(parent) if previous is None else store.iter_next(previous)
+				if expected is None or store.get_path(expected) != store.get_path(it):
+					store.move_after(it, previous)
+			elif is_dir:
+				it = store.insert_after(parent, previous, (name, size, modified, "folder", child_path))
+				store.append(it, (_("Loading..."), "", "", None, None))
+				self.rows[child_path] = Gtk.TreeRowReference.new(store, store.get_path(it))
+			else:
+				it = store.insert_after(parent, previous, (name, size, modified, "text-x-generic", ""))
+			previous = it
+	
+	def cb_tvItems_test_expand_row(self, tv, it, tree_path):
+		store = self["tsItems"]
+		child = store.iter_children(it)
+		if child is not None and store.get_value(child, COL_PATH) is None:
+			# Only placeholder is there, directory is not loaded yet
+			self.request(store.get_value(it, COL_PATH))
+		return False
+	
+	def cb_index_updated(self, daemon, rid, filenames):
+		if rid != self.rid:
+			return
+		self.generation += 1
+		if filenames is None:
+			# Changed files are not known
+			self.stale.update(self.cache.keys())
+			self.cache = {}
+		else:
+			for filename in filenames:
+				# Every parent directory may be affected
+				parts = filename.strip("/").split("/")
+				for i in range(0, len(parts)):
+					path = "/".join(parts[0:i])
+					self.stale.add(path)
+					if path in self.cache:
+						del self.cache[path]
+		if len(self.stale) and not self.timer_active("refresh"):
+			self.timer("refresh", REFRESH_DELAY, self.refresh_stale)
+	
+	def refresh_stale(self):
+		"""
+		Reloads changed directories that are displayed. Collapsed
+		ones are loaded again when expanded.
+		"""
+		store, tv = self["tsItems"], self["tvItems"]
+		for path in sorted(self.stale):
+			it = self.get_iter(path)
+			if it is None or (it is not False and tv.row_expanded(store.get_path(it))):
+				self.request(path)
+			elif it is not False:
+				# Replace content with placeholder
+				child = store.iter_children(it)
+				while child is not None:
+					store.remove(child)
+					child = store.iter_children(it)
+				store.append(it, (_("Loading..."), "", "", None, None))
+		self.stale = set([])
+
+def format_time(t):
+	""" Formats time received from daemon, returns empty string for None """
+	if t is None:
+		return ""
+	try:
+		return parsetime(t).strftime("%Y-%m-%d %H:%M")
+	except ValueError:
+		return ""
@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - NeedBrowser
+
+Lists items that folder needs to synchronize. List is loaded from
+daemon page by page, as user scrolls to its end.
+"""
+
+from __future__ import unicode_literals
+from syncthing_gtk.tools import _ # gettext function
+from syncthing_gtk.tools import sizeof_fmt, parsetime
+from syncthing_gtk.uibuilder import UIBuilder
+from syncthing_gtk.daemon import NEED_TOTALS
+import os, logging
+log = logging.getLogger("NeedBrowser")
+
+# Lists in db/need response, in order in which are items displayed
+SECTIONS = ("progress", "queued", "rest")
+# Values of 'type' used for directories by various daemon versions
+DIRECTORY_TYPES = (1, "DIRECTORY", "FILE_INFO_TYPE_DIRECTORY")
+
+class NeedBrowser(object):
+	""" Dialog with list of out of sync items """
+	def __init__(self, app, rid, title):
+		self.app = app
+		self.rid = rid
+		self.page = 0			# Last loaded page
+		self.loading = False
+		self.complete = False	# True when last page is loaded
+		self.count = 0
+		# Last known need totals of folder (see NEED_TOTALS);
+		# Change of them means that list has changed
+		self.totals = app.daemon.get_need_totals(rid)
+		self.handler = 0
+		self.setup_widgets(title)
+	
+	def __getitem__(self, name):
+		""" Convince method that allows widgets to be accessed via self["widget"] """
+		return self.builder.get_object(name)
+	
+	def show(self, parent=None):
+		if not parent is None:
+			self["dialog"].set_transient_for(parent)
+		self["dialog"].show_all()
+	
+	def close(self, *a):
+		if self.handler > 0:
+			self.app.daemon.disconnect(self.handler)
+			self.handler = 0
+		self["dialog"].set_visible(False)
+		self["dialog"].destroy()
+	
+	def setup_widgets(self, title):
+		# Load glade file
+		self.builder = UIBuilder()
+		self.builder.add_from_file(os.path.join(self.app.gladepath, "need-browser.glade"))
+		self.builder.connect_signals(self)
+		self["dialog"].set_title("%s - %s" % (_("Out of Sync Items"), title))
+		adj = self["sw"].get_vadjustment()
+		adj.connect("value-changed", self.cb_scrolled)
+		adj.connect("changed", self.cb_scrolled)
+		self.handler = self.app.daemon.connect("folder-data-changed", self.cb_folder_data_changed)
+	
+	def on_dialog_response(self, *a):
+		self.close()
+	
+	def cb_btClose_clicked(self, *a):
+		self.close()
+	
+	def cb_btRefresh_clicked(self, *a):
+		self.load()
+	
+	def load(self):
+		""" (Re)loads list, starting with first page """
+		self["lstItems"].clear()
+		self["btRefresh"].set_sensitive(False)
+		self.page = 0
+		self.count = 0
+		self.complete = False
+		self.loading = False
+		self.load_next()
+	
+	def load_next(self):
+		self.loading = True
+		self["lblStatus"].set_text(_("Loading..."))
+		self.app.daemon.read_need(self.rid, self.page + 1,
+			self.cb_page_loaded, self.cb_page_failed, self.page + 1)
+	
+	def cb_scrolled(self, adj, *a):
+		if self.loading or self.complete:
+			return
+		if adj.get_value() + 2 * adj.get_page_size() >= adj.get_upper():
+			# Less than one screen of items is left below visible ones
+			self.load_next()
+	
+	def cb_page_loaded(self, data, page):
+		if page != self.page + 1:
+			# Response for list that was reloaded in meanwhile
+			return
+		self.page, self.loading = page, False
+		received = 0
+		states = {
+			"progress" : _("Syncing"),
+			"queued" : _("Queued"),
+			"rest" : _("Waiting"),
+		}
+		for section in SECTIONS:
+			for item in (data.get(section) or []):
+				modified = ""
+				if item.get("modified"):
+					modified = parsetime(item["modified"]).strftime("%Y-%m-%d %H:%M")
+				self["lstItems"].append((
+					item["name"],
+					"" if item.get("type") in DIRECTORY_TYPES else sizeof_fmt(item.get("size", 0)),
+					modified,
+					_("Deleted") if item.get("deleted") else states[section]
+				))
+				received += 1
+		self.count += received
+		perpage = data.get("perpage")
+		self.complete = received == 0 or (perpage is not None and received < perpage)
+		if self.count == 0:
+			self["lblStatus"].set_text(_("Folder is up to date"))
+		elif self.complete:
+			self["lblStatus"].set_text(_("%s items") % (self.count,))
+		else:
+			self["lblStatus"].set_text(_("%s items loaded, scroll down to load more") % (self.count,))
+		self.cb_scrolled(self["sw"].get_vadjustment())
+	
+	def cb_page_failed(self, exception, command, page):
+		if page != self.page + 1:
+			return
+		log.error("Failed to load out of sync items: %s", exception)
+		self.loading = False
+		self.complete = True
+		self["lblStatus"].set_text(_("Failed to load list: %s") % (exception,))
+		self["btRefresh"].set_sensitive(True)
+	
+	def cb_folder_data_changed(self, daemon, rid, data):
+		if rid != self.rid:
+			return
+		totals = tuple([ data.get(x) for x in NEED_TOTALS ])
+		if self.totals is not None and totals != self.totals:
+			# Daemon has already thrown away cached pages, so refresh
+			# will load current list
+			self["btRefresh"].set_sensitive(True)
+			if self.complete or self.page > 0:
+				self["lblStatus"].set_text(_("Folder has changed, list may be outdated"))
+		self.totals = totals
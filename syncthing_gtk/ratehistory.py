@@ -0,0 +1,74 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - RateHistory
+
+Fixed-size history of transfer rates measured for single device.
+Samples are stored in array-backed ring buffers, so used memory
+doesn't grow no matter how long is history recorded.
+"""
+
+from __future__ import unicode_literals
+from array import array
+import math, time
+
+# Number of samples kept. Samples are taken with every system/connections
+# poll, which is, with default refresh interval of 1s, repeated at most
+# every 2s (see POLL_ACTIVE in daemon.py), so that's at least one hour
+# of history
+HISTORY_SIZE = 3600 // 2
+# Time constant (in seconds) of exponentially weighted moving average
+EWMA_TIME = 15.0
+
+class RateHistory(object):
+	def __init__(self, size=HISTORY_SIZE, ewma_time=EWMA_TIME):
+		self._size = size
+		self._ewma_time = ewma_time
+		self._times = array(str("d"), [0.0]) * size
+		self._in = array(str("d"), [0.0]) * size
+		self._out = array(str("d"), [0.0]) * size
+		self._pos = 0		# Where next sample goes
+		self._count = 0		# Number of stored samples
+		self._in_ewma = 0.0
+		self._out_ewma = 0.0
+
+	def add(self, inbps, outbps, t=None):
+		""" Stores new sample and updates smoothed rates """
+		t = time.time() if t is None else t
+		if self._count == 0:
+			self._in_ewma, self._out_ewma = inbps, outbps
+		else:
+			# Weight of new sample depends on time since last one,
+			# as samples are not taken in regular intervals
+			dt = max(0.0, t - self._times[self._pos - 1])
+			a = 1.0 - math.exp(-dt / self._ewma_time)
+			self._in_ewma += a * (inbps - self._in_ewma)
+			self._out_ewma += a * (outbps - self._out_ewma)
+		self._times[self._pos] = t
+		self._in[self._pos] = inbps
+		self._out[self._pos] = outbps
+		self._pos = (self._pos + 1) % self._size
+		self._count = min(self._count + 1, self._size)
+
+	def get_smoothed(self):
+		""" Returns (inbps, outbps) tuple of smoothed rates """
+		return self._in_ewma, self._out_ewma
+
+	def get_last(self, minutes, now=None):
+		"""
+		Returns list of (time, inbps, outbps) tuples for samples taken
+		during last 'minutes' minutes, oldest first.
+		"""
+		now = time.time() if now is None else now
+		since = now - minutes * 60.0
+		rv = []
+		i = self._pos
+		for x in range(self._count):
+			i = (i - 1) % self._size
+			if self._times[i] < since:
+				break
+			rv.append((self._times[i], self._in[i], self._out[i]))
+		rv.reverse()
+		return rv
+
+	def __len__(self):
+		return self._count
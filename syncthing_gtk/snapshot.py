@@ -0,0 +1,111 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - Snapshot
+
+Last known daemon configuration, folder summaries and last-seen times,
+stored between runs so UI can be drawn before daemon responds.
+Snapshot is by default in ~/.config/syncthing-gtk/snapshot.json
+"""
+
+from __future__ import unicode_literals
+from syncthing_gtk.tools import get_config_dir, IS_WINDOWS
+import os, json, tempfile, logging
+log = logging.getLogger("Snapshot")
+
+# Only those keys are stored, everything else is left to daemon
+DEVICE_KEYS = ("deviceID", "name", "compression", "introducer")
+FOLDER_KEYS = ("id", "label", "path", "type", "ignorePerms",
+	"rescanIntervalS", "fsWatcherEnabled")
+SUMMARY_KEYS = ("globalFiles", "globalSymlinks", "globalBytes",
+	"localFiles", "localSymlinks", "localBytes", "needFiles",
+	"needSymlinks", "needBytes", "inSyncBytes", "receiveOnlyTotalItems",
+	"receiveOnlyChangedBytes", "state")
+
+class Snapshot(object):
+	def __init__(self, filename=None):
+		self.filename = filename or os.path.join(get_config_dir(), "syncthing-gtk", "snapshot.json")
+		self.clear()
+
+	def clear(self):
+		self.address = None
+		self.config = None
+		self.folders = {}
+		self.last_seen = {}
+
+	def load(self, address):
+		"""
+		Loads snapshot from file. Returns True on success, False if there
+		is no snapshot or if it was taken from daemon on different address.
+		"""
+		self.clear()
+		try:
+			with open(self.filename, "r") as f:
+				data = json.loads(f.read())
+			if data["address"] != address:
+				return False
+			self.address = data["address"]
+			self.config = data["config"]
+			self.folders = data["folders"]
+			self.last_seen = data["last_seen"]
+		except (IOError, OSError):
+			# No snapshot
+			return False
+		except Exception as e:
+			log.warning("Failed to load snapshot: %s", e)
+			self.clear()
+			return False
+		return True
+
+	def save(self):
+		""" Saves snapshot, replacing file only after it's completely written """
+		if self.config is None:
+			return
+		tmpfile = None
+		try:
+			fd, tmpfile = tempfile.mkstemp(prefix="snapshot.", suffix=".tmp",
+				dir=os.path.dirname(self.filename))
+			with os.fdopen(fd, "w") as f:
+				f.write(json.dumps({
+					"address" : self.address,
+					"config" : self.config,
+					"folders" : self.folders,
+					"last_seen" : self.last_seen,
+				}))
+			if IS_WINDOWS and os.path.exists(self.filename):
+				# os.rename can't replace file on Windows
+				os.unlink(self.filename)
+			os.rename(tmpfile, self.filename)
+		except Exception as e:
+			log.warning("Failed to save snapshot: %s", e)
+			if tmpfile is not None and os.path.exists(tmpfile):
+				try:
+					os.unlink(tmpfile)
+				except OSError:
+					pass
+
+	def set_config(self, address, config):
+		""" Stores devices and folders from daemon configuration """
+		self.address = address
+		self.config = {
+			"devices" : [ pick(n, DEVICE_KEYS) for n in config["devices"] ],
+			"folders" : [ dict(pick(r, FOLDER_KEYS),
+							devices=[ { "deviceID" : n["deviceID"] } for n in r["devices"] ])
+						for r in config["folders"] ],
+		}
+		# Forget about removed folders and devices
+		folder_ids = set([ r["id"] for r in self.config["folders"] ])
+		device_ids = set([ n["deviceID"] for n in self.config["devices"] ])
+		self.folders = { rid : self.folders[rid] for rid in self.folders if rid in folder_ids }
+		self.last_seen = { nid : self.last_seen[nid] for nid in self.last_seen if nid in device_ids }
+
+	def set_folder_data(self, folder_id, data):
+		""" Stores folder summary (db/status response) """
+		self.folders[folder_id] = pick(data, SUMMARY_KEYS)
+
+	def set_last_seen(self, device_id, last_seen):
+		""" Stores last-seen time, as string received from daemon """
+		self.last_seen[device_id] = last_seen
+
+def pick(d, keys):
+	""" Returns copy of dict with only specified keys """
+	return { k : d[k] for k in keys if k in d }
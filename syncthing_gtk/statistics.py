@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+"""
+Syncthing-GTK - Statistics
+
+Counters and latency histograms collected for REST requests sent to
+daemon and for events received from it. Used to find out whether slow
+UI is caused by daemon, by connection to it or by signal handlers.
+"""
+
+from __future__ import unicode_literals
+from syncthing_gtk.tools import sizeof_fmt
+import bisect, time
+
+# Upper bounds of histogram buckets, in seconds. Last, unbounded bucket
+# is added for everything above.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2,
+	0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram(object):
+	""" Latency histogram with fixed buckets """
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [ 0 ] * (len(buckets) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.count += 1
+		self.total += value
+		self.max = max(self.max, value)
+
+	def percentile(self, p):
+		"""
+		Returns upper bound of bucket containing p-th percentile, or
+		maximum measured value if that's lower.
+		"""
+		if self.count == 0:
+			return 0.0
+		limit = self.count * p / 100.0
+		seen = 0
+		for i in range(len(self.counts)):
+			seen += self.counts[i]
+			if seen >= limit:
+				if i < len(self.buckets):
+					return min(self.buckets[i], self.max)
+				break
+		return self.max
+
+	def to_dict(self):
+		return {
+			"count" : self.count, "total" : self.total, "max" : self.max,
+			"buckets" : list(self.buckets), "counts" : list(self.counts),
+		}
+
+	def __str__(self):
+		return "%7s %7s %7s" % (
+			fmt_time(self.percentile(50)),
+			fmt_time(self.percentile(95)),
+			fmt_time(self.max))
+
+
+class EndpointStats(object):
+	""" Statistics for one REST endpoint """
+	def __init__(self):
+		self.requests = 0
+		self.errors = 0
+		self.joined = 0
+		self.received = 0
+		self.sent = 0
+		self.queued = Histogram()		# Time spent waiting for connection
+		self.response = Histogram()		# Time between sending request and receiving whole response
+		self.handler = Histogram()		# Time spent in callbacks
+
+	def to_dict(self):
+		return {
+			"requests" : self.requests, "errors" : self.errors,
+			"joined" : self.joined, "received" : self.received,
+			"sent" : self.sent, "queued" : self.queued.to_dict(),
+			"response" : self.response.to_dict(),
+			"handler" : self.handler.to_dict(),
+		}
+
+
+class Statistics(object):
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		self.since = time.time()
+		self.endpoints = {}
+		self.events = {}
+		self.gauges = {}
+
+	def _endpoint(self, command):
+		""" Returns EndpointStats for command, ignoring query string """
+		name = command.split("?", 1)[0]
+		if not name in self.endpoints:
+			self.endpoints[name] = EndpointStats()
+		return self.endpoints[name]
+
+	def request_finished(self, command, queued, response, handler, received, sent, joined=0):
+		""" Called after response is received and all callbacks are called """
+		e = self._endpoint(command)
+		e.requests += 1
+		e.joined += joined
+		e.received += received
+		e.sent += sent
+		e.queued.add(queued)
+		e.response.add(response)
+		e.handler.add(handler)
+
+	def request_failed(self, command):
+		self._endpoint(command).errors += 1
+
+	def event_handled(self, event_type, duration):
+		if not event_type in self.events:
+			self.events[event_type] = Histogram()
+		self.events[event_type].add(duration)
+
+	def set_gauges(self, **gauges):
+		""" Stores current values, such as number of requests in flight """
+		self.gauges.update(gauges)
+
+	def to_dict(self):
+		return {
+			"since" : self.since,
+			"gauges" : dict(self.gauges),
+			"endpoints" : { k : self.endpoints[k].to_dict() for k in self.endpoints },
+			"events" : { k : self.events[k].to_dict() for k in self.events },
+		}
+
+	def get_lines(self):
+		""" Returns statistics formatted as list of text lines """
+		lines = [
+			"Collected for %s" % (fmt_time(time.time() - self.since),),
+			"",
+		]
+		for k in sorted(self.gauges):
+			lines.append("%-30s %s" % (k, self.gauges[k]))
+		lines += [ "", "%-30s %6s %4s %4s %10s %10s   %-23s   %-23s   %-23s" % (
+			"Endpoint", "count", "err", "join", "received", "sent",
+			"queued p50/p95/max", "response p50/p95/max", "handler p50/p95/max") ]
+		for k in sorted(self.endpoints):
+			e = self.endpoints[k]
+			lines.append("%-30s %6s %4s %4s %10s %10s   %s   %s   %s" % (
+				k, e.requests, e.errors, e.joined,
+				sizeof_fmt(e.received), sizeof_fmt(e.sent),
+				e.queued, e.response, e.handler))
+		lines += [ "", "%-30s %6s   %-23s" % ("Event", "count", "handler p50/p95/max") ]
+		for k in sorted(self.events):
+			lines.append("%-30s %6s   %s" % (k, self.events[k].count, self.events[k]))
+		return lines
+
+	def __str__(self):
+		return "\n".join(self.get_lines())
+
+
+def fmt_time(seconds):
+	""" Formats duration in most readable units """
+	if seconds < 1.0:
+		return "%.1fms" % (seconds * 1000.0,)
+	if seconds < 120.0:
+		return "%.2fs" % (seconds,)
+	return "%.0fm" % (seconds / 60.0,)
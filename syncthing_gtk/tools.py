@@ -7,7 +7,7 @@ Various stuff that I don't care to fit anywhere else.
 
 from __future__ import unicode_literals
 from base64 import b32decode
-from datetime import tzinfo, timedelta
+from datetime import datetime, tzinfo, timedelta
 from subprocess import Popen
 from dateutil import parser
 import re, os, sys, random, string, platform, logging, shlex, gettext, __main__
@@ -138,10 +138,10 @@ def get_header(headers, key):
 
 class Timezone(tzinfo):
 	def __init__(self, hours, minutes):
-		if hours >= 0:
-			self.name = "+%s:%s" % (hours, minutes)
+		if hours >= 0 and minutes >= 0:
+			self.name = str("+%02d:%02d" % (hours, minutes))
 		else:
-			self.name = "+%s:%s" % (hours, minutes)
+			self.name = str("-%02d:%02d" % (-hours, -minutes))
 		self.delta = timedelta(minutes=minutes, hours=hours)
 	
 	def __str__(self):
@@ -156,10 +156,37 @@ class Timezone(tzinfo):
 	def dst(self, dt):
 		return timedelta(0)
 
+# Format used by daemon; RFC3339 with up to nanosecond precision
+RE_RFC3339 = re.compile(
+	r"^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)$")
+# Timezone objects for already seen UTC offsets
+_timezones = {}
+
 def parsetime(m):
-	""" Parses time received from Syncthing daemon """
+	"""
+	Parses time received from Syncthing daemon. Format used by daemon is
+	parsed directly, dateutil is used for anything else.
+	"""
+	match = RE_RFC3339.match(m)
+	if match is None:
+		try:
+			return parser.parse(m)
+		except ValueError:
+			raise ValueError("Failed to parse '%s' as time" % m)
+	year, month, day, hour, minute, second, fraction, offset = match.groups()
+	if not offset in _timezones:
+		if offset == "Z":
+			_timezones[offset] = Timezone(0, 0)
+		else:
+			sign = -1 if offset[0] == "-" else 1
+			_timezones[offset] = Timezone(sign * int(offset[1:3]), sign * int(offset[4:6]))
+	# datetime can store only microseconds, rest is thrown away
+	microsecond = 0
+	if fraction:
+		microsecond = int(fraction[0:6]) * 10 ** (6 - len(fraction[0:6]))
 	try:
-		return parser.parse(m)
+		return datetime(int(year), int(month), int(day), int(hour),
+			int(minute), int(second), microsecond, _timezones[offset])
 	except ValueError:
 		raise ValueError("Failed to parse '%s' as time" % m)
 
@@ -390,6 +417,19 @@ def get_config_dir():
 			confdir = os.path.expanduser("~/.config")
 	return confdir
 
+def get_cache_dir():
+	"""
+	Returns ~/.cache or whatever has user set as cache directory.
+	In portable mode, cache is kept next to configuration.
+	"""
+	if is_portable():
+		return os.path.join(os.environ["XDG_CONFIG_HOME"], "cache")
+	from gi.repository import GLib
+	cachedir = GLib.get_user_cache_dir()
+	if cachedir is None:
+		cachedir = os.path.join(get_config_dir(), "cache")
+	return cachedir
+
 get_install_path = None
 if IS_WINDOWS:
 	def _get_install_path():
@@ -10,17 +10,23 @@ Usage:
 	- Enable conditions (enable_condition call)
 	- Call add_from_file or add_from_string method
 	- Continue as usual
+
+Processed XML is cached in ~/.cache/syncthing-gtk/ui, so glade file
+is parsed only when it, conditions, icon paths or locale changes.
 """
 
 from __future__ import unicode_literals
 from gi.repository import Gtk
 from xml.dom import minidom
 from .tools import GETTEXT_DOMAIN, IS_WINDOWS
-from syncthing_gtk.tools import get_locale_dir
+from syncthing_gtk.tools import get_locale_dir, get_cache_dir
 from syncthing_gtk.tools import _ # gettext function
-import logging
+import os, gettext, hashlib, logging
 log = logging.getLogger("UIBuilder")
 
+# Increase when anything in _build changes, so old cache is not used
+CACHE_VERSION = 1
+
 class UIBuilder(Gtk.Builder):
 	def __init__(self):
 		Gtk.Builder.__init__(self)
@@ -37,8 +43,72 @@ class UIBuilder(Gtk.Builder):
 			# Gtk.Builder directly
 			Gtk.Builder.add_from_file(self, filename)
 		else:
+			cache_file = self._get_cache_file(filename)
+			if cache_file is not None:
+				try:
+					with open(cache_file, "rb") as f:
+						data = f.read()
+					log.debug("Using cached %s", cache_file)
+					Gtk.Builder.add_from_string(self, data)
+					return
+				except IOError:
+					# Not cached yet
+					pass
 			with open(filename, "r") as f:
 				self.add_from_string(f.read())
+			if cache_file is not None:
+				self._save_cache_file(cache_file, filename)
+	
+	def _get_cache_file(self, filename):
+		"""
+		Returns path to cache file for glade file and current conditions,
+		icon paths and locale, or None if file can't be cached.
+		"""
+		try:
+			filename = os.path.abspath(filename)
+			st = os.stat(filename)
+		except OSError:
+			return None
+		# Translations depend on language chosen by gettext and on
+		# file it loads them from
+		mo_file = gettext.find(GETTEXT_DOMAIN, get_locale_dir())
+		mo_mtime = os.stat(mo_file).st_mtime if mo_file else None
+		key = repr((CACHE_VERSION, filename, st.st_mtime, st.st_size,
+			sorted(self.conditions), self.icon_paths, IS_WINDOWS,
+			get_locale_dir(), mo_file, mo_mtime,
+			[ os.environ.get(x) for x in ("LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG") ]
+		))
+		return os.path.join(get_cache_dir(), "syncthing-gtk", "ui", "%s-%s-%s" % (
+			os.path.basename(filename),
+			hashlib.sha1(filename.encode("utf-8")).hexdigest()[0:8],
+			hashlib.sha1(key.encode("utf-8")).hexdigest()
+		))
+	
+	def _save_cache_file(self, cache_file, filename):
+		"""
+		Saves processed XML, replacing file only after it's completely
+		written. Cache files made from older version of same glade file
+		are removed.
+		"""
+		try:
+			cache_dir = os.path.dirname(cache_file)
+			if not os.path.exists(cache_dir):
+				os.makedirs(cache_dir)
+			tmpfile = "%s.tmp" % (cache_file,)
+			with open(tmpfile, "wb") as f:
+				f.write(self.xml.toxml("utf-8"))
+			if os.path.exists(cache_file):
+				# os.rename can't replace file on Windows
+				os.unlink(cache_file)
+			os.rename(tmpfile, cache_file)
+			prefix = os.path.basename(cache_file).rsplit("-", 1)[0] + "-"
+			mtime = os.stat(filename).st_mtime
+			for x in os.listdir(cache_dir):
+				path = os.path.join(cache_dir, x)
+				if x.startswith(prefix) and os.stat(path).st_mtime < mtime:
+					os.unlink(path)
+		except Exception as e:
+			log.warning("Failed to save UI cache: %s", e)
 
 	def add_from_string(self, string):
 		""" Builds UI from string """